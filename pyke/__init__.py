@@ -18,6 +18,7 @@ from .kepdiffim import *
 from .kepdraw import *
 from .kepdynamic import *
 from .kepextract import *
+from .kepffistamps import *
 from .kepfilter import *
 from .kepfit import *
 from .kepflatten import *
@@ -48,6 +49,8 @@ from .keptrial import *
 from .keptrim import *
 from .kepwindow import *
 from .prf import *
+from .cbv import *
+from .catalog import *
 from .lightcurve import *
 from .targetpixelfile import *
 from .utils import *
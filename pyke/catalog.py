@@ -0,0 +1,245 @@
+import os
+import numpy as np
+from scipy.spatial import cKDTree
+from astropy.io import fits as pyfits
+
+__all__ = ['KeplerTargetCatalog']
+
+
+class KeplerTargetCatalog(object):
+    """
+    Local extract of the Kepler Input Catalog (KIC) or of the K2 Ecliptic
+    Plane Input Catalog (EPIC).
+
+    The catalog is read from a FITS binary table or from a comma-separated
+    file with a header line. It must have an ID column (``KEPID``,
+    ``EPICID`` or ``ID``) and may have any other column, e.g. ``RA``,
+    ``DEC``, ``KEPMAG`` and ``SKYGROUP``. Detector positions are given by
+    ``CHANNEL``, ``MODULE``, ``OUTPUT``, ``ROW`` and ``COLUMN``, or, for the
+    Kepler field, by one such set of columns per season, suffixed by the
+    season number (e.g. ``ROW_2``). Column names are case-insensitive.
+
+    The IDs are kept sorted, so that looking up one or many targets takes a
+    binary search and no network access. Positional queries go through a
+    KD-tree of the unit vectors of the targets, which is built the first
+    time it is needed.
+
+    Attributes
+    ----------
+    filename : str
+        Path of the catalog file. Defaults to ``~/.pyke/catalog.fits``.
+    columns : dict
+        Maps the upper-case column names onto the columns of the catalog.
+
+    Examples
+    --------
+    >>> from pyke import KeplerTargetCatalog
+    >>> cat = KeplerTargetCatalog.load('kic-extract.csv') # doctest: +SKIP
+    >>> channel, column, row = cat.position(5110407, season=2) # doctest: +SKIP
+    >>> rows = cat.cone_search(291.04, 44.71, 30.) # doctest: +SKIP
+    """
+
+    ID_COLUMNS = ('KEPID', 'EPICID', 'ID')
+    POSITION_COLUMNS = ('CHANNEL', 'MODULE', 'OUTPUT', 'ROW', 'COLUMN')
+    DEFAULT_FILENAME = os.path.join(os.path.expanduser('~'), '.pyke',
+                                    'catalog.fits')
+    _loaded = {}
+
+    def __init__(self, filename=None):
+        if filename is None:
+            filename = self.DEFAULT_FILENAME
+        if not os.path.isfile(filename):
+            raise IOError("Target catalog {} does not exist.".format(filename))
+        self.filename = filename
+        self.columns = self._read(filename)
+        for idcol in self.ID_COLUMNS:
+            if idcol in self.columns:
+                break
+        else:
+            raise ValueError("{} has none of the ID columns {}."
+                             .format(filename, ', '.join(self.ID_COLUMNS)))
+        self.ids = self.columns[idcol].astype('int64')
+        self._order = np.argsort(self.ids, kind='mergesort')
+        self._sorted_ids = self.ids[self._order]
+        self._tree = None
+
+    @classmethod
+    def load(cls, filename=None):
+        """Returns the catalog read from ``filename``. Catalogs are only read
+        once per session, unless the file changes."""
+        if filename is None:
+            filename = cls.DEFAULT_FILENAME
+        if not os.path.isfile(filename):
+            raise IOError("Target catalog {} does not exist.".format(filename))
+        key = (os.path.abspath(filename), os.path.getmtime(filename))
+        if key not in cls._loaded:
+            cls._loaded[key] = cls(filename)
+        return cls._loaded[key]
+
+    def __len__(self):
+        return len(self.ids)
+
+    def index(self, ids):
+        """
+        Returns the row numbers of one or many targets.
+
+        Raises
+        ------
+        KeyError
+            If any of the IDs is not in the catalog.
+        """
+        ids = np.asarray(ids, dtype='int64')
+        pos, found = self._search(ids)
+        if not np.all(found):
+            raise KeyError("Targets {} are not in {}."
+                           .format(np.atleast_1d(ids[~found]).tolist(),
+                                   self.filename))
+        return self._order[pos]
+
+    def contains(self, ids):
+        """Returns whether each of one or many targets is in the catalog."""
+        return self._search(np.asarray(ids, dtype='int64'))[1]
+
+    def entry(self, i, season=None):
+        """
+        Returns a dictionary with the i-th entry of the catalog. If season
+        is given, the per-season position columns of that season are also
+        given under their names without suffix, e.g. ``ROW``.
+        """
+        entry = dict((name, col[i]) for name, col in self.columns.items())
+        if season is not None:
+            for name in self.POSITION_COLUMNS:
+                key = '{}_{}'.format(name, season)
+                if key in self.columns:
+                    entry[name] = self.columns[key][i]
+        return entry
+
+    def lookup(self, kepid, season=None):
+        """Returns a dictionary with the catalog entry of a target."""
+        return self.entry(self.index(int(kepid)), season)
+
+    def position(self, kepid, season=None):
+        """
+        Returns the detector position of one or many targets.
+
+        Parameters
+        ----------
+        kepid : int or array-like
+            Target ID(s).
+        season : None or int
+            Kepler season (0-3). It selects the set of per-season position
+            columns, if the catalog has them.
+
+        Returns
+        -------
+        channel, column, row : int or ndarray
+        """
+        return self.detector(self.index(kepid), season)
+
+    def detector(self, i, season=None):
+        """Returns the channel, column and row of the target(s) in the i-th
+        row(s) of the catalog."""
+        return tuple(self._season_column(name, season)[i]
+                     for name in ('CHANNEL', 'COLUMN', 'ROW'))
+
+    @property
+    def tree(self):
+        """KD-tree of the unit vectors of the targets."""
+        if self._tree is None:
+            if 'RA' not in self.columns or 'DEC' not in self.columns:
+                raise KeyError("{} has no RA and DEC columns."
+                               .format(self.filename))
+            self._tree = cKDTree(_unitvector(self.columns['RA'],
+                                             self.columns['DEC']))
+        return self._tree
+
+    def cone_search(self, ra, dec, radius):
+        """
+        Returns the row numbers of the targets within a circle, sorted by
+        distance from its center.
+
+        Parameters
+        ----------
+        ra, dec : float
+            Center of the circle, in degrees.
+        radius : float
+            Radius of the circle, in arcseconds.
+        """
+        center = _unitvector(ra, dec)
+        rows = np.array(self.tree.query_ball_point(center, _chord(radius)),
+                        dtype='int64')
+        distance = np.sum((self.tree.data[rows] - center) ** 2, axis=-1)
+        return rows[np.argsort(distance, kind='mergesort')]
+
+    def nearest(self, ra, dec, radius=np.inf):
+        """
+        Returns the nearest target to one or many positions.
+
+        Parameters
+        ----------
+        ra, dec : float or array-like
+            Positions, in degrees.
+        radius : float
+            Maximum separation, in arcseconds.
+
+        Returns
+        -------
+        rows : int or ndarray
+            Row numbers of the nearest targets, or -1 where no target lies
+            within radius.
+        separation : float or ndarray
+            Separations, in arcseconds, or inf where no target lies within
+            radius.
+        """
+        distance, rows = self.tree.query(_unitvector(ra, dec),
+                                         distance_upper_bound=_chord(radius))
+        found = np.isfinite(distance)
+        rows = np.where(found, rows, -1)
+        separation = np.where(found, 2. * np.degrees(
+                     np.arcsin(np.minimum(distance, 2.) / 2.)) * 3600., np.inf)
+        return rows, separation
+
+    def _search(self, ids):
+        """Returns the positions of the IDs in the sorted IDs, and whether
+        they were found there."""
+        pos = np.searchsorted(self._sorted_ids, ids)
+        pos = np.minimum(pos, len(self._sorted_ids) - 1)
+        return pos, self._sorted_ids[pos] == ids
+
+    def _season_column(self, name, season):
+        if season is not None and '{}_{}'.format(name, season) in self.columns:
+            name = '{}_{}'.format(name, season)
+        if name not in self.columns:
+            raise KeyError("{} has no {} column.".format(self.filename, name))
+        return self.columns[name]
+
+    @staticmethod
+    def _read(filename):
+        """Reads the columns of a FITS or comma-separated catalog into
+        native-endian arrays."""
+        if filename.endswith('.fits') or filename.endswith('.fits.gz'):
+            table = pyfits.getdata(filename, 1)
+            names = table.columns.names
+            data = [np.array(table.field(name)) for name in names]
+            data = [col.astype(col.dtype.newbyteorder('=')) for col in data]
+        else:
+            table = np.atleast_1d(np.genfromtxt(filename, delimiter=',',
+                                                names=True, dtype=None))
+            names = table.dtype.names
+            data = [table[name] for name in names]
+        return dict((name.upper(), col) for name, col in zip(names, data))
+
+
+def _unitvector(ra, dec):
+    """Cartesian unit vectors of positions given in degrees."""
+    ra = np.radians(np.asarray(ra, dtype='float64'))
+    dec = np.radians(np.asarray(dec, dtype='float64'))
+    return np.stack([np.cos(dec) * np.cos(ra), np.cos(dec) * np.sin(ra),
+                     np.sin(dec)], axis=-1)
+
+def _chord(radius):
+    """Length of the chord between unit vectors separated by radius
+    arcseconds."""
+    if not np.isfinite(radius):
+        return np.inf
+    return 2. * np.sin(np.radians(min(radius / 3600., 180.)) / 2.)
@@ -0,0 +1,217 @@
+import os
+import re
+import json
+import shutil
+from collections import OrderedDict
+import numpy as np
+import requests
+from bs4 import BeautifulSoup
+from astropy.io import fits as pyfits
+from astropy.utils.data import download_file
+
+__all__ = ['KeplerCBVStore']
+
+
+class KeplerCBVStore(object):
+    """
+    Local repository of Kepler/K2 cotrending basis vector (CBV) files.
+
+    CBV files are kept in a local directory together with an index, stored
+    in the same directory, which maps (mission, quarter or campaign, cadence
+    type) onto a file name. Once a file is in the directory, no network
+    access is needed to use it. The CBV tables of the module/outputs which
+    were most recently requested are kept in a bounded in-memory cache,
+    so that cotrending many targets opens and parses each CBV file only once.
+
+    MAST only publishes CBVs computed on long cadence data. Requests for
+    short cadence CBVs therefore return the long cadence file, whose basis
+    vectors have to be interpolated onto the short cadence grid, as done
+    by ``kepcotrend``.
+
+    Attributes
+    ----------
+    directory : str
+        Path of the directory in which the CBV files are stored.
+        Defaults to ``~/.pyke/cbv``.
+    cache_size : int
+        Maximum number of module/output tables kept in memory.
+    offline : bool
+        If True, files which are not in the local directory are never
+        downloaded from MAST and an IOError is raised instead.
+
+    Examples
+    --------
+    >>> from pyke import KeplerCBVStore
+    >>> store = KeplerCBVStore('cbv', offline=True) # doctest: +SKIP
+    >>> store.add('kplr2011073133259-q08-d25_lcbv.fits') # doctest: +SKIP
+    >>> cbvs = store.get_cbvs('Kepler', 8, module=16, output=4) # doctest: +SKIP
+    >>> cbvs['VECTOR_1'] # doctest: +SKIP
+    """
+
+    INDEX_FILENAME = 'cbv-index.json'
+    BASE_URLS = {'Kepler': "http://archive.stsci.edu/missions/kepler/cbv/",
+                 'K2': "http://archive.stsci.edu/missions/k2/cbv/"}
+
+    def __init__(self, directory=None, cache_size=16, offline=False):
+        if directory is None:
+            directory = os.path.join(os.path.expanduser('~'), '.pyke', 'cbv')
+        self.directory = directory
+        self.cache_size = cache_size
+        self.offline = offline
+        self._tables = OrderedDict()
+        self._listings = {}
+        self._index = None
+
+    @property
+    def index(self):
+        """Dictionary which maps 'mission/period/cadence' keys onto the
+        names of the CBV files in ``directory``."""
+        if self._index is None:
+            path = os.path.join(self.directory, self.INDEX_FILENAME)
+            if os.path.isfile(path):
+                with open(path) as f:
+                    self._index = json.load(f)
+            else:
+                self.build_index()
+        return self._index
+
+    def build_index(self):
+        """Scans ``directory`` for CBV files and rewrites the index."""
+        self._index = {}
+        if os.path.isdir(self.directory):
+            for filename in sorted(os.listdir(self.directory)):
+                if filename.endswith('.fits') or filename.endswith('.fits.gz'):
+                    desc = self._describe(os.path.join(self.directory, filename))
+                    # skips files which are not CBV files
+                    if desc is not None:
+                        self._index[self._key(*desc)] = filename
+        self._write_index()
+        return self._index
+
+    def add(self, path):
+        """
+        Copies (or downloads, if ``path`` is an url) a CBV file into
+        ``directory`` and adds it to the index.
+
+        Returns
+        -------
+        filename : str
+            Path of the file in the local directory.
+        """
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        filename = os.path.join(self.directory, os.path.basename(path))
+        if path.startswith('http'):
+            path = download_file(path, cache=True)
+        # checks the source, named as in the store, before copying it so that
+        # a bad file never replaces a CBV file in ``directory``
+        desc = self._describe(path, os.path.basename(filename))
+        if desc is None:
+            raise ValueError("{} is not a CBV file.".format(path))
+        if os.path.abspath(path) != os.path.abspath(filename):
+            shutil.copy(path, filename)
+        self.index[self._key(*desc)] = os.path.basename(filename)
+        self._write_index()
+        return filename
+
+    def get_filename(self, mission, period, cadence='long'):
+        """
+        Returns the path of the CBV file for a given mission, quarter (Kepler)
+        or campaign (K2), and cadence type ('long' or 'short'). If the file is
+        not in the index, ``directory`` is scanned again, in case the file was
+        copied there since the index was written. If it is still missing and
+        ``offline`` is False, it is downloaded from MAST and added to the store.
+        """
+        key = self._key(mission, period, cadence)
+        if key not in self.index:
+            self.build_index()
+        if key not in self.index:
+            if self.offline:
+                raise IOError("No CBV file for {} in {}.".format(key, self.directory))
+            self.add(self.get_url(mission, period, cadence))
+        return os.path.join(self.directory, self.index[key])
+
+    def get_cbvs(self, mission, period, module, output, cadence='long'):
+        """
+        Returns the table of cotrending basis vectors of a module/output.
+
+        Returns
+        -------
+        cbvs : numpy structured array
+            Table in which the field 'VECTOR_i' holds the i-th basis vector.
+            The table is shared through the cache and must not be modified.
+        """
+        key = (self._key(mission, period, cadence), module, output)
+        if key in self._tables:
+            self._tables[key] = self._tables.pop(key)
+            return self._tables[key]
+        with pyfits.open(self.get_filename(mission, period, cadence)) as cbv_file:
+            table = np.array(cbv_file['MODOUT_{0}_{1}'.format(module, output)].data)
+        self._tables[key] = table
+        while len(self._tables) > self.cache_size:
+            self._tables.popitem(last=False)
+        return table
+
+    def get_url(self, mission, period, cadence='long'):
+        """Returns the url of the CBV file at MAST. The directory listing of
+        each mission is only requested once."""
+        base_url = self.BASE_URLS[mission]
+        if base_url not in self._listings:
+            # gets the html page and finds all references to 'a' tag
+            # keeps the ones for which 'href' ends with 'fits'
+            soup = BeautifulSoup(requests.get(base_url).text, 'html.parser')
+            self._listings[base_url] = [fn['href'] for fn in soup.find_all('a')
+                                        if fn['href'].endswith('fits')]
+        if mission == 'Kepler':
+            pattern = 'q{:02d}-d25'.format(int(period))
+        else:
+            pattern = 'c{:02d}'.format(int(period))
+        cbv_files = [fn for fn in self._listings[base_url] if pattern in fn]
+        if len(cbv_files) == 0:
+            raise IOError("No CBV file for {} at {}.".format(
+                          self._key(mission, period, cadence), base_url))
+        return base_url + cbv_files[0]
+
+    def clear_cache(self):
+        """Empties the in-memory cache of module/output tables."""
+        self._tables.clear()
+
+    def _write_index(self):
+        if os.path.isdir(self.directory):
+            with open(os.path.join(self.directory, self.INDEX_FILENAME), 'w') as f:
+                json.dump(self._index, f, indent=0, sort_keys=True)
+
+    @staticmethod
+    def _key(mission, period, cadence='long'):
+        # there are only long cadence CBV files, see the class docstring
+        return '{}/{}/long'.format(mission, int(period))
+
+    @staticmethod
+    def _describe(path, filename=None):
+        """Returns the (mission, period, cadence) of a CBV file, read from
+        its primary header or, if missing, from its file name (``filename``,
+        or the base name of ``path``). Returns None if ``path`` is not a CBV
+        file."""
+        try:
+            with pyfits.open(path) as hdus:
+                header = hdus[0].header
+                is_cbv = any(hdu.name.startswith('MODOUT_') for hdu in hdus[1:])
+        except (IOError, OSError):
+            return None
+        if not is_cbv:
+            return None
+        if filename is None:
+            filename = os.path.basename(path)
+        if 'CAMPAIGN' in header or filename.startswith('ktwo'):
+            mission = 'K2'
+            period = header.get('CAMPAIGN')
+            match = re.search(r'c(\d+)', filename)
+        else:
+            mission = 'Kepler'
+            period = header.get('QUARTER')
+            match = re.search(r'q(\d+)', filename)
+        if period is None:
+            if match is None:
+                return None
+            period = int(match.group(1))
+        return mission, period, 'long'
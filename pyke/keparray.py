@@ -68,7 +68,7 @@ def rebin2D(a, newdims, method='linear', centre=False, minusone=False):
             dimlist.append((old[i] - m1) / (newdims[i] - m1)
                            * (base + ofs) - ofs)
         # specify old dims
-        olddims = [np.arange(i, dtype = n.float) for i in list(a.shape)]
+        olddims = [np.arange(i, dtype=float) for i in list(a.shape)]
         # first interpolation - for ndims = any
         mint = scipy.interpolate.interp1d(olddims[-1], a, kind=method)
         newa = mint(dimlist[-1])
@@ -85,16 +85,16 @@ def rebin2D(a, newdims, method='linear', centre=False, minusone=False):
         return newa
     elif method in ['spline']:
         oslices = [slice(0, j) for j in old]
-        oldcoords = n.ogrid[oslices]
+        oldcoords = np.ogrid[oslices]
         nslices = [slice(0, j) for j in list(newdims)]
-        newcoords = n.mgrid[nslices]
-        newcoords_dims = list(range(n.rank(newcoords)))
+        newcoords = np.mgrid[nslices]
+        newcoords_dims = list(range(np.ndim(newcoords)))
         #make first index last
         newcoords_dims.append(newcoords_dims.pop(0))
         newcoords_tr = newcoords.transpose(newcoords_dims)
         # makes a view that affects newcoords
         newcoords_tr += ofs
-        deltas = (n.asarray(old) - m1) / (newdims - m1)
+        deltas = (np.asarray(old) - m1) / (newdims - m1)
         newcoords_tr *= deltas
         newcoords_tr -= ofs
         newa = scipy.ndimage.map_coordinates(a, newcoords)
@@ -95,7 +95,7 @@ def kepclean(infile, outfile=None, zero=True, overwrite=False, verbose=False,
         kepmsg.log(logfile, 'KEPCLEAN - Found flux keys {}'.format(hnames[flux_keys]), verbose)
         #Loop through and remove indicies where any 'FLUX' keys have NaNs
         length = len(instr[ext].data[hnames[flux_keys][0]])
-        fin = set(list(np.arange(length)))
+        fin = np.ones(length, dtype=bool)
 
         for y in hnames[flux_keys]:
             ydat = instr[ext].data[y]
@@ -104,19 +104,18 @@ def kepclean(infile, outfile=None, zero=True, overwrite=False, verbose=False,
                     bad = np.all(~np.isfinite(ydat),axis=-1)
                     ydat = np.nansum(ydat, axis=-1)
                     ydat[bad] = np.nan
-            bad = set(list(np.where(~np.isfinite(ydat))[0]))
-            if len(np.asarray(list(fin - bad))) == 0:
+            good = fin & np.isfinite(ydat)
+            if not good.any():
                 kepmsg.log(logfile, 'WARNING - All {} values are nan. Cannot clean {}.'.format(y, y),
                     verbose)
                 continue
-            fin -= bad
-        fin = np.asarray(list(fin))
+            fin = good
 
-        if len(fin) == 0:
+        if not fin.any():
             kepmsg.log(logfile, 'WARNING - All values are nan. Cannot clean.', verbose)
             continue
 
-        kepmsg.log(logfile, 'KEPCLEAN - Removed {} nan entries out of {}'.format(length - len(fin), length), verbose)
+        kepmsg.log(logfile, 'KEPCLEAN - Removed {} nan entries out of {}'.format(length - fin.sum(), length), verbose)
 
         #Replace the extention
         if zero:
@@ -125,10 +124,9 @@ def kepclean(infile, outfile=None, zero=True, overwrite=False, verbose=False,
                 y[np.isfinite(y) == False] = 0
                 instr[ext].data[d] = y
 
-        instr[ext].data = instr[ext].data[fin]
-        comment = 'NaN cadences removed from data'
-        #Add a cleaned header keyword
-        kepkey.new('NANCLEAN', True, comment, instr[ext], outfile, logfile, verbose)
+        #Keep the finite rows and add a cleaned header keyword
+        kepio.filterrows(instr[ext], fin, outfile, logfile, verbose,
+                         nanclean=True)
     # write output file
     kepmsg.log(logfile, "KEPCLEAN - Writing output file {}...".format(outfile), verbose)
     # history keyword in output file
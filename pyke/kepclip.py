@@ -3,7 +3,6 @@ from . import kepio, kepmsg, kepkey
 import numpy as np
 from astropy.io import fits as pyfits
 from matplotlib import pyplot as plt
-from tqdm import tqdm
 
 
 __all__ = ['kepclip']
@@ -111,30 +110,18 @@ def kepclip(infile, ranges, outfile=None, datacol='SAP_FLUX', plot=False,
         if 'flux' in datacol.lower():
             flux = flux / cadenom
         # filter input data table
-        naxis2 = 0
-        work1 = np.array([], 'float64')
-        work2 = np.array([], 'float32')
-        for i in tqdm(range(len(barytime))):
-            if (np.isfinite(barytime[i]) and np.isfinite(flux[i])
-                and flux[i] != 0.0):
-                reject = True
-                for j in range(len(t1)):
-                    if (barytime[i] >= t1[j] and barytime[i] <= t2[j]):
-                        reject = False
-                if not reject:
-                    table[naxis2] = table[i]
-                    work1 = np.append(work1, barytime[i])
-                    work2 = np.append(work2, flux[i])
-                    naxis2 += 1
+        keep = (np.isfinite(barytime) & np.isfinite(flux) & (flux != 0.0)
+                & kepio.inranges(barytime, t1, t2))
+        work1 = np.array(barytime[keep], 'float64')
+        work2 = np.array(flux[keep], 'float32')
 
         # comment keyword in output file
         kepkey.history(call, instr[0], outfile, logfile, verbose)
         # comment keyword in output file
         kepmsg.log(logfile, "Writing output file {}...".format(outfile), verbose)
         # write output file
-        instr[1].data = table[:naxis2]
-        comment = 'NaN cadences removed from data'
-        kepkey.new('NANCLEAN', True, comment, instr[1], outfile, logfile, verbose)
+        kepio.filterrows(instr[1], keep, outfile, logfile, verbose,
+                         nanclean=True)
         instr.writeto(outfile)
         # clean up x-axis unit
         barytime0 = (tstart // 100) * 100.0
@@ -191,23 +178,13 @@ def kepclip(infile, ranges, outfile=None, datacol='SAP_FLUX', plot=False,
         message = 'KEPCLIP clipping a Target Pixel File'
         kepmsg.clock(message, logfile, verbose)
         # filter input data table
-        naxis2 = 0
-
-        for i in tqdm(range(len(barytime))):
-            if (np.isfinite(barytime[i])):
-                reject = True
-                for j in range(len(t1)):
-                    if (barytime[i] >= t1[j]) and (barytime[i] < t2[j]):
-                        reject = False
-                if not reject:
-                    table[naxis2] = table[i]
-                    naxis2 += 1
+        keep = kepio.inranges(barytime, t1, t2, closed='left')
 
         # comment keyword in output file
         kepkey.history(call, instr[0], outfile, logfile, verbose)
 
         # write output file
-        instr[1].data = table[:naxis2]
+        kepio.filterrows(instr[1], keep, outfile, logfile, verbose)
         comment = 'Trimmed TPF'
         kepkey.new('CLIP_TPF', True, comment, instr[1], outfile, logfile, verbose)
         instr.writeto(outfile)
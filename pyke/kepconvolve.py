@@ -0,0 +1,118 @@
+"""
+This module contains the convolution engine shared by the filtering tasks
+(kepfilter, kepsmooth, kepdiffim and keppixseries).
+"""
+import numpy as np
+from scipy import ndimage
+
+
+__all__ = ['filterkernel', 'convolve']
+
+
+def filterkernel(function, timescale):
+    """
+    Returns the low-pass convolution kernel used by the filtering tasks,
+    normalized to unit sum.
+
+    Parameters
+    ----------
+    function : str
+        Shape of the kernel: 'boxcar', 'gauss' or 'sinc'.
+    timescale : float
+        Width of the kernel in cadences, i.e. the inverse of the cutoff
+        frequency in units of the sampling frequency.
+    """
+    if function == 'boxcar':
+        kernel = np.ones(int(np.ceil(timescale)))
+    elif function == 'gauss':
+        timescale /= 2
+        dx = int(np.ceil(timescale * 10 + 1))
+        x = np.arange(dx, dtype='float64')
+        kernel = np.exp(-(x - (dx / 2 - 1.0)) ** 2 / (2.0 * timescale ** 2))
+    elif function == 'sinc':
+        dx = int(np.ceil(timescale * 12 + 1))
+        x = (np.arange(dx, dtype='float64') - dx / 2 + 0.5) / timescale
+        kernel = np.sinc(x)
+    else:
+        raise ValueError("function must be one of 'boxcar', 'gauss' or "
+                         "'sinc', got {}".format(function))
+    return kernel / np.sum(kernel)
+
+def convolve(data, kernel, method='auto'):
+    """
+    Convolves time series with a kernel, ignoring NaNs.
+
+    Every series along the last axis of ``data`` is convolved in a single
+    batched call, so that a whole ``(npix, ntime)`` pixel matrix is
+    filtered at once. The output is aligned as the output of
+    ``numpy.convolve(series, kernel, 'same')``.
+
+    NaNs (gaps) and the samples beyond both ends of a series are handled
+    with normalized convolution: they are given zero weight and the result
+    is divided by the convolution of the weights with the kernel, so that
+    the output is a weighted average of the finite samples under the
+    kernel. Cadences where the weights vanish, i.e. with no finite sample
+    under the kernel, are set to NaN.
+
+    Parameters
+    ----------
+    data : array-like
+        Time series, with time along the last axis.
+    kernel : array-like
+        One-dimensional convolution kernel.
+    method : str
+        'direct', 'fft' or 'auto'. 'auto' picks the method which is
+        expected to be faster given the length of the series and of the
+        kernel.
+
+    Returns
+    -------
+    convolved : ndarray
+        Array of the same shape as ``data``.
+    """
+    data = np.asarray(data, dtype='float64')
+    kernel = np.asarray(kernel, dtype='float64')
+    shape = data.shape
+    data = data.reshape(-1, shape[-1])
+    if method == 'auto':
+        method = _choose_method(shape[-1], len(kernel))
+    if method == 'direct':
+        conv = _direct_convolve
+    elif method == 'fft':
+        conv = _fft_convolve
+    else:
+        raise ValueError("method must be 'auto', 'direct' or 'fft', "
+                         "got {}".format(method))
+
+    finite = np.isfinite(data)
+    if finite.all():
+        # the weights only vary at the ends, which is the same for all series
+        num = conv(data, kernel)
+        den = conv(np.ones((1, shape[-1])), kernel)
+    else:
+        num = conv(np.where(finite, data, 0.0), kernel)
+        den = conv(finite.astype('float64'), kernel)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        out = np.where(np.abs(den) > 1e-8 * np.abs(kernel).sum(),
+                       num / den, np.nan)
+    return out.reshape(shape)
+
+def _choose_method(n, k):
+    """Returns 'fft' if an FFT convolution of n samples with a kernel of
+    k taps is expected to be faster than direct convolution"""
+    nfft = 2 ** int(np.ceil(np.log2(n + k - 1)))
+    return 'fft' if n * k > 8 * nfft * np.log2(nfft) else 'direct'
+
+def _direct_convolve(data, kernel):
+    # an even kernel is centered like numpy.convolve 'same'
+    origin = 0 if len(kernel) % 2 else -1
+    return ndimage.convolve1d(data, kernel, axis=-1, mode='constant',
+                              cval=0.0, origin=origin)
+
+def _fft_convolve(data, kernel):
+    n, k = data.shape[-1], len(kernel)
+    nfft = 2 ** int(np.ceil(np.log2(n + k - 1)))
+    full = np.fft.irfft(np.fft.rfft(data, nfft, axis=-1)
+                        * np.fft.rfft(kernel, nfft), nfft, axis=-1)
+    start = (k - 1) // 2
+    return full[:, start:start + n]
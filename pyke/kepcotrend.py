@@ -1,5 +1,8 @@
 from .utils import PyKEArgumentHelpFormatter
 from . import kepmsg, kepio, kepkey
+import os
+import glob
+import hashlib
 import math
 import numpy as np
 import matplotlib.pyplot as plt
@@ -45,71 +48,133 @@ def get_pcomp_list_newformat(bvdat, pcomplist, newcad, short, scinterp):
     Finds cotrending basis vectors which have been requested to be
     used by the user and adds them to an array.
     """
-    pcomp = np.zeros((len(pcomplist), len(newcad)))
-    for i in range(len(np.array(pcomplist))):
-        j = int(np.array(pcomplist)[i])
-        dat = bvdat.field('VECTOR_{}'.format(j))[~np.isnan(bvdat.field('CADENCENO'))]
-        bvcadfull = bvdat.field('CADENCENO')[~np.isnan(bvdat.field('CADENCENO'))]
-        #try:
-        if short:
-            #if the data is short cadence the interpolate the basis vectors
-            bv_data = dat[np.in1d(bvdat.field('CADENCENO'), newcad)]
-            bv_cad = bvcadfull[np.in1d(bvdat.field('CADENCENO'), newcad)]
-            #funny things happen why I use interp1d for linear interpolation
-            #so I have opted to use the numpy interp function for linear
-            if scinterp == 'linear':
-                intpl = np.interp(newcad, bv_cad, bv_data, left=bv_data[0],
-                                  right=bv_data[-1])
-                pcomp[i] = intpl
-            else:
-                intpl = interp1d(bv_cad, bv_data, kind=scinterp,
-                                 bounds_error=False, fill_value=None)
-                pcomp[i] = np.where(np.isnan(intpl(newcad)), 0, intpl(newcad))
-                mid_pt = np.floor(np.median(np.arange(len(pcomp[i]))))
-                p_len = len(pcomp[i])
-                lower = [np.logical_and(np.arange(p_len) < mid_pt, pcomp[i] == 0)]
-                upper = [np.logical_and(np.arange(p_len) > mid_pt, pcomp[i] == 0)]
-                pcomp[i][lower] = bv_data[0]
-                pcomp[i][upper] = bv_data[-1]
-        else:
-            pcomp[i] = dat[np.in1d(bvdat.field('CADENCENO'), newcad)]
+    cadenceno = bvdat.field('CADENCENO')
+    in_lc = np.in1d(cadenceno, newcad)
+    pcomp = np.array([bvdat.field('VECTOR_{}'.format(int(j)))[in_lc]
+                      for j in np.atleast_1d(pcomplist)], dtype=float)
+    if short:
+        #if the data is short cadence the interpolate the basis vectors
+        pcomp = interpolate_pcomps(newcad, cadenceno[in_lc], pcomp, scinterp)
     return pcomp
 
+def interpolate_pcomps(newcad, bv_cad, bv_data, scinterp):
+    """
+    Interpolates the basis vectors ``bv_data``, an array of shape
+    (number of vectors, len(bv_cad)), onto the cadences ``newcad``.
+    Cadences outside of ``bv_cad`` take the value of the first or last
+    basis vector point.
+    """
+    if scinterp == 'linear':
+        i1 = np.clip(np.searchsorted(bv_cad, newcad), 1, len(bv_cad) - 1)
+        x0 = bv_cad[i1 - 1]
+        w = np.clip((newcad - x0) / (bv_cad[i1] - x0), 0., 1.)
+        return bv_data[:, i1 - 1] * (1. - w) + bv_data[:, i1] * w
+    elif scinterp == 'nearest':
+        return near_intpl(newcad, bv_cad, bv_data)
+    intpl = interp1d(bv_cad, bv_data, kind=scinterp, axis=-1,
+                     bounds_error=False, fill_value=None)(newcad)
+    pcomp = np.where(np.isnan(intpl), 0, intpl)
+    mid_pt = np.floor(np.median(np.arange(len(newcad))))
+    lower = np.logical_and(np.arange(len(newcad)) < mid_pt, pcomp == 0)
+    upper = np.logical_and(np.arange(len(newcad)) > mid_pt, pcomp == 0)
+    pcomp = np.where(lower, bv_data[:, :1], pcomp)
+    return np.where(upper, bv_data[:, -1:], pcomp)
+
+def sc_pcomps(bvfiledata, module, output, newcad, scinterp, cachedir=None,
+              cache=None):
+    """
+    Returns all the basis vectors of a module/output of an open CBV file,
+    interpolated onto the short cadence numbers ``newcad``, as an array of
+    shape (number of vectors, len(newcad)).
+
+    The result is stored in the dict ``cache`` and, if ``cachedir`` is
+    given, saved there as a .npy file keyed by the CBV file, the
+    module/output, the interpolation method and the cadence grid. Later
+    calls, also from other processes, memory-map that file instead of
+    interpolating again.
+    """
+    bvfile = os.path.abspath(bvfiledata.filename())
+    key = hashlib.sha1('{}|{}|{}|{}|{}|'.format(
+                        bvfile, os.path.getmtime(bvfile), module, output,
+                        scinterp).encode('utf-8'))
+    key.update(np.ascontiguousarray(newcad, dtype=float).tobytes())
+    key = key.hexdigest()
+    if cache is not None and key in cache:
+        return cache[key]
+    path = None
+    if cachedir is not None:
+        path = os.path.join(cachedir, '{0}-{1}_{2}-{3}.npy'.format(
+                            os.path.basename(bvfile).split('.')[0], module,
+                            output, key))
+    if path is not None and os.path.isfile(path):
+        pcomps = np.load(path, mmap_mode='r')
+    else:
+        bvdata = bvfiledata['MODOUT_{0}_{1}'.format(module, output)].data
+        nvec = len([name for name in bvdata.columns.names
+                    if name.startswith('VECTOR_')])
+        cadenceno = sc_cadenceno(bvdata.field('CADENCENO'))
+        in_lc = np.in1d(cadenceno, newcad)
+        bv_data = np.array([bvdata.field('VECTOR_{}'.format(j + 1))[in_lc]
+                            for j in range(nvec)], dtype=float)
+        pcomps = interpolate_pcomps(newcad, cadenceno[in_lc], bv_data,
+                                    scinterp)
+        if path is not None:
+            if not os.path.isdir(cachedir):
+                os.makedirs(cachedir)
+            # write to a temporary file first so that concurrent runs never
+            # read a partially written cache file
+            tmpfile = '{}.{}.tmp'.format(path, os.getpid())
+            with open(tmpfile, 'wb') as f:
+                np.save(f, pcomps)
+            os.rename(tmpfile, path)
+    if cache is not None:
+        cache[key] = pcomps
+    return pcomps
+
+def sc_cadenceno(bv_cad):
+    """
+    converts the long cadence numbers of the basis vectors into the short
+    cadence numbers of the middle of each long cadence
+    """
+    return (((bv_cad + (7.5 / 15.)) * 30.) - 11540.).round()
+
 def make_sc_lc(obs_cad, bv_cad, flux):
     """
-    make short cadence data look like long cadence data
+    make short cadence data look like long cadence data, by averaging the
+    flux of the short cadences within each long cadence
     """
-    newflux = np.zeros(len(bv_cad))
-    for i in range(len(bv_cad)):
-        mask = np.logical_and(obs_cad > bv_cad[i] - 15,
-                              obs_cad < bv_cad[i] + 15)
-        newflux[i] = obs_cad[mask]
-    return newflux
+    order = np.argsort(obs_cad)
+    obs_cad = np.asarray(obs_cad)[order]
+    csum = np.concatenate([[0.], np.cumsum(np.asarray(flux)[order])])
+    lo = np.searchsorted(obs_cad, np.asarray(bv_cad) - 15, side='right')
+    hi = np.searchsorted(obs_cad, np.asarray(bv_cad) + 15, side='left')
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return (csum[hi] - csum[lo]) / (hi - lo)
 
 def near_intpl(xout, xin, yin):
     """
     Interpolate the curve defined by (xin, yin) at points xout. The array
     xin must be monotonically increasing. The output has the same data type as
-    the input yin.
+    the input yin. If yin has more than one dimension, the curves are along
+    its last axis.
 
     :param yin: y values of input curve
     :param xin: x values of input curve
     :param xout: x values of output interpolated curve
-    :param method: interpolation method ('linear' | 'nearest')
 
     @:rtype: numpy array with interpolated curve
     """
 
     lenxin = len(xin)
-    i1 = searchsorted(xin, xout)
+    i1 = np.searchsorted(xin, xout)
     i1[i1 == 0] = 1
     i1[i1 == lenxin] = lenxin - 1
     x0 = xin[i1 - 1]
     x1 = xin[i1]
-    y0 = yin[i1 - 1]
-    y1 = yin[i1]
+    y0 = yin[..., i1 - 1]
+    y1 = yin[..., i1]
 
-    return np.where(abs(xout - x0) < abs(xout - x1), y0, y1)
+    return np.where(abs(xout - x0) <= abs(xout - x1), y0, y1)
 
 def get_pcomp_list(pcompdata, pcomplist, newcad):
     pcomp = np.zeros((len(pcomplist), len(newcad)))
@@ -125,17 +190,13 @@ def do_lsq_uhat(pcomps, flux):
     using the 'matrix' method - U(transpose) * y = coeffs
     In my implimentation y is a horizontal 1D array and U is also a long thin
     array of length correpsonding to the number of basis vectors use. In
-    effect what I have is my U is already transposed and y need to be
-    transposed to used. First I convert to what is expected in leasts
-    squares fitting
+    effect what I have is my U is already transposed. The least squares
+    problem is solved with an orthogonal decomposition of U rather than by
+    inverting the normal equations.
     """
 
-    U_hat = np.matrix(pcomps).transpose()
-    y_hat = np.matrix(flux).transpose()
-    U_trans = U_hat.transpose()
-    coeffs = - np.linalg.inv(U_trans * U_hat) * U_trans * y_hat
-
-    return coeffs
+    coeffs = np.linalg.lstsq(np.transpose(pcomps), flux, rcond=None)[0]
+    return - coeffs
 
 def do_lsq_nlin(pcomps, flux):
     """
@@ -192,12 +253,7 @@ def chi2_gtf(obs, expect, err, dof):
     calculates a chi squared of the model fit to the data
     """
 
-    chisqu = 0.
-    obs = obs
-    expect  = expect
-    err = err
-    for i in range(len(obs)):
-        chisqu += ((obs[i] - expect[i]) / err[i]) ** 2
+    chisqu = np.sum(((obs - expect) / err) ** 2)
     chisqu = chisqu / float(dof)
     return chisqu
 
@@ -215,47 +271,32 @@ def do_lst_iter(bvs, cad, flux, nsigma, niter, method, order):
     after each fit outliers further than nsigma from the fit are removed and the fit recalculated.
 
     The sigma actually means a median absolute deviation from the median.
+
+    Returns the coefficients of the last fit and a boolean mask of the data
+    points used in it.
     """
-    iiter = 1
-    fluxnew = np.copy(flux)
-    lcnew = np.copy(cad)
-    bvsnew = np.copy(bvs)
-    if method == 'lst_sq':
-        t = do_lsq_nlin(bvsnew, fluxnew)
-    elif method == 'simplex':
-        t = do_lsq_fmin_pow(bvsnew, fluxnew, order)
-    elif method == 'llsq':
-        t = do_lsq_uhat(bvsnew, fluxnew)
-
-    bvsum = np.dot(t.T, bvsnew).reshape(-1)
-    while (iiter < niter):
-        iiter += 1
-        matchrange = 1.4826 * nsigma * MAD_model(np.subtract(fluxnew, bvsum))
-        mask = np.asarray(abs(fluxnew - bvsum) < matchrange)
-        mask = mask.flatten()
-        fluxnew = fluxnew[mask]
-        lcnew = lcnew[mask]
-        try:
-            bvsnew = np.copy(bvsnew2)
-        except:
-            pass
-        bvsnew2 = newpcompsarray(bvsnew, mask)
-        for i in range(np.shape(bvsnew)[0]):
-            bvsnew2[i] = bvsnew[i][mask]
-        if method == 'llsq':
-            t = do_lsq_uhat(bvsnew2, fluxnew)
-        elif method == 'lst_sq':
-            t = do_lsq_nlin(bvsnew2, fluxnew)
+    def fit(mask):
+        if method == 'lst_sq':
+            return do_lsq_nlin(bvs[:, mask], flux[mask])
         elif method == 'simplex':
-            t = do_lsq_fmin_pow(bvsnew2, fluxnew, order)
-        bvsum = np.dot(t.T, bvsnew2).reshape(-1)
+            return do_lsq_fmin_pow(bvs[:, mask], flux[mask], order)
+        return do_lsq_uhat(bvs[:, mask], flux[mask])
+
+    mask = np.ones(len(flux), dtype=bool)
+    t = fit(mask)
+    for iiter in range(1, int(niter)):
+        # the fitted coefficients are returned with a negative sign
+        resid = flux + np.dot(np.asarray(t).T, bvs).reshape(-1)
+        matchrange = 1.4826 * nsigma * MAD_model(resid[mask])
+        newmask = mask & (np.abs(resid) < matchrange)
+        # nothing was clipped, so refitting would give the same result
+        if np.array_equal(newmask, mask):
+            break
+        mask = newmask
+        t = fit(mask)
 
     return t, mask
 
-def newpcompsarray(pcomp, mask):
-    pcompnew = np.zeros((np.shape(pcomp)[0], len(mask[mask])))
-    return pcompnew
-
 
 def MAD_model(xx, minSd=1E-16):
     """Median Absolute Deviation"""
@@ -421,7 +462,8 @@ def split_on_nans(good_data, cad):
 def kepcotrend(infile, bvfile, listbv, outfile=None, fitmethod='llsq',
                fitpower=1, iterate=False, sigma=None, maskfile='',
                scinterp='linear', plot=False, noninteractive=False,
-               overwrite=False, verbose=False, logfile='kepcotrend.log'):
+               overwrite=False, verbose=False, logfile='kepcotrend.log',
+               cachedir=None):
     """
     kepcotrend -- Remove systematic trends Kepler light curves using
     cotrending basis vectors. The cotrending basis vectors files can be found
@@ -539,13 +581,19 @@ def kepcotrend(infile, bvfile, listbv, outfile=None, fitmethod='llsq',
     Parameters
     ----------
     infile : str
-        the input file in the FITS format obtained from MAST
+        the input file in the FITS format obtained from MAST. If this is a
+        directory, every light curve file in it is cotrended against
+        ``bvfile`` (batch mode). The CBV file is then read only once and
+        basis vectors interpolated onto a short cadence grid are reused by
+        all the light curves which share that grid.
     outfile : str
         the output will be a fits file in the same style as the input file but
         with two additional columns: CBVSAP_MODL and CBVSAP_FLUX. The first of
         these is the best fitting linear combination of basis vectors.
         The second is the new flux with the basis vector sum subtracted. This
-        is the new flux value.
+        is the new flux value. In batch mode, this is the directory in which
+        the output files, named after the input files, are written (defaults
+        to ``infile``).
     bvfile : str
         the name of the FITS file containing the basis vectors
     listbv : list of integers
@@ -593,6 +641,12 @@ def kepcotrend(infile, bvfile, listbv, outfile=None, fitmethod='llsq',
         Print informative messages and warnings to the shell and logfile?
     logfile : str
         Name of the logfile containing error and warning messages.
+    cachedir : str or None
+        directory in which the basis vectors interpolated onto a short
+        cadence grid are stored as memory-mappable .npy files. Cotrending
+        other short cadence targets of the same module/output against the
+        same CBV file then reuses them instead of interpolating again.
+        If None, interpolated basis vectors are only reused within a call.
 
     Examples
     --------
@@ -602,8 +656,19 @@ def kepcotrend(infile, bvfile, listbv, outfile=None, fitmethod='llsq',
         '1 2 3' --plot --verbose
     """
 
-    if outfile is None:
-        outfile = infile.split('.')[0] + "-{}.fits".format(__all__[0])
+    # input files: a single light curve or all the light curves in a directory
+    if os.path.isdir(infile):
+        infiles = sorted(glob.glob(os.path.join(infile, '*.fits'))
+                         + glob.glob(os.path.join(infile, '*.fits.gz')))
+        infiles = [f for f in infiles if '-' + __all__[0] not in f]
+        outdir = infile if outfile is None else outfile
+        outfiles = [os.path.join(outdir, os.path.basename(f).split('.')[0]
+                                 + "-{}.fits".format(__all__[0]))
+                    for f in infiles]
+    else:
+        if outfile is None:
+            outfile = infile.split('.')[0] + "-{}.fits".format(__all__[0])
+        infiles, outfiles = [infile], [outfile]
     # log the call
     hashline = '--------------------------------------------------------------'
     kepmsg.log(logfile, hashline, verbose)
@@ -621,25 +686,18 @@ def kepcotrend(infile, bvfile, listbv, outfile=None, fitmethod='llsq',
             + ' plot={}'.format(plot)
             + ' overwrite={}'.format(overwrite)
             + ' verbose={}'.format(verbose)
-            + ' logfile={}'.format(logfile))
+            + ' logfile={}'.format(logfile)
+            + ' cachedir={}'.format(cachedir))
     kepmsg.log(logfile, call+'\n', verbose)
 
     # start time
     kepmsg.clock('KEPCOTREND started at', logfile, verbose)
 
-    # overwrite output file
-    if overwrite:
-        kepio.overwrite(outfile, logfile, verbose)
-    if kepio.fileexists(outfile):
-        errmsg = 'ERROR -- KEPCOTREND: {} exists. Use --overwrite'.format(outfile)
+    if len(infiles) == 0:
+        errmsg = 'ERROR -- KEPCOTREND: no FITS files in {}'.format(infile)
         kepmsg.err(logfile, errmsg, verbose)
-
-    # open input file
-    instr = pyfits.open(infile)
-    tstart, tstop, bjdref, cadence = kepio.timekeys(instr, infile, logfile,
-                                                    verbose)
-    # fudge non-compliant FITS keywords with no values
-    instr = kepkey.emptykeys(instr, infile, logfile, verbose)
+    if os.path.isdir(infile) and not os.path.isdir(outdir):
+        os.makedirs(outdir)
 
     if not kepio.fileexists(bvfile):
         message = 'ERROR -- KEPCOTREND: ' + bvfile + ' does not exist.'
@@ -657,6 +715,75 @@ def kepcotrend(infile, bvfile, listbv, outfile=None, fitmethod='llsq',
     if fitpower is None:
         fitpower = 1.
 
+    #get a list of basis vectors to use from the list given
+    #accept different seperators
+    if len(listbv) == 1:
+        bvlist = np.array([int(listbv)])
+    else:
+        listbv = listbv.strip()
+        if listbv[1] in [' ', ',', ':', ';', '|', ', ']:
+            separator = str(listbv)[1]
+        else:
+            message = ('You must separate your basis vector numbers to use '
+                       'with \' \' \',\' \':\' \';\' or \'|\' and the '
+                       'first basis vector to use must be between 1 and 9')
+            kepmsg.err(logfile, message, verbose)
+
+        bvlist = np.fromstring(listbv, dtype=int, sep=separator)
+
+    if bvlist[0] == 0:
+        errmsg = 'Must use at least one basis vector'
+        kepmsg.err(logfile, errmsg, verbose)
+
+    if maskfile != '':
+        if not kepio.fileexists(maskfile):
+            errmsg = 'Maskfile {} does not exist'.format(maskfile)
+            kepmsg.err(logfile, errmsg, verbose)
+        maskdata = np.atleast_2d(np.genfromtxt(maskfile, delimiter=','))
+    else:
+        maskdata = None
+
+    if iterate and sigma is None:
+        errmsg = 'If fitting iteratively you must specify a clipping range'
+        kepmsg.err(logfile, errmsg, verbose)
+
+    # the CBV file is read once and the basis vectors interpolated onto
+    # short cadence grids are shared by all the light curves
+    bvfiledata = pyfits.open(bvfile)
+    cache = {}
+    for infile, outfile in zip(infiles, outfiles):
+        cotrend(infile, outfile, bvfiledata, bvlist, fitmethod, fitpower,
+                iterate, sigma, maskdata, scinterp, plot, noninteractive,
+                overwrite, verbose, logfile, cache, cachedir)
+    bvfiledata.close()
+
+    # end time
+    kepmsg.clock('KEPCOTREND completed at', logfile, verbose)
+
+def cotrend(infile, outfile, bvfiledata, bvlist, fitmethod, fitpower, iterate,
+            sigma, maskdata, scinterp, plot, noninteractive, overwrite,
+            verbose, logfile, cache=None, cachedir=None):
+    """
+    Cotrends a single light curve file against the basis vectors of an open
+    CBV file and writes the result to ``outfile``. ``cache`` is a dict in
+    which interpolated short cadence basis vectors are stored, see
+    ``sc_pcomps``.
+    """
+
+    # overwrite output file
+    if overwrite:
+        kepio.overwrite(outfile, logfile, verbose)
+    if kepio.fileexists(outfile):
+        errmsg = 'ERROR -- KEPCOTREND: {} exists. Use --overwrite'.format(outfile)
+        kepmsg.err(logfile, errmsg, verbose)
+
+    # open input file
+    instr = pyfits.open(infile)
+    tstart, tstop, bjdref, cadence = kepio.timekeys(instr, infile, logfile,
+                                                    verbose)
+    # fudge non-compliant FITS keywords with no values
+    instr = kepkey.emptykeys(instr, infile, logfile, verbose)
+
     # input data
     short = False
     try:
@@ -721,7 +848,6 @@ def kepcotrend(infile, bvfile, listbv, outfile=None, fitmethod='llsq',
                   'reccommend nearest if you are unsure.')
         kepmsg.err(logfile, errmsg, verbose)
 
-    bvfiledata = pyfits.open(bvfile)
     bvdata = bvfiledata['MODOUT_{0}_{1}'.format(module, output)].data
 
     if int(bvfiledata[0].header['QUARTER']) != int(quarter):
@@ -741,48 +867,23 @@ def kepcotrend(infile, bvfile, listbv, outfile=None, fitmethod='llsq',
     #cut out infinites and zero flux columns
     lc_cad, lc_date, lc_flux, lc_err, good_data = cut_bad_data(lc_cad_o,
                                       lc_date_o, lc_flux_o, lc_err_o)
-    #get a list of basis vectors to use from the list given
-    #accept different seperators
-    if len(listbv) == 1:
-        bvlist = [listbv]
-    else:
-        listbv = listbv.strip()
-        if listbv[1] in [' ', ',', ':', ';', '|', ', ']:
-            separator = str(listbv)[1]
-        else:
-            message = ('You must separate your basis vector numbers to use '
-                       'with \' \' \',\' \':\' \';\' or \'|\' and the '
-                       'first basis vector to use must be between 1 and 9')
-            kepmsg.err(logfile, message, verbose)
-
-        bvlist = np.fromstring(listbv, dtype=int, sep=separator)
 
-    if bvlist[0] == 0:
-        errmsg = 'Must use at least one basis vector'
-        kepmsg.err(logfile, errmsg, verbose)
+    # basis vectors on the full cadence grid of the light curve, interpolated
+    # once per CBV file, module/output and grid for short cadence data
     if short:
-        bvdata.field('CADENCENO')[:] = ((((bvdata.field('CADENCENO')[:] +
-                                        (7.5 / 15.) ) * 30.) - 11540.).round())
-    bvectors = get_pcomp_list_newformat(bvdata, bvlist, lc_cad, short, scinterp)
+        bvectors_o = sc_pcomps(bvfiledata, module, output, lc_cad_o, scinterp,
+                               cachedir, cache)
+        bvectors_o = bvectors_o[np.asarray(bvlist, dtype=int) - 1]
+    else:
+        bvectors_o = get_pcomp_list_newformat(bvdata, bvlist, lc_cad_o, short,
+                                              scinterp)
+    bvectors = bvectors_o[:, good_data]
     medflux = np.median(lc_flux)
     n_flux = (lc_flux / medflux) - 1
     n_err = np.sqrt(lc_err * lc_err / (medflux * medflux))
 
-    if maskfile != '':
-        domasking = True
-        if not kepio.fileexists(maskfile):
-            errmsg = 'Maskfile {} does not exist'.format(maskfile)
-            kepmsg.err(logfile, errmsg, verbose)
-    else:
-        domasking = False
-
-    if domasking:
-        lc_date_masked = np.copy(lc_date)
-        n_flux_masked = np.copy(n_flux)
-        lc_cad_masked = np.copy(lc_cad)
-        n_err_masked = np.copy(n_err)
-        maskdata = np.atleast_2d(np.genfromtxt(maskfile, delimiter=','))
-        mask = np.ones(len(lc_date_masked), dtype=bool)
+    mask = np.ones(len(lc_date), dtype=bool)
+    if maskdata is not None:
         for maskrange in maskdata:
             if version == 1:
                 start = maskrange[0] - 2400000.0
@@ -792,22 +893,10 @@ def kepcotrend(infile, bvfile, listbv, outfile=None, fitmethod='llsq',
                 end = maskrange[1] - 2454833.
             masknew = np.logical_xor(lc_date < start, lc_date > end)
             mask = np.logical_and(mask,masknew)
-        lc_date_masked = lc_date_masked[mask]
-        n_flux_masked = n_flux_masked[mask]
-        lc_cad_masked = lc_cad_masked[mask]
-        n_err_masked = n_err_masked[mask]
-    else:
-        lc_date_masked = np.copy(lc_date)
-        n_flux_masked = np.copy(n_flux)
-        lc_cad_masked = np.copy(lc_cad)
-        n_err_masked = np.copy(n_err)
-
-    bvectors_masked = get_pcomp_list_newformat(bvdata, bvlist, lc_cad_masked,
-                                               short, scinterp)
-
-    if iterate and sigma is None:
-        errmsg = 'If fitting iteratively you must specify a clipping range'
-        kepmsg.err(logfile, errmsg, verbose)
+    n_flux_masked = n_flux[mask]
+    lc_cad_masked = lc_cad[mask]
+    n_err_masked = n_err[mask]
+    bvectors_masked = bvectors[:, mask]
 
     #uses Pvals = yhat * U_transpose
     if iterate:
@@ -824,15 +913,12 @@ def kepcotrend(infile, bvfile, listbv, outfile=None, fitmethod='llsq',
 
     coeffs = np.asarray(coeffs)
     flux_after = medflux * (n_flux + np.dot(coeffs.T, bvectors) + 1).reshape(-1)
-    flux_after_masked = medflux * (n_flux_masked + np.dot(coeffs.T, bvectors_masked) + 1).reshape(-1)
     bvsum = np.dot(coeffs.T, bvectors).reshape(-1)
-    bvsum_masked = np.dot(coeffs.T, bvectors_masked).reshape(-1)
+    bvsum_masked = bvsum[mask]
     bvsum_nans = put_in_nans(good_data, bvsum)
     flux_after_nans = put_in_nans(good_data, flux_after)
 
     if plot:
-        if not domasking:
-            maskdata = None
         newmedflux = np.median(flux_after + 1)
         bvsum_un_norm = newmedflux * (1 - bvsum)
         do_plot(lc_date, lc_flux, flux_after, bvsum_un_norm, lc_cad,
@@ -846,11 +932,11 @@ def kepcotrend(infile, bvfile, listbv, outfile=None, fitmethod='llsq',
     print('      -----      ')
     if iterate:
         flux_fit = n_flux_masked[fittedmask]
-        sum_fit = bvsum_masked[fittedmask]
+        sum_fit = - bvsum_masked[fittedmask]
         err_fit = n_err_masked[fittedmask]
     else:
         flux_fit = n_flux_masked
-        sum_fit = bvsum_masked
+        sum_fit = - bvsum_masked
         err_fit = n_err_masked
 
     print('reduced chi2: {}'.format(chi2_gtf(flux_fit, sum_fit, err_fit,
@@ -860,9 +946,7 @@ def kepcotrend(infile, bvfile, listbv, outfile=None, fitmethod='llsq',
     for i in range(len(coeffs)):
         print('Coefficient of CBV #{0}: {1}'.format(i + 1, coeffs[i]))
     print('      -----      ')
-
-    # end time
-    kepmsg.clock('KEPCOTREND completed at', logfile, verbose)
+    return coeffs
 
 def kepcotrend_main():
     import argparse
@@ -870,12 +954,15 @@ def kepcotrend_main():
              description=('Remove systematic trends in photometry using'
                           ' cotrending basis vectors (CBV)'),
              formatter_class=PyKEArgumentHelpFormatter)
-    parser.add_argument('infile', help='Name of input file', type=str)
+    parser.add_argument('infile',
+                        help='Name of input file or directory of input files',
+                        type=str)
     parser.add_argument('cbvfile', help='Name of file containing the CBVs',
                         type=str)
     parser.add_argument('listbv', help='The CBVs to use', type=str)
     parser.add_argument('--outfile',
-                        help=('Name of FITS file to output.'
+                        help=('Name of FITS file (or directory, if infile is'
+                              ' a directory) to output.'
                               ' If None, outfile is infile-kepcotrend.'),
                         default=None)
     parser.add_argument('--method', '-m', help='Fitting method',
@@ -908,8 +995,11 @@ def kepcotrend_main():
                         help='Write to a log file?')
     parser.add_argument('--logfile', '-l', help='Name of ascii log file',
                         default='kepcotrend.log', type=str)
+    parser.add_argument('--cachedir', type=str, default=None,
+                        help=('Directory in which to cache short cadence'
+                              ' basis vectors'))
     args = parser.parse_args()
     kepcotrend(args.infile, args.cbvfile, args.listbv, args.outfile,
                args.fitmethod, args.fitpower, args.iterate, args.sigma,
                args.maskfile, args.scinterp, args.plot, args.noninteractive,
-               args.overwrite, args.verbose, args.logfile)
+               args.overwrite, args.verbose, args.logfile, args.cachedir)
@@ -169,7 +169,8 @@ def kepdetrend(infile, ranges1, ranges2, npoly1, npoly2, nsig1, nsig2,
     work1 = np.array([table.field('time'), table.field(datacol),
                       table.field(errcol)])
     work1 = np.rot90(work1, 3)
-    work1 = work1[~np.isnan(work1).any(1)]
+    good_data = ~np.isnan(work1).any(1)
+    work1 = work1[good_data]
 
     # read table columns
     intime = work1[:, 2] + bjdref
@@ -177,19 +178,13 @@ def kepdetrend(infile, ranges1, ranges2, npoly1, npoly2, nsig1, nsig2,
     inerr = work1[:, 0]
 
     # time ranges for region 1 (region to be corrected)
-    time1, data1, err1 = [], [], []
     t1start, t1stop = kepio.timeranges(ranges1, logfile, verbose)
     cadencelis1 = kepstat.filterOnRange(intime, t1start, t1stop)
-    for i in range(len(cadencelis1)):
-        time1.append(intime[cadencelis1[i]])
-        data1.append(indata[cadencelis1[i]])
-        if errcol.lower() != 'none':
-            err1.append(inerr[cadencelis1[i]])
-    t0 = time1[0]
-    time1 = np.array(time1, dtype='float64') - t0
-    data1 = np.array(data1, dtype='float32')
+    t0 = intime[cadencelis1][0]
+    time1 = np.array(intime[cadencelis1], dtype='float64') - t0
+    data1 = np.array(indata[cadencelis1], dtype='float32')
     if errcol.lower() != 'none':
-        err1 = np.array(err1, dtype='float32')
+        err1 = np.array(inerr[cadencelis1], dtype='float32')
     else:
         err1 = None
 
@@ -206,25 +201,17 @@ def kepdetrend(infile, ranges1, ranges2, npoly1, npoly2, nsig1, nsig2,
     fit1 = indata * 0.0
     for i in range(len(coeffs)):
         fit1 += coeffs[i] * (intime - t0) ** i
-    for i in range(len(intime)):
-        if i not in cadencelis1:
-            fit1[i] = 0.0
+    fit1[~kepio.inranges(intime, t1start, t1stop, closed='neither')] = 0.0
     plotx1 += t0
 
     # time ranges for region 2 (region that is correct)
-    time2, data2, err2 = [], [], []
     t2start, t2stop = kepio.timeranges(ranges2, logfile, verbose)
     cadencelis2 = kepstat.filterOnRange(intime, t2start, t2stop)
-    for i in range(len(cadencelis2)):
-        time2.append(intime[cadencelis2[i]])
-        data2.append(indata[cadencelis2[i]])
-        if errcol.lower() != 'none':
-            err2.append(inerr[cadencelis2[i]])
-    t0 = time2[0]
-    time2 = np.array(time2, dtype='float64') - t0
-    data2 = np.array(data2, dtype='float32')
+    t0 = intime[cadencelis2][0]
+    time2 = np.array(intime[cadencelis2], dtype='float64') - t0
+    data2 = np.array(indata[cadencelis2], dtype='float32')
     if errcol.lower() != 'none':
-        err2 = np.array(err2, dtype='float32')
+        err2 = np.array(inerr[cadencelis2], dtype='float32')
     else:
         err2 = None
 
@@ -241,9 +228,7 @@ def kepdetrend(infile, ranges1, ranges2, npoly1, npoly2, nsig1, nsig2,
     fit2 = indata * 0.0
     for i in range(len(coeffs)):
         fit2 += coeffs[i] * (intime - t0) ** i
-    for i in range(len(intime)):
-        if i not in cadencelis1:
-            fit2[i] = 0.0
+    fit2[~kepio.inranges(intime, t1start, t1stop, closed='neither')] = 0.0
     plotx2 += t0
 
     # normalize data
@@ -343,17 +328,18 @@ def kepdetrend(infile, ranges1, ranges2, npoly1, npoly2, nsig1, nsig2,
     # write output file
     print("Writing output file {}...".format(outfile))
     if popnans:
-        instr[1].data.field(datacol)[good_data] = outdata
-        instr[1].data.field(errcol)[good_data] = outerr
-        instr[1].data.field(datacol)[bad_data] = None
-        instr[1].data.field(errcol)[bad_data] = None
-        instr.writeto(outfile)
-    elif not popnans:
-        for i in range(len(outdata)):
-            instr[1].data.field(datacol)[i] = outdata[i]
-            if errcol.lower() != 'none':
-                instr[1].data.field(errcol)[i] = outerr[i]
-        instr.writeto(outfile)
+        outdata = kepio.expandcol(outdata, good_data)
+    else:
+        kepio.filterrows(instr[1], good_data, outfile, logfile, verbose,
+                         nanclean=True)
+    kepio.writefitscol(outfile, instr[1].data, datacol, outdata, logfile,
+                       verbose)
+    if errcol.lower() != 'none':
+        if popnans:
+            outerr = kepio.expandcol(outerr, good_data)
+        kepio.writefitscol(outfile, instr[1].data, errcol, outerr, logfile,
+                           verbose)
+    instr.writeto(outfile)
     # close input file
     instr.close()
     ## end time
@@ -1,5 +1,5 @@
 from .utils import PyKEArgumentHelpFormatter
-from . import kepio, kepmsg, kepkey, kepplot, kepstat
+from . import kepio, kepmsg, kepkey, kepplot, kepconvolve
 import numpy as np
 from matplotlib import pyplot as plt
 from astropy.io import fits as pyfits
@@ -118,12 +118,6 @@ def kepdiffim(infile, outfile=None, plotfile=None, imscale='logarithmic',
     kepid, channel, skygroup, module, output, quarter, season, \
         ra, dec, column, row, kepmag, xdim, ydim, barytime = \
         kepio.readTPF(infile, 'TIME', logfile, verbose)
-    kepid, channel, skygroup, module, output, quarter, season, \
-        ra, dec, column, row, kepmag, xdim, ydim, tcorr = \
-        kepio.readTPF(infile, 'TIMECORR', logfile, verbose)
-    kepid, channel, skygroup, module, output, quarter, season, \
-        ra, dec, column, row, kepmag, xdim, ydim, cadno = \
-        kepio.readTPF(infile, 'CADENCENO',logfile, verbose)
     kepid, channel, skygroup, module, output, quarter, season, \
         ra, dec, column, row, kepmag, xdim, ydim, fluxpixels = \
         kepio.readTPF(infile, 'FLUX', logfile, verbose)
@@ -151,36 +145,14 @@ def kepdiffim(infile, outfile=None, plotfile=None, imscale='logarithmic',
     print('     Output:     %1s' % output)
     print('')
 
-    # how many quality = 0 rows?
-    npts = 0
-    nrows = len(fluxpixels)
-    for i in range(nrows):
-        if (qual[i] == 0 and np.isfinite(barytime[i])
-            and np.isfinite(fluxpixels[i, int(ydim * xdim / 2)])):
-            npts += 1
-    time = np.empty((npts))
-    timecorr = np.empty((npts))
-    cadenceno = np.empty((npts))
-    quality = np.empty((npts))
-    pixseries = np.empty((ydim * xdim, npts))
-    errseries = np.empty((ydim * xdim, npts))
-
-    # construct output light curves
-    nptsx = 0
-    for i in range(ydim*xdim):
-        npts = 0
-        for k in range(nrows):
-            if (qual[k] == 0
-                and np.isfinite(barytime[k])
-                and np.isfinite(fluxpixels[k, int(ydim * xdim / 2)])):
-                time[npts] = barytime[k]
-                timecorr[npts] = tcorr[k]
-                cadenceno[npts] = cadno[k]
-                quality[npts] = qual[k]
-                pixseries[i, npts] = fluxpixels[k, nptsx]
-                errseries[i, npts] = errpixels[k, nptsx]
-                npts += 1
-        nptsx += 1
+    # quality = 0 cadences with a valid time and central pixel
+    good = ((qual == 0) & np.isfinite(barytime)
+            & np.isfinite(fluxpixels[:, ydim * xdim // 2]))
+    npts = np.count_nonzero(good)
+
+    # construct output light curves, one row per pixel
+    pixseries = np.array(fluxpixels[good].T, dtype='float64')
+    errseries = np.array(errpixels[good].T, dtype='float64')
 
     # define data sampling
     if filterlc:
@@ -189,74 +161,23 @@ def kepdiffim(infile, outfile=None, plotfile=None, imscale='logarithmic',
         tr = 1.0 / (cadence / 86400)
         timescale = 1.0 / (cutoff / tr)
 
-        # define convolution function
-        if function == 'boxcar':
-            filtfunc = np.ones(int(np.ceil(timescale)))
-        elif function == 'gauss':
-            timescale /= 2
-            dx = np.ceil(timescale * 10 + 1)
-            filtfunc = kepfunc.gauss()
-            filtfunc = filtfunc([1.0, dx / 2 - 1.0, timescale],
-                                linspace(0, dx - 1, dx))
-        elif function == 'sinc':
-            dx = np.ceil(timescale * 12 + 1)
-            fx = linspace(0, dx - 1, dx)
-            fx = fx - dx / 2 + 0.5
-            fx /= timescale
-            filtfunc = np.sinc(fx)
-        filtfunc /= np.sum(filtfunc)
-
-    # pad time series at both ends with noise model
-        for i in range(ydim * xdim):
-            ave, sigma  = (np.mean(pixseries[i, :len(filtfunc)]),
-                           np.std(pixseries[i, :len(filtfunc)]))
-            padded = np.append(kepstat.randarray(np.ones(len(filtfunc)) * ave,
-                               np.ones(len(filtfunc)) * sigma), pixseries[i, :])
-            ave, sigma  = (np.mean(pixseries[i, -len(filtfunc):]),
-                           np.std(pixseries[i, -len(filtfunc):]))
-            padded = np.append(padded,
-                               kepstat.randarray(np.ones(len(filtfunc)) * ave,
-                               np.ones(len(filtfunc)) * sigma))
-
-            # convolve data
-            convolved = np.convolve(padded,filtfunc,'same')
-            # remove padding from the output array
-            outdata = convolved[len(filtfunc):-len(filtfunc)]
-            # subtract low frequencies
-            outmedian = np.nanmedian(outdata)
-            pixseries[i, :] = pixseries[i, :] - outdata + outmedian
-
-    # sum pixels over cadence
-    nptsx = 0
-    nrows = len(fluxpixels)
-    pixsum = np.zeros((ydim*xdim))
-    errsum = np.zeros((ydim*xdim))
-    for i in range(npts):
-        if quality[i] == 0:
-            pixsum += pixseries[:, i]
-            errsum += errseries[:, i] **2
-            nptsx += 1
-    pixsum /= nptsx
-    errsum = np.sqrt(errsum) / nptsx
+        # filter all pixel series at once, ignoring gaps and the ends
+        # of the time series, and subtract low frequencies
+        filtfunc = kepconvolve.filterkernel(function, timescale)
+        outdata = kepconvolve.convolve(pixseries, filtfunc)
+        outmedian = np.nanmedian(outdata, axis=-1)
+        pixseries = pixseries - outdata + outmedian[:, np.newaxis]
 
-    # calculate standard deviation pixels
-    pixvar = np.zeros((ydim*xdim))
-    for i in range(npts):
-        if quality[i] == 0:
-            pixvar += (pixsum - pixseries[:,i] / errseries[:,i])**2
-    pixvar = np.sqrt(pixvar)
+    # mean pixels over cadence
+    pixsum = np.sum(pixseries, axis=1) / npts
 
-    # median pixel errors
-    errmed = np.empty((ydim*xdim))
-    for i in range(ydim*xdim):
-        errmed[i] = np.median(errseries[:,i])
+    # calculate standard deviation pixels
+    pixvar = np.sqrt(np.sum((pixsum[:, np.newaxis]
+                             - pixseries / errseries) ** 2, axis=1))
 
     # calculate chi distribution pixels
-    pixdev = np.zeros((ydim*xdim))
-    for i in range(npts):
-        if quality[i] == 0:
-            pixdev += ((pixsum - pixseries[:,i]) / pixsum)**2
-    pixdev = np.sqrt(pixdev)
+    pixdev = np.sqrt(np.sum(((pixsum[:, np.newaxis] - pixseries)
+                             / pixsum[:, np.newaxis]) ** 2, axis=1))
 
     # image scale and intensity limits
     pixsum_pl, zminsum, zmaxsum = kepplot.intScale1D(pixsum, imscale)
@@ -264,22 +185,12 @@ def kepdiffim(infile, outfile=None, plotfile=None, imscale='logarithmic',
     pixdev_pl, zmindev, zmaxdev = kepplot.intScale1D(pixdev, imscale)
 
     # construct output summed image
-    imgsum = np.empty((ydim, xdim))
-    imgvar = np.empty((ydim, xdim))
-    imgdev = np.empty((ydim, xdim))
-    imgsum_pl = np.empty((ydim, xdim))
-    imgvar_pl = np.empty((ydim, xdim))
-    imgdev_pl = np.empty((ydim, xdim))
-    n = 0
-    for i in range(ydim):
-        for j in range(xdim):
-            imgsum[i, j] = pixsum[n]
-            imgvar[i, j] = pixvar[n]
-            imgdev[i, j] = pixdev[n]
-            imgsum_pl[i, j] = pixsum_pl[n]
-            imgvar_pl[i, j] = pixvar_pl[n]
-            imgdev_pl[i, j] = pixdev_pl[n]
-            n += 1
+    imgsum = pixsum.reshape((ydim, xdim))
+    imgvar = pixvar.reshape((ydim, xdim))
+    imgdev = pixdev.reshape((ydim, xdim))
+    imgsum_pl = np.reshape(pixsum_pl, (ydim, xdim))
+    imgvar_pl = np.reshape(pixvar_pl, (ydim, xdim))
+    imgdev_pl = np.reshape(pixdev_pl, (ydim, xdim))
 
     # construct output file
     print("Writing output file {}...".format(outfile))
@@ -1,4 +1,3 @@
-import math
 import numpy as np
 from astropy.io import fits as pyfits
 from scipy.optimize import leastsq
@@ -181,23 +180,14 @@ def kepextract(infile, outfile=None, bitmask=KeplerQualityFlags.DEFAULT_BITMASK,
     psf_centr1[:] = np.nan
     psf_centr2 = np.empty(len(time))
     psf_centr2[:] = np.nan
-    mom_centr1 = np.empty(len(time))
-    mom_centr1[:] = np.nan
-    mom_centr2 = np.empty(len(time))
-    mom_centr2[:] = np.nan
     psf_centr1_err = np.empty(len(time))
     psf_centr1_err[:] = np.nan
     psf_centr2_err = np.empty(len(time))
     psf_centr2_err[:] = np.nan
-    mom_centr1_err = np.empty(len(time))
-    mom_centr1_err[:] = np.nan
-    mom_centr2_err = np.empty(len(time))
-    mom_centr2_err[:] = np.nan
 
     # read mask definition file
     if 'aper' not in maskfile.lower() and maskfile.lower() != 'all':
-        maskx = np.array([], 'int')
-        masky = np.array([], 'int')
+        maskx, masky = [], []
         lines = kepio.openascii(maskfile, 'r', logfile, verbose)
         for line in lines:
             line = line.strip().split('|')
@@ -207,74 +197,46 @@ def kepextract(infile, outfile=None, bitmask=KeplerQualityFlags.DEFAULT_BITMASK,
                 line = line[5].split(';')
                 for items in line:
                     try:
-                        masky = np.append(masky,y0 + int(items.split(',')[0]))
-                        maskx = np.append(maskx,x0 + int(items.split(',')[1]))
+                        y, x = (int(item) for item in items.split(','))
                     except:
                         continue
+                    masky.append(y0 + y)
+                    maskx.append(x0 + x)
         kepio.closeascii(lines, logfile, verbose)
         if len(maskx) == 0 or len(masky) == 0:
             errmsg = 'ERROR -- KEPEXTRACT: {} contains no pixels.'.format(maskfile)
             kepmsg.err(logfile, errmsg, verbose)
 
-    # subimage physical WCS data
-    crpix1p = cards2['CRPIX1P'].value
-    crpix2p = cards2['CRPIX2P'].value
-    crval1p = cards2['CRVAL1P'].value
-    crval2p = cards2['CRVAL2P'].value
-    cdelt1p = cards2['CDELT1P'].value
-    cdelt2p = cards2['CDELT2P'].value
+    # sky coordinates of the subimage pixels
+    aperx, apery = kepkey.wcsgrid(maskmap.shape, cards2['CRPIX1P'].value,
+                                  cards2['CRPIX2P'].value,
+                                  cards2['CRVAL1P'].value,
+                                  cards2['CRVAL2P'].value,
+                                  cards2['CDELT1P'].value,
+                                  cards2['CDELT2P'].value)
+    aperx = aperx.ravel()
+    apery = apery.ravel()
 
     # define new subimage bitmap...
     if 'aper' not in maskfile.lower() and maskfile.lower() != 'all':
-        aperx = np.array([], 'int')
-        apery = np.array([], 'int')
-        aperb = np.array([], 'int')
-        for i in range(maskmap.shape[0]):
-            for j in range(maskmap.shape[1]):
-                aperx = np.append(aperx, crval1p + (j + 1 - crpix1p) * cdelt1p)
-                apery = np.append(apery, crval2p + (i + 1 - crpix2p) * cdelt2p)
-                if maskmap[i, j] == 0:
-                    aperb = np.append(aperb, 0)
-                else:
-                    aperb = np.append(aperb, 1)
-                    maskmap[i, j] = 1
-                    for k in range(len(maskx)):
-                        if aperx[-1] == maskx[k] and apery[-1] == masky[k]:
-                            aperb[-1] = 3
-                            maskmap[i, j] = 3
+        maskpix = set(zip(maskx, masky))
+        inmask = np.array([pix in maskpix for pix in zip(aperx, apery)],
+                          dtype=bool).reshape(maskmap.shape)
+        maskmap[maskmap != 0] = 1
+        maskmap[(maskmap != 0) & inmask] = 3
 
     # trap case where no aperture needs to be defined but pixel positions are
     # still required for centroiding
     if maskfile.lower() == 'all':
-        aperx = np.array([], 'int')
-        apery = np.array([], 'int')
-        aperb = np.array([], 'int')
-        for i in range(maskmap.shape[0]):
-            for j in range(maskmap.shape[1]):
-                aperx = np.append(aperx,crval1p + (j + 1 - crpix1p) * cdelt1p)
-                apery = np.append(apery,crval2p + (i + 1 - crpix2p) * cdelt2p)
-                if maskmap[i, j] == 0:
-                    aperb = np.append(aperb, 0)
-                else:
-                    aperb = np.append(aperb, 3)
-                    maskmap[i, j] = 3
+        maskmap[maskmap != 0] = 3
 
     # ...or use old subimage bitmap
-    if 'aper' in maskfile.lower():
-        aperx = np.array([], 'int')
-        apery = np.array([], 'int')
-        aperb = np.array([], 'int')
-        for i in range(maskmap.shape[0]):
-            for j in range(maskmap.shape[1]):
-                aperb = np.append(aperb, maskmap[i, j])
-                aperx = np.append(aperx, crval1p + (j + 1 - crpix1p) * cdelt1p)
-                apery = np.append(apery, crval2p + (i + 1 - crpix2p) * cdelt2p)
+    aperb = maskmap.ravel()
 
     # subtract median pixel value for background?
     sky = np.zeros(len(time), 'float32')
     if bkg:
-        for i in range(len(time)):
-            sky[i] = np.nanmedian(flux[i, :])
+        sky[:] = np.nanmedian(flux, axis=1)
 
     # legal mask defined?
     if len(aperb) == 0:
@@ -282,65 +244,37 @@ def kepextract(infile, outfile=None, bitmask=KeplerQualityFlags.DEFAULT_BITMASK,
                   ' are defined.')
         kepmsg.err(logfile, errmsg, verbose)
 
-    # construct new table flux data
-    naper = (aperb == 3).sum()
+    # construct new table flux data, summing over the aperture pixels
+    inaper = aperb == 3
+    naper = inaper.sum()
     ntime = len(time)
-    sap_flux = np.array([], 'float32')
-    sap_flux_err = np.array([], 'float32')
-    sap_bkg = np.array([], 'float32')
-    sap_bkg_err = np.array([], 'float32')
-    raw_flux = np.array([],'float32')
+    aperflux = np.array(flux[:, inaper], dtype='float64')
+    aperflux_err = np.array(flux_err[:, inaper], dtype='float64')
     kepmsg.log(logfile,"Aperture photometry...",verbose)
-    for i in tqdm(range(len(time)), desc="Aperture photometry"):
-        work1 = np.array([], 'float64')
-        work2 = np.array([], 'float64')
-        work3 = np.array([], 'float64')
-        work4 = np.array([], 'float64')
-        work5 = np.array([], 'float64')
-        for j in range(len(aperb)):
-            if aperb[j] == 3:
-                work1 = np.append(work1, flux[i, j] - sky[i])
-                work2 = np.append(work2, flux_err[i, j])
-                work3 = np.append(work3, flux_bkg[i, j])
-                work4 = np.append(work4, flux_bkg_err[i, j])
-                work5 = np.append(work5, raw_cnts[i, j])
-        sap_flux = np.append(sap_flux, np.nansum(work1))
-        sap_flux_err = np.append(sap_flux_err, math.sqrt(np.nansum(work2 * work2)))
-        sap_bkg = np.append(sap_bkg, np.nansum(work3))
-        sap_bkg_err = np.append(sap_bkg_err, math.sqrt(np.nansum(work4 * work4)))
-        raw_flux = np.append(raw_flux, np.nansum(work5))
+    sap_flux = np.nansum(np.array(flux[:, inaper] - sky[:, np.newaxis],
+                                  dtype='float64'), axis=1)
+    sap_flux_err = np.sqrt(np.nansum(aperflux_err ** 2, axis=1))
+    aperbkg_err = np.array(flux_bkg_err[:, inaper], dtype='float64')
+    sap_bkg = np.nansum(np.array(flux_bkg[:, inaper], dtype='float64'), axis=1)
+    sap_bkg_err = np.sqrt(np.nansum(aperbkg_err ** 2, axis=1))
+    raw_flux = np.nansum(np.array(raw_cnts[:, inaper], dtype='float64'), axis=1)
 
     kepmsg.log(logfile,"Sample moments...",verbose)
     # construct new table moment data
-    for i in tqdm(range(ntime), desc="Computing moments"):
-        xf = np.zeros(shape=(naper))
-        yf = np.zeros(shape=(naper))
-        f = np.zeros(shape=(naper))
-        xfe = np.zeros(shape=(naper))
-        yfe = np.zeros(shape=(naper))
-        fe = np.zeros(shape=(naper))
-        k = -1
-        for j in range(len(aperb)):
-            if aperb[j] == 3:
-                k += 1
-                xf[k] = aperx[j] * flux[i, j]
-                xfe[k] = aperx[j] * flux_err[i, j]
-                yf[k] = apery[j] * flux[i, j]
-                yfe[k] = apery[j] * flux_err[i, j]
-                f[k] = flux[i, j]
-                fe[k] = flux_err[i, j]
-        xfsum = np.nansum(xf)
-        yfsum = np.nansum(yf)
-        fsum = np.nansum(f)
-        xfsume = math.sqrt(np.nansum(xfe * xfe) / naper)
-        yfsume = math.sqrt(np.nansum(yfe * yfe) / naper)
-        fsume = math.sqrt(np.nansum(fe * fe) / naper)
-        # Ignore "RuntimeWarning: invalid value encountered in double_scalars"
-        with np.errstate(divide='ignore', invalid='ignore'):
-            mom_centr1[i] = xfsum / fsum
-            mom_centr2[i] = yfsum / fsum
-            mom_centr1_err[i] = math.sqrt((xfsume / xfsum) ** 2 + ((fsume / fsum) ** 2))
-            mom_centr2_err[i] = math.sqrt((yfsume / yfsum) ** 2 + ((fsume / fsum) ** 2))
+    modx = aperx[inaper]
+    mody = apery[inaper]
+    xfsum = np.nansum(modx * aperflux, axis=1)
+    yfsum = np.nansum(mody * aperflux, axis=1)
+    fsum = np.nansum(aperflux, axis=1)
+    # Ignore "RuntimeWarning: invalid value encountered in true_divide"
+    with np.errstate(divide='ignore', invalid='ignore'):
+        xfsume = np.sqrt(np.nansum((modx * aperflux_err) ** 2, axis=1) / naper)
+        yfsume = np.sqrt(np.nansum((mody * aperflux_err) ** 2, axis=1) / naper)
+        fsume = np.sqrt(np.nansum(aperflux_err ** 2, axis=1) / naper)
+        mom_centr1 = xfsum / fsum
+        mom_centr2 = yfsum / fsum
+        mom_centr1_err = np.sqrt((xfsume / xfsum) ** 2 + ((fsume / fsum) ** 2))
+        mom_centr2_err = np.sqrt((yfsume / yfsum) ** 2 + ((fsume / fsum) ** 2))
     mom_centr1_err = mom_centr1_err * mom_centr1
     mom_centr2_err = mom_centr2_err * mom_centr2
 
@@ -351,23 +285,12 @@ def kepextract(infile, outfile=None, bitmask=KeplerQualityFlags.DEFAULT_BITMASK,
         psf_centr2 = np.zeros(shape=(ntime))
         psf_centr1_err = np.zeros(shape=(ntime))
         psf_centr2_err = np.zeros(shape=(ntime))
-        modx = np.zeros(shape=(naper))
-        mody = np.zeros(shape=(naper))
-        k = -1
-        for j in range(len(aperb)):
-            if (aperb[j] == 3):
-                k += 1
-                modx[k] = aperx[j]
-                mody[k] = apery[j]
+        # maximum flux over the cadences from i onwards, as initial guess
+        with np.errstate(invalid='ignore'):
+            fluxmax = np.fmax.accumulate(np.nanmax(flux, axis=1)[::-1])[::-1]
         for i in tqdm(range(ntime), desc='PSF centroiding'):
-            modf = np.zeros(shape=(naper))
-            k = -1
-            guess = [mom_centr1[i], mom_centr2[i], np.nanmax(flux[i:]), 1.0, 1.0, 0.0, 0.0]
-            for j in range(len(aperb)):
-                if (aperb[j] == 3):
-                    k += 1
-                    modf[k] = flux[i,j]
-                    args = (modx, mody, modf)
+            guess = [mom_centr1[i], mom_centr2[i], fluxmax[i], 1.0, 1.0, 0.0, 0.0]
+            args = (modx, mody, aperflux[i])
             try:
                 ans = leastsq(kepfunc.PRFgauss2d, guess, args=args, xtol=1.0e-8,
                               ftol=1.0e-4, full_output=True)
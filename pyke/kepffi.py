@@ -1,7 +1,7 @@
 from .utils import PyKEArgumentHelpFormatter
+from .catalog import KeplerTargetCatalog
 import sys
 import os
-import urllib
 import re
 import math
 import numpy as np
@@ -27,7 +27,7 @@ pkepmag = None; pkepid = None; pra = None; pdec = None
 # core code
 
 def kepffi(ffifile, kepid, ra, dec, aperfile, imin, imax, iscale, cmap, npix,
-           verbose=False, logfile='kepffi.log'):
+           verbose=False, logfile='kepffi.log', catalog=None):
     """
     kepffi -- Display a portion of a Full Frame Image (FFI) and define custom
     target apertures
@@ -39,7 +39,7 @@ def kepffi(ffifile, kepid, ra, dec, aperfile, imin, imax, iscale, cmap, npix,
         containing a Kepler channel image within each data extension.
     kepid : str
         The numerical Kepler identification number for a specific source,
-        obtained from the MAST Target Search page.
+        which is looked up in the local target catalog.
     ra : str
         The J2000 Right Ascension of a target in decimal degrees or sexadecimal
         hours (hh:mm:ss.ss). In conjunction with dec, this parameter overrides
@@ -80,6 +80,10 @@ def kepffi(ffifile, kepid, ra, dec, aperfile, imin, imax, iscale, cmap, npix,
         Print informative messages and warnings to the shell and logfile?
     logfile : str
         Name of the logfile containing error and warning messages.
+    catalog : None or str
+        Filename of the local target catalog, which provides the positions
+        of the targets. See `KeplerTargetCatalog` for its format. If None,
+        the default catalog ``~/.pyke/catalog.fits`` is used.
     """
 
     global pimg, zscale, zmin, zmax, xmin, xmax, ymin, ymax, quarter
@@ -106,8 +110,9 @@ def kepffi(ffifile, kepid, ra, dec, aperfile, imin, imax, iscale, cmap, npix,
             + ' iscale={}'.format(iscale)
             + ' cmap={}'.format(cmap)
             + ' npix={}'.format(npix)
-            + ' verbose={}'.format(chatter)
-            + ' logfile={}'.format(logfile))
+            + ' verbose={}'.format(verbose)
+            + ' logfile={}'.format(logfile)
+            + ' catalog={}'.format(catalog))
     kepmsg.log(logfile, call+'\n', verbose)
 
     # start time
@@ -140,7 +145,87 @@ def kepffi(ffifile, kepid, ra, dec, aperfile, imin, imax, iscale, cmap, npix,
                 sys.exit(txt)
 
     # open FFI FITS file
-    ffi = pyfits.open(ffifile, 'readonly')
+    ffi = pyfits.open(ffifile, 'readonly', memmap=True)
+    quarter, season = ffiseason(ffi)
+
+    # locate target in the local target catalog
+    try:
+        cat = KeplerTargetCatalog.load(catalog)
+    except (IOError, ValueError) as e:
+        sys.exit('ERROR -- cannot read the target catalog. {}'.format(e))
+    if kepid == 'None' or kepid == 'none' or kepid.strip() == '':
+        kepid, ra, dec, kepmag, skygroup, channel, module, output, row, \
+        column = catalogRADec(cat, mra, mdec, 8.0, season)
+    else:
+        kepid, ra, dec, kepmag, skygroup, channel, module, output, row, \
+        column = catalogKepID(cat, kepid, season)
+        pkepmag = kepmag; pkepid = kepid
+    ra,dec = dec2sex(ra, dec)
+    pra = ra; pdec = dec
+    print(kepid, ra, dec, kepmag, skygroup, channel, module, output, row,
+          column)
+    # read and close FFI FITS file
+    img = readimage(ffi, int(channel))
+    ffi.close()
+
+    # print target data
+    print(''
+          + '      KepID:  %s'.format(kepid)
+          + ' RA (J2000):  %s'.format(ra)
+          + 'Dec (J2000): %s'.format(dec)
+          + '     KepMag:  %s'.format(kepmag)
+          + '   SkyGroup:    %2s'.format(skygroup)
+          + '     Season:    %2s'.format(season)
+          + '    Channel:    %2s'.format(channel)
+          + '     Module:    %2s'.format(module)
+          + '     Output:     %1s'.format(output)
+          + '     Column:  %4s'.format(column)
+          + '        Row:  %4s'.format(row)
+          + '')
+
+    # subimage of channel for plot
+    ymin = int(max([int(row) -npix /2, 0]))
+    ymax = int(min([int(row) +npix /2 + 1, img.shape[0]]))
+    xmin = int(max([int(column) - npix / 2, 0]))
+    xmax = int(min([int(column) + npix / 2 + 1, img.shape[1]]))
+
+    # intensity scale
+    nstat = 2
+    pixels = np.sort(img[ymin:ymax + 1, xmin:xmax + 1], axis=None)
+    pixels = pixels.astype(np.float32)
+    if int(float(len(pixels)) / 10 + 0.5) > nstat:
+        nstat = int(float(len(pixels)) / 10 + 0.5)
+    if not zmin:
+        zmin = np.median(pixels[:nstat])
+    if not zmax:
+        zmax = np.median(pixels[-nstat:])
+    if 'log' in zscale:
+        img = np.log10(img)
+        zmin = math.log10(zmin)
+        zmax = math.log10(zmax)
+    if 'sq' in zscale:
+        img = np.sqrt(img)
+        zmin = math.sqrt(zmin)
+        zmax = math.sqrt(zmax)
+    pimg = img[ymin:ymax, xmin:xmax]
+
+    # plot limits
+    ymin = float(ymin) - 0.5
+    ymax = float(ymax) - 0.5
+    xmin = float(xmin) - 0.5
+    xmax = float(xmax) - 0.5
+
+    # plot style
+    plt.figure(figsize=[10, 7])
+    plotimage()
+
+    plt.show()
+
+# -----------------------------------------------------------
+# quarter and season of observation of an FFI
+
+def ffiseason(ffi):
+    quarter = -1
     try:
         quarter = ffi[0].header['QUARTER']
     except:
@@ -163,80 +248,8 @@ def kepffi(ffifile, kepid, ra, dec, aperfile, imin, imax, iscale, cmap, npix,
         quarter = 1
     if quarter < 0:
         sys.exit('ERROR -- cannot determine quarter from FFI.')
-    if int(quarter) == 0:
-        season = 3
-    else:
-        season = (int(quarter) - 2) % 4
-        # locate target in MAST
-        try:
-            kepid, ra, dec, kepmag, skygroup, channel, module, output, row, \
-            column = MASTKepID(kepid, season)
-            pkepmag = kepmag; pkepid = kepid
-        except:
-            kepid, ra, dec, kepmag, skygroup, channel, module, output, row, \
-            column = MASTRADec(mra, mdec, 8.0, season)
-            ra,dec = dec2sex(ra, dec)
-        pra = ra; pdec = dec
-        print(kepid, ra, dec, kepmag, skygroup, channel, module, output, row,
-              column)
-        # read and close FFI FITS file
-        img = readimage(ffi, int(channel))
-        ffi.close()
-
-        # print target data
-        print(''
-              + '      KepID:  %s'.format(kepid)
-              + ' RA (J2000):  %s'.format(ra)
-              + 'Dec (J2000): %s'.format(dec)
-              + '     KepMag:  %s'.format(kepmag)
-              + '   SkyGroup:    %2s'.format(skygroup)
-              + '     Season:    %2s'.format(season)
-              + '    Channel:    %2s'.format(channel)
-              + '     Module:    %2s'.format(module)
-              + '     Output:     %1s'.format(output)
-              + '     Column:  %4s'.format(column)
-              + '        Row:  %4s'.format(row)
-              + '')
-
-        # subimage of channel for plot
-        ymin = int(max([int(row) -npix /2, 0]))
-        ymax = int(min([int(row) +npix /2 + 1, img.shape[0]]))
-        xmin = int(max([int(column) - npix / 2, 0]))
-        xmax = int(min([int(column) + npix / 2 + 1, img.shape[1]]))
-
-        # intensity scale
-        nstat = 2; pixels = []
-        for i in range(ymin, ymax + 1):
-            for j in range(xmin, xmax + 1):
-                pixels.append(img[i, j])
-        pixels = np.array(np.sort(pixels), dtype=np.float32)
-        if int(float(len(pixels)) / 10 + 0.5) > nstat:
-            nstat = int(float(len(pixels)) / 10 + 0.5)
-        if not zmin:
-            zmin = np.median(pixels[:nstat])
-        if not zmax:
-            zmax = np.median(pixels[-nstat:])
-        if 'log' in zscale:
-            img = np.log10(img)
-            zmin = math.log10(zmin)
-            zmax = math.log10(zmax)
-        if 'sq' in zscale:
-            img = np.sqrt(img)
-            zmin = math.sqrt(zmin)
-            zmax = math.sqrt(zmax)
-        pimg = img[ymin:ymax, xmin:xmax]
-
-        # plot limits
-        ymin = float(ymin) - 0.5
-        ymax = float(ymax) - 0.5
-        xmin = float(xmin) - 0.5
-        xmax = float(xmax) - 0.5
-
-    # plot style
-    plt.figure(figsize=[10, 7])
-    plotimage()
-
-    plt.show()
+    season = (int(quarter) - 2) % 4
+    return quarter, season
 
 # -----------------------------------------------------------
 # plot channel image
@@ -338,126 +351,87 @@ def plotimage():
     plt.show()
 
 # -----------------------------------------------------------
-# target data retrieval from MAST based upon KepID
+# target data retrieval from the local target catalog based upon KepID
 
-def MASTKepID(id,season):
+def catalogKepID(catalog, id, season):
 
     global skygroup, column, row
 
-    # build mast query
-    url  = 'http://archive.stsci.edu/kepler/kepler_fov/search.php?'
-    url += 'action=Search'
-    url += '&kic_kepler_id=' + id
-    url += '&max_records=100'
-    url += '&verb=3'
-    url += '&outputformat=CSV'
-
-    # retrieve results from MAST
-    lines = urllib.urlopen(url)
-    for line in lines:
-        line = line.strip()
-    out = line.split(',')
-
-    if len(out) > 0:
-        kepid = out[3]
-        ra = out[0]
-        dec = out[1]
-        kepmag = out[43]
-        skygroup = out[74]
-        channel = out[95 + season * 5]
-        module = out[96 + season * 5]
-        output = out[97 + season * 5]
-        row = out[98 + season * 5]
-        column = out[99 + season * 5]
-    else:
+    try:
+        entry = catalog.lookup(int(id), season)
+    except (KeyError, ValueError):
         txt = 'ERROR -- no target found with KepID {}'.format(id)
         sys.exit(txt)
 
+    kepid = str(id)
+    ra = float(entry['RA'])
+    dec = float(entry['DEC'])
+    kepmag = entry.get('KEPMAG')
+    skygroup = entry.get('SKYGROUP')
+    channel = entry['CHANNEL']
+    module = entry.get('MODULE')
+    output = entry.get('OUTPUT')
+    row = entry['ROW']
+    column = entry['COLUMN']
+
     return (kepid, ra, dec, kepmag, skygroup, channel, module, output, row,
             column)
 
 # -------------------------------------
 # detector location retrieval based upon RA and Dec
-def MASTRADec(ra, dec, darcsec, season):
+def catalogRADec(catalog, ra, dec, darcsec, season):
 
     global skygroup, column, row
 
+    # nearest catalog source to supplied coordinates
+    i, channel, column, row = radec2pixel(catalog, ra, dec, darcsec, season)
+    if i < 0:
+        txt = ('ERROR -- row and column could not be calculated. Is location'
+               ' on silicon?')
+        sys.exit(txt)
+    z = catalog.entry(int(i), season)
+
+    kepid = None
+    kepmag = None
+    skygroup = z.get('SKYGROUP')
+    module = z.get('MODULE')
+    output = z.get('OUTPUT')
+
+    # pixel coordinate of target
+    row = str(int(row))
+    column = str(int(column))
+
+    return (kepid, ra, dec, kepmag, skygroup, int(channel), module, output,
+            row, column)
+
+# -------------------------------------
+# detector locations of one or many sky positions, offset from the nearest
+# catalog sources within darcsec arcseconds. Positions with no catalog
+# source nearby are returned with a catalog row of -1.
+def radec2pixel(catalog, ra, dec, darcsec, season):
+
     # WCS data
     cd1_1 = 0.000702794927969
     cd1_2 = -0.000853190160515
     cd2_1 = -0.000853190160515
     cd2_2 = -0.000702794927969
     cd = np.array([[cd1_1, cd1_2], [cd2_1, cd2_2]])
-    cd = linalg.inv(cd)
-    # coordinate limits
-    x1 = 1.0e30
-    x2 = x1
-    darcsec /= 3600.0
-    ra1 = ra - darcsec / 15.0 / cos(dec * pi / 180)
-    ra2 = ra + darcsec / 15.0 / cos(dec * pi / 180)
-    dec1 = dec - darcsec
-    dec2 = dec + darcsec
-
-    # build mast query
-    url  = 'http://archive.stsci.edu/kepler/kepler_fov/search.php?'
-    url += 'action=Search'
-    url += '&kic_degree_ra=' + str(ra1) + '..' + str(ra2)
-    url += '&kic_dec=' + str(dec1) + '..' + str(dec2)
-    url += '&max_records=100'
-    url += '&verb=3'
-    url += '&outputformat=CSV'
-
-    # retrieve results from MAST: nearest KIC source to supplied coordinates
-    z = ''
-    x = 1.0e30
-    lines = urllib.urlopen(url)
-    for line in lines:
-        line = line.strip()
-        if (len(line) > 0 and
-            'Kepler' not in line and
-            'integer' not in line and
-            'no rows found' not in line):
-            out = line.split(',')
-            r = (float(out[6].split(' ')[0]) +
-                 float(out[6].split(' ')[1]) / 60.0 +
-                 float(out[6].split(' ')[2]) / 3600.0) * 15.0
-            d = (float(out[7].split(' ')[0]) +
-                 float(out[7].split(' ')[1]) / 60.0 +
-                 float(out[7].split(' ')[2]) / 3600.0)
-            a = sqrt((abs(r - ra) / 15.0 / cos(d * pi / 180))**2 + abs(d - dec)**2)
-            if a < x:
-                x = a
-                z = line.split(',')
-
-    if len(z) > 0:
-        kepid = None
-        kepmag = None
-        skygroup = out[73]
-        channel = out[94 + season * 5]
-        module = out[95 + season * 5]
-        output = out[96 + season * 5]
-    else:
-        txt = ('ERROR -- row and column could not be calculated. Is location'
-               ' on silicon?')
-        sys.exit(txt)
+    cd = np.linalg.inv(cd)
+
+    ra = np.asarray(ra, dtype='float64')
+    dec = np.asarray(dec, dtype='float64')
+    i, separation = catalog.nearest(ra, dec, darcsec)
+    j = np.maximum(i, 0)
+    channel, column, row = catalog.detector(j, season)
 
-    # convert coordinates to decimal for the two targets, determine distance from input
-    zra, zdec = sex2dec(z[6], z[7])
-    dra = zra - ra
-    ddec = zdec - dec
+    # offset of the targets from the nearest catalog sources
+    dra = (ra - catalog.columns['RA'][j]) * np.cos(np.radians(dec))
+    ddec = dec - catalog.columns['DEC'][j]
     drow = cd[0, 0] * dra + cd[0, 1] * ddec
     dcol = cd[1, 0] * dra + cd[1, 1] * ddec
-
-    # pixel coordinates of the nearest KIC target
-    row = z[97 + season * 5]
-    column = z[98 + season * 5]
-
-    # pixel coordinate of target
-    row = str(int(float(row) + drow + 0.5))
-    column = str(int(float(column) + dcol + 0.5))
-
-    return (kepid, ra, dec, kepmag, skygroup, channel, module, output, row,
-            column)
+    row = np.floor(row + drow + 0.5).astype('int64')
+    column = np.floor(column + dcol + 0.5).astype('int64')
+    return i, channel, column, row
 
 # -----------------------------------
 # convert sexadecimal hours to decimal degrees
@@ -659,8 +633,10 @@ def kepffi_main():
                         help='Write to a log file?')
     parser.add_argument('--logfile', '-l', help='Name of ascii log file',
                         default='kepffi.log', dest='logfile', type=str)
+    parser.add_argument('--catalog', default=None,
+                        help='local target catalog', type=str)
     args = parser.parse_args()
 
     kepffi(args.ffifile, args.kepid, args.ra, args.dec, args.aperfile,
            args.imin, args.imax, args.iscale, args.cmap, args.npix,
-           args.verbose, args.logfile)
+           args.verbose, args.logfile, args.catalog)
@@ -0,0 +1,316 @@
+from .utils import PyKEArgumentHelpFormatter
+from .catalog import KeplerTargetCatalog
+from .kepffi import ffiseason, radec2pixel
+import numpy as np
+from astropy.io import fits as pyfits
+from . import kepio, kepmsg, kepkey
+
+
+__all__ = ['kepffistamps']
+
+
+def kepffistamps(ffifile, targets, npix=30, outfile=None, split=False,
+                 catalog=None, overwrite=False, verbose=False,
+                 logfile='kepffistamps.log'):
+    """
+    kepffistamps -- extract postage stamps of many targets from a Full Frame
+    Image (FFI)
+
+    kepffistamps is the non-interactive, batch counterpart of kepffi. The
+    detector positions of all the targets are looked up at once in the local
+    target catalog, the FFI is opened once in memory-mapped mode, and the
+    stamps of all the targets which fall on a channel are cut out of its
+    image with a single indexing operation. Stamps which overlap the edge
+    of a channel image are padded with NaNs.
+
+    Parameters
+    ----------
+    ffifile : str
+        The name of a MAST standard format Full Frame Image (FFI) FITS file
+        containing a Kepler channel image within each data extension.
+    targets : str or list
+        Either the name of an ASCII target list or a list of targets. Each
+        target is either a Kepler ID, or a pair of J2000 Right Ascension and
+        Declination in decimal degrees. In the target list, targets are
+        given one per line, and text after a '#' is ignored. A target given
+        by coordinates is placed with respect to the nearest catalog source
+        within 8 arcseconds. Targets which are not in the catalog or not on
+        silicon are skipped with a warning, and targets listed more than
+        once are only extracted once.
+    npix : int
+        The pixel size of the square stamps.
+    outfile : str
+        Name of the output FITS file, in which each stamp is written to an
+        image extension named after its target. If None, outfile is
+        ffifile-kepffistamps.
+    split : bool
+        Write each stamp to its own file, named after outfile and its
+        target, instead?
+    catalog : None or str
+        Filename of the local target catalog, which provides the positions
+        of the targets. See `KeplerTargetCatalog` for its format. If None,
+        the default catalog ``~/.pyke/catalog.fits`` is used.
+    overwrite : bool
+        Overwrite the output file(s)?
+    verbose : bool
+        Print informative messages and warnings to the shell and logfile?
+    logfile : str
+        Name of the logfile containing error and warning messages.
+
+    Examples
+    --------
+    .. code-block:: bash
+
+        $ kepffistamps kplr2009114174833_ffi-cal.fits targets.txt --npix 21
+          --catalog kic.fits --split --overwrite --verbose
+    """
+
+    if outfile is None:
+        outfile = ffifile.split('.')[0] + "-{}.fits".format(__all__[0])
+    # log the call
+    hashline = '--------------------------------------------------------------'
+    kepmsg.log(logfile, hashline, verbose)
+    call = ('KEPFFISTAMPS -- '
+            + ' ffifile={}'.format(ffifile)
+            + ' targets={}'.format(targets)
+            + ' npix={}'.format(npix)
+            + ' outfile={}'.format(outfile)
+            + ' split={}'.format(split)
+            + ' catalog={}'.format(catalog)
+            + ' overwrite={}'.format(overwrite)
+            + ' verbose={}'.format(verbose)
+            + ' logfile={}'.format(logfile))
+    kepmsg.log(logfile, call+'\n', verbose)
+
+    # start time
+    kepmsg.clock('KEPFFISTAMPS started at', logfile, verbose)
+
+    # read target list
+    names, kepids, coords = readtargets(targets, logfile, verbose)
+
+    # output file names
+    if split:
+        outfiles = [outfile.split('.fits')[0] + '-' + name + '.fits'
+                    for name in names]
+    else:
+        outfiles = [outfile]
+    for filename in outfiles:
+        if overwrite:
+            kepio.overwrite(filename, logfile, verbose)
+        if kepio.fileexists(filename):
+            errmsg = ('ERROR -- KEPFFISTAMPS: {} exists. Use --overwrite'
+                      .format(filename))
+            kepmsg.err(logfile, errmsg, verbose)
+
+    # open FFI FITS file
+    ffi = pyfits.open(ffifile, mode='readonly', memmap=True)
+    cards0 = ffi[0].header.cards
+    quarter, season = ffiseason(ffi)
+
+    # locate targets in the local target catalog
+    try:
+        cat = KeplerTargetCatalog.load(catalog)
+    except (IOError, ValueError) as e:
+        errmsg = ('ERROR -- KEPFFISTAMPS: cannot read the target catalog. {}'
+                  .format(e))
+        kepmsg.err(logfile, errmsg, verbose)
+    channel = np.zeros(len(names), dtype='int64')
+    column = np.zeros(len(names), dtype='int64')
+    row = np.zeros(len(names), dtype='int64')
+    byid = np.array([kepid is not None for kepid in kepids], dtype=bool)
+    if byid.any():
+        ids = np.array([kepid for kepid in kepids if kepid is not None],
+                       dtype='int64')
+        found = cat.contains(ids)
+        incat = np.where(byid)[0][found]
+        channel[incat], column[incat], row[incat] = cat.position(ids[found],
+                                                                 season)
+        notincat = np.where(byid)[0][~found]
+        for k in notincat:
+            txt = ('WARNING -- KEPFFISTAMPS: target {} is not in the target '
+                   'catalog'.format(names[k]))
+            kepmsg.warn(logfile, txt, verbose)
+        channel[notincat] = -1
+    if not byid.all():
+        ra, dec = np.array([radec for radec in coords if radec is not None],
+                           dtype='float64').T
+        i, channel[~byid], column[~byid], row[~byid] = radec2pixel(
+                cat, ra, dec, 8.0, season)
+        offsilicon = np.where(~byid)[0][i < 0]
+        for k in offsilicon:
+            txt = ('WARNING -- KEPFFISTAMPS: no catalog source near {}. Is '
+                   'location on silicon?'.format(names[k]))
+            kepmsg.warn(logfile, txt, verbose)
+        channel[offsilicon] = -1
+
+    # cut out the stamps, one channel image at a time
+    npix = int(npix)
+    x1 = column - npix // 2
+    y1 = row - npix // 2
+    offset = np.arange(npix)
+    stamps = [None] * len(names)
+    for ch in np.unique(channel[channel > 0]):
+        try:
+            img = ffi[int(ch)].data
+        except:
+            errmsg = ('ERROR -- KEPFFISTAMPS: cannot read image data of '
+                      'channel {} in {}'.format(ch, ffifile))
+            kepmsg.err(logfile, errmsg, verbose)
+        sel = np.where(channel == ch)[0]
+        imrow = y1[sel, np.newaxis] + offset
+        imcol = x1[sel, np.newaxis] + offset
+        inrow = (imrow >= 0) & (imrow < img.shape[0])
+        incol = (imcol >= 0) & (imcol < img.shape[1])
+        data = img[np.clip(imrow, 0, img.shape[0] - 1)[:, :, np.newaxis],
+                   np.clip(imcol, 0, img.shape[1] - 1)[:, np.newaxis, :]]
+        data = data.astype('float32')
+        data[~(inrow[:, :, np.newaxis] & incol[:, np.newaxis, :])] = np.nan
+        for k, stamp in zip(sel, data):
+            stamps[k] = stamp
+    ffi.close()
+
+    # construct output primary extension
+    hdu0 = pyfits.PrimaryHDU()
+    for i in range(len(cards0)):
+        try:
+            if cards0[i].keyword not in hdu0.header.keys():
+                hdu0.header[cards0[i].keyword] = (cards0[i].value,
+                                                  cards0[i].comment)
+            else:
+                hdu0.header.cards[cards0[i].keyword].comment = cards0[i].comment
+        except:
+            pass
+    kepkey.history(call, hdu0, outfile, logfile, verbose)
+
+    # construct output stamp extensions
+    hdus = []
+    for k in range(len(names)):
+        if stamps[k] is None:
+            continue
+        hdu = pyfits.ImageHDU(stamps[k], name=names[k])
+        if kepids[k] is not None:
+            hdu.header['KEPLERID'] = (kepids[k], 'unique Kepler target identifier')
+        else:
+            hdu.header['RA_OBJ'] = (coords[k][0], '[deg] right ascension')
+            hdu.header['DEC_OBJ'] = (coords[k][1], '[deg] declination')
+        hdu.header['CHANNEL'] = (channel[k], 'CCD channel')
+        hdu.header['WCSNAMEP'] = ('PHYSICAL',
+                                  'name of world coordinate system alternate P')
+        hdu.header['WCSAXESP'] = (2, 'number of WCS physical axes')
+        hdu.header['CTYPE1P'] = ('RAWX', 'physical WCS axis 1 type CCD col')
+        hdu.header['CUNIT1P'] = ('PIXEL', 'physical WCS axis 1 unit')
+        hdu.header['CRPIX1P'] = (1, 'reference CCD column')
+        hdu.header['CRVAL1P'] = (x1[k],
+                                 '[pixel] detector coordinate at reference pixel')
+        hdu.header['CDELT1P'] = (1.0, 'physical WCS axis 1 step')
+        hdu.header['CTYPE2P'] = ('RAWY', 'physical WCS axis 2 type CCD row')
+        hdu.header['CUNIT2P'] = ('PIXEL', 'physical WCS axis 2 units')
+        hdu.header['CRPIX2P'] = (1, 'reference CCD row')
+        hdu.header['CRVAL2P'] = (y1[k],
+                                 '[pixel] detector coordinate at reference pixel')
+        hdu.header['CDELT2P'] = (1.0, 'physical WCS axis 2 step')
+        hdus.append(hdu)
+
+    # write output file(s)
+    if split:
+        for hdu in hdus:
+            filename = outfile.split('.fits')[0] + '-' + hdu.name + '.fits'
+            kepmsg.log(logfile, 'Writing output file {}...'.format(filename),
+                       verbose)
+            pyfits.HDUList([hdu0, hdu]).writeto(filename, checksum=True)
+    else:
+        print("Writing output file {}...".format(outfile))
+        pyfits.HDUList([hdu0] + hdus).writeto(outfile, checksum=True)
+    # end time
+    kepmsg.clock('KEPFFISTAMPS finished at', logfile, verbose)
+
+def readtargets(targets, logfile, verbose):
+    """
+    Reads a target list. Targets which are listed more than once are only
+    kept once.
+
+    Returns
+    -------
+    names : list of str
+        Names of the targets: their Kepler IDs, or their coordinates.
+    kepids : list
+        Kepler IDs of the targets, None for targets given by coordinates.
+    coords : list
+        (RA, Dec) of the targets, None for targets given by Kepler ID.
+    """
+    if isinstance(targets, str):
+        items = []
+        lines = kepio.openascii(targets, 'r', logfile, verbose)
+        for line in lines:
+            line = line.split('#')[0].replace(',', ' ').split()
+            if len(line) > 0:
+                items.append(line)
+        kepio.closeascii(lines, logfile, verbose)
+    else:
+        items = [np.atleast_1d(target) for target in targets]
+
+    names, kepids, coords = [], [], []
+    seen = set()
+    for item in items:
+        try:
+            if len(item) == 1:
+                kepid = int(item[0])
+                coord = None
+                name = str(kepid)
+            elif len(item) == 2:
+                kepid = None
+                coord = (float(item[0]), float(item[1]))
+                name = '{:.5f}{:+.5f}'.format(*coord)
+            else:
+                raise ValueError
+        except ValueError:
+            errmsg = ('ERROR -- KEPFFISTAMPS: cannot read target {}'
+                      .format(' '.join(str(i) for i in item)))
+            kepmsg.err(logfile, errmsg, verbose)
+        # each stamp is named after its target
+        if name in seen:
+            txt = ('WARNING -- KEPFFISTAMPS: target {} is listed more than '
+                   'once'.format(name))
+            kepmsg.warn(logfile, txt, verbose)
+            continue
+        seen.add(name)
+        names.append(name)
+        kepids.append(kepid)
+        coords.append(coord)
+    if len(names) == 0:
+        errmsg = 'ERROR -- KEPFFISTAMPS: no targets in {}'.format(targets)
+        kepmsg.err(logfile, errmsg, verbose)
+    return names, kepids, coords
+
+def kepffistamps_main():
+    import argparse
+    parser = argparse.ArgumentParser(
+             description=('Extract postage stamps of many targets from a'
+                          ' Kepler Full Frame Image'),
+             formatter_class=PyKEArgumentHelpFormatter)
+    parser.add_argument('ffifile', help='name of input FFI FITS file',
+                        type=str)
+    parser.add_argument('targets',
+                        help=('name of ASCII target list, with a Kepler ID'
+                              ' or RA and Dec [deg] per line'),
+                        type=str)
+    parser.add_argument('--npix', default=30,
+                        help='pixel dimension of the stamps', type=int)
+    parser.add_argument('--outfile',
+                        help=('Name of FITS file to output.'
+                              ' If None, outfile is ffifile-kepffistamps.'),
+                        default=None)
+    parser.add_argument('--split', action='store_true',
+                        help='Write each stamp to its own file?')
+    parser.add_argument('--catalog', default=None,
+                        help='local target catalog', type=str)
+    parser.add_argument('--overwrite', action='store_true',
+                        help='Overwrite output file?')
+    parser.add_argument('--verbose', action='store_true',
+                        help='Write to a log file?')
+    parser.add_argument('--logfile', '-l', help='Name of ascii log file',
+                        default='kepffistamps.log', type=str)
+    args = parser.parse_args()
+    kepffistamps(args.ffifile, args.targets, args.npix, args.outfile,
+                 args.split, args.catalog, args.overwrite, args.verbose,
+                 args.logfile)
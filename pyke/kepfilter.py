@@ -1,9 +1,8 @@
 from .utils import PyKEArgumentHelpFormatter
-from . import kepio, kepmsg, kepkey, kepfunc, kepstat
+from . import kepio, kepmsg, kepkey, kepconvolve
 from astropy.io import fits as pyfits
 from matplotlib import pyplot as plt
 import numpy as np
-from tqdm import tqdm
 
 
 __all__ = ['kepfilter']
@@ -122,15 +121,9 @@ def kepfilter(infile, passband, outfile=None, datacol='SAP_FLUX', function='boxc
     try:
         nanclean = instr[1].header['NANCLEAN']
     except:
-        naxis2 = 0
-        for i in range(len(table.field(0))):
-            if (np.isfinite(barytime[i]) and np.isfinite(flux[i])
-                and flux[i] != 0.0):
-                table[naxis2] = table[i]
-                naxis2 += 1
-        instr[1].data = table[:naxis2]
-        kepkey.new('NANCLEAN', True, 'NaN cadences removed from data',
-                   instr[1], outfile, logfile, verbose)
+        keep = kepio.finiterows(barytime, flux) & (flux != 0.0)
+        kepio.filterrows(instr[1], keep, outfile, logfile, verbose,
+                         nanclean=True)
 
     ## read table columns
     intime = (kepio.readtimecol(infile, instr[1].data, logfile, verbose)
@@ -140,36 +133,9 @@ def kepfilter(infile, passband, outfile=None, datacol='SAP_FLUX', function='boxc
     ## define data sampling
     tr = 1.0 / (cadence / 86400)
     timescale = 1.0 / (cutoff / tr)
-    ## define convolution function
-    if function == 'boxcar':
-        filtfunc = np.ones(int(np.ceil(timescale)))
-    elif function == 'gauss':
-        timescale /= 2
-        dx = np.ceil(timescale * 10 + 1)
-        filtfunc = kepfunc.gauss([1.0, dx / 2 - 1.0, timescale],
-                                 np.linspace(0, dx - 1, dx))
-    elif function == 'sinc':
-        dx = np.ceil(timescale * 12 + 1)
-        fx = (np.linspace(0, dx - 1, dx) - dx / 2 + 0.5) / timescale
-        filtfunc = np.sinc(fx)
-
-    filtfunc /= np.sum(filtfunc)
-    ## pad time series at both ends with noise model
-    ave, sigma = (np.mean(indata[:len(filtfunc)]),
-                  np.std(indata[:len(filtfunc)]))
-    padded = np.append(kepstat.randarray(np.ones(len(filtfunc)) * ave,
-                       np.ones(len(filtfunc)) * sigma), indata)
-    ave, sigma = (np.mean(indata[-len(filtfunc):]),
-                  np.std(indata[-len(filtfunc):]))
-    padded = np.append(padded, kepstat.randarray(np.ones(len(filtfunc)) * ave,
-                       np.ones(len(filtfunc)) * sigma))
-    ## convolve data
-    convolved = np.convolve(padded,filtfunc,'same')
-    ## remove padding from the output array
-    if function == 'boxcar':
-        outdata = convolved[len(filtfunc):-len(filtfunc)]
-    else:
-        outdata = convolved[len(filtfunc):-len(filtfunc)]
+    ## convolve data, ignoring gaps and the ends of the time series
+    filtfunc = kepconvolve.filterkernel(function, timescale)
+    outdata = kepconvolve.convolve(indata, filtfunc)
     ## subtract low frequencies
     if passband == 'high':
         outmedian = np.median(outdata)
@@ -231,8 +197,8 @@ def kepfilter(infile, passband, outfile=None, datacol='SAP_FLUX', function='boxc
         plt.show()
     ## write output file
     print("Writing output file {}...".format(outfile))
-    for i in tqdm(range(len(outdata))):
-        instr[1].data.field(datacol)[i] = outdata[i]
+    kepio.writefitscol(outfile, instr[1].data, datacol, outdata, logfile,
+                       verbose)
     instr.writeto(outfile)
     ## close input file
     instr.close()
@@ -1,5 +1,5 @@
 from .utils import PyKEArgumentHelpFormatter
-from . import kepio, kepmsg, kepkey, kepfit, kepstat, kepfunc
+from . import kepio, kepmsg, kepkey, kepfit, kepfunc
 import re
 import numpy as np
 import matplotlib.pyplot as plt
@@ -183,7 +183,8 @@ def kepflatten(infile, outfile=None, datacol='PDCSAP_FLUX',
     else:
         work1 = np.array([table.field('time'), datac, err])
     work1 = np.rot90(work1, 3)
-    work1 = work1[~np.isnan(work1).any(1)]
+    finite = ~np.isnan(work1).any(1)
+    work1 = work1[finite]
 
     # read table columns
     intime = work1[:, 2] + bjdref
@@ -195,7 +196,7 @@ def kepflatten(infile, outfile=None, datacol='PDCSAP_FLUX',
 
     # time ranges for region to be corrected
     t1, t2 = kepio.timeranges(ranges, logfile, verbose)
-    cadencelis = kepstat.filterOnRange(intime, t1, t2)
+    inrange = kepio.inranges(intime, t1, t2, closed='neither')
     # find limits of each time step
     tstep1, tstep2 = [], []
     work = intime[0]
@@ -301,10 +302,9 @@ def kepflatten(infile, outfile=None, datacol='PDCSAP_FLUX',
 
     # reject outliers
     rejtime, rejdata = [], []
-    naxis2 = 0
     for i in range(len(masterfit)):
         if (abs(indata[i] - masterfit[i]) > nsig * mastersigma[i]
-            and i in cadencelis):
+            and inrange[i]):
             rejtime.append(intime[i])
             rejdata.append(indata[i])
     rejtime = np.array(rejtime, dtype='float64')
@@ -351,24 +351,9 @@ def kepflatten(infile, outfile=None, datacol='PDCSAP_FLUX',
         plt.savefig(re.sub('.fits', '.png', outfile))
         plt.show()
     # add NaNs back into data
-    n = 0
-    work1 = np.array([], dtype='float32')
-    work2 = np.array([], dtype='float32')
     instr = pyfits.open(infile, 'readonly')
-    table = kepio.readfitstab(infile, instr[1], logfile, verbose)
-    tn = table.field('time')
-    dn = table.field(datacol)
-    for i in range(len(table.field(0))):
-        if np.isfinite(tn[i]) and np.isfinite(dn[i]) and np.isfinite(err[i]):
-            try:
-                work1 = np.append(work1, outdata[n])
-                work2 = np.append(work2, outerr[n])
-                n += 1
-            except:
-                pass
-        else:
-            work1 = np.append(work1, np.nan)
-            work2 = np.append(work2, np.nan)
+    work1 = kepio.expandcol(outdata, finite)
+    work2 = kepio.expandcol(outerr, finite)
 
     # history keyword in output file
     kepkey.history(call, instr[0], outfile, logfile, verbose)
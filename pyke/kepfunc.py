@@ -4,12 +4,12 @@ import numpy as np
 import sys
 import os
 import glob
-from math import modf, cos, sin, radians, exp
+from math import cos, sin, radians, exp
 from scipy import ndimage, interpolate
 from scipy.ndimage import interpolation
 from scipy.ndimage.interpolation import shift, rotate
 from scipy.interpolate import RectBivariateSpline, interp2d
-from . import kepio, kepmsg
+from . import kepio, kepmsg, kepconvolve
 
 
 def poly0(p, x):
@@ -97,8 +97,8 @@ def smooth(x, window_len=10, window='hanning'):
     y = smooth(x)
 
     see also:
-    numpy.hanning, numpy.hamming, numpy.bartlett, numpy.blackman, numpy.convolve
-    scipy.signal.lfilter
+    numpy.hanning, numpy.hamming, numpy.bartlett, numpy.blackman,
+    kepconvolve.convolve
 
     TODO: the window parameter could be the window itself if an array instead of a string
     """
@@ -121,9 +121,10 @@ def smooth(x, window_len=10, window='hanning'):
     if window == 'flat': #moving average
         w = np.ones(window_len,'d')
     else:
-        w = eval("np.{0}(window_len)".format(window))
+        w = getattr(np, window)(window_len)
 
-    y = np.convolve(w / w.sum(), s, mode='same')
+    # NaNs are ignored, see kepconvolve.convolve
+    y = kepconvolve.convolve(s, w / w.sum())
 
     return y[window_len-1:-window_len+1]
 
@@ -263,36 +264,29 @@ def PRFgauss2d(params, *args):
 def PRF2DET(flux, OBJx, OBJy, DATx, DATy, wx, wy, a, splineInterpolation):
     """
     PRF interpolation function
+
+    The PRFs of all sources are evaluated over all pixels in a single call
+    to the spline interpolation and summed weighted by the source fluxes.
     """
 
     # trigonometry
     cosa = np.cos(radians(a))
     sina = np.sin(radians(a))
 
-    # where in the pixel is the source position?
-    PRFfit = np.zeros((np.size(DATy), np.size(DATx)))
-    for i in range(len(flux)):
-        FRCx, INTx = modf(OBJx[i])
-        FRCy, INTy = modf(OBJy[i])
-        if FRCx > 0.5:
-            FRCx -= 1.0
-            INTx += 1.0
-        if FRCy > 0.5:
-            FRCy -= 1.0
-            INTy += 1.0
-        FRCx = -FRCx
-        FRCy = -FRCy
-
-        # constuct model PRF in detector coordinates
-        for (j, y) in enumerate(DATy):
-            for (k, x) in enumerate(DATx):
-                xx = x - INTx + FRCx
-                yy = y - INTy + FRCy
-                dx = xx * cosa - yy * sina
-                dy = xx * sina + yy * cosa
-                PRFfit[j, k] = PRFfit[j, k] + splineInterpolation(dy * wy, dx * wx) * flux[i]
-
-    return PRFfit
+    # offsets between the pixel coordinates and the source positions,
+    # with shape (nsrc, ydim, xdim)
+    flux = np.asarray(flux, dtype='float64').reshape(-1)
+    xx = (np.asarray(DATx, dtype='float64')[np.newaxis, np.newaxis, :]
+          - np.reshape(OBJx, (-1, 1, 1)))
+    yy = (np.asarray(DATy, dtype='float64')[np.newaxis, :, np.newaxis]
+          - np.reshape(OBJy, (-1, 1, 1)))
+    dx = xx * cosa - yy * sina
+    dy = xx * sina + yy * cosa
+
+    # constuct model PRF in detector coordinates
+    PRFfit = splineInterpolation(dy * wy, dx * wx, grid=False)
+
+    return np.tensordot(flux, PRFfit, axes=1)
 
 def PRF(params, *args):
     """
@@ -309,13 +303,9 @@ def PRF(params, *args):
     row = args[7]
 
     # parameters
-    f = np.empty((nsrc))
-    x = np.empty((nsrc))
-    y = np.empty((nsrc))
-    for i in range(nsrc):
-        f[i] = params[i]
-        x[i] = params[nsrc + i]
-        y[i] = params[nsrc * 2 + i]
+    f = np.asarray(params[:nsrc], dtype='float64')
+    x = np.asarray(params[nsrc:nsrc * 2], dtype='float64')
+    y = np.asarray(params[nsrc * 2:nsrc * 3], dtype='float64')
 
     # calculate PRF model binned to the detector pixel size
     PRFfit = PRF2DET(f,x,y,DATx,DATy,1.0,1.0,0.0,splineInterpolation)
@@ -344,13 +334,9 @@ def PRFwithBackground(params, *args):
     row = args[10]
 
     # parameters
-    f = np.empty((nsrc))
-    x = np.empty((nsrc))
-    y = np.empty((nsrc))
-    for i in range(nsrc):
-        f[i] = params[i]
-        x[i] = params[nsrc + i]
-        y[i] = params[nsrc * 2 + i]
+    f = np.asarray(params[:nsrc], dtype='float64')
+    x = np.asarray(params[nsrc:nsrc * 2], dtype='float64')
+    y = np.asarray(params[nsrc * 2:nsrc * 3], dtype='float64')
     b = np.array([params[nsrc * 3:nsrc * 3 + bterms],
                params[nsrc * 3+ bterms:nsrc * 3 + bterms * 2]])
 
@@ -387,13 +373,9 @@ def PRFwithFocusAndBackground(params, *args):
     row = args[10]
 
     # parameters
-    f = np.empty((nsrc))
-    x = np.empty((nsrc))
-    y = np.empty((nsrc))
-    for i in range(nsrc):
-        f[i] = params[i]
-        x[i] = params[nsrc + i]
-        y[i] = params[nsrc * 2 + i]
+    f = np.asarray(params[:nsrc], dtype='float64')
+    x = np.asarray(params[nsrc:nsrc * 2], dtype='float64')
+    y = np.asarray(params[nsrc * 2:nsrc * 3], dtype='float64')
     if bterms == 1:
         b = params[nsrc * 3]
     else:
@@ -437,13 +419,9 @@ def PRFwithFocus(params, *args):
     row = args[7]
 
     # parameters
-    f = np.empty((nsrc))
-    x = np.empty((nsrc))
-    y = np.empty((nsrc))
-    for i in range(nsrc):
-        f[i] = params[i]
-        x[i] = params[nsrc+i]
-        y[i] = params[nsrc*2+i]
+    f = np.asarray(params[:nsrc], dtype='float64')
+    x = np.asarray(params[nsrc:nsrc * 2], dtype='float64')
+    y = np.asarray(params[nsrc * 2:nsrc * 3], dtype='float64')
     wx = params[-3]
     wy = params[-2]
     a = params[-1]
@@ -463,6 +441,46 @@ def PRFwithFocus(params, *args):
 
     return PRFres
 
+_prf_grids = {}
+
+def _prf_grid(prfDimY, prfDimX, prfY0, prfX0):
+    """
+    Row and column coordinates, in PRF pixel units, of the region of the
+    oversampled PRF image covered by the data image.
+
+    The grids are cached since the PRF model functions are evaluated
+    thousands of times with the same geometry during a fit.
+    """
+    prfDimY, prfDimX = int(prfDimY), int(prfDimX)
+    prfY0, prfX0 = int(prfY0), int(prfX0)
+    key = (prfDimY, prfDimX, prfY0, prfX0)
+    if key not in _prf_grids:
+        if len(_prf_grids) >= 64:
+            _prf_grids.clear()
+        yy, xx = np.mgrid[prfY0:prfY0 + prfDimY, prfX0:prfX0 + prfDimX]
+        _prf_grids[key] = (yy.astype('float64'), xx.astype('float64'))
+    return _prf_grids[key]
+
+def _shift_prf(prf, y, x, prfDimY, prfDimX, prfY0, prfX0):
+    """
+    Shift the oversampled PRF image to every source position at once.
+
+    This is equivalent to calling
+    ``shift(prf, [y[i], x[i]], order=1, mode='constant')`` for each source
+    and extracting the region within the data limits, but only the pixels
+    within the data limits are interpolated, in a single call.
+
+    Returns
+    -------
+    models : numpy.array
+        Array of shape (nsrc, prfDimY, prfDimX).
+    """
+    yy, xx = _prf_grid(prfDimY, prfDimX, prfY0, prfX0)
+    y = np.reshape(y, (-1, 1, 1))
+    x = np.reshape(x, (-1, 1, 1))
+    coords = np.array(np.broadcast_arrays(yy - y, xx - x))
+    return ndimage.map_coordinates(prf, coords, order=1, mode='constant')
+
 def kepler_prf_2d(params, *args):
     """the residual between pixel data and 2D Kepler PRF model"""
     data = args[0]
@@ -477,11 +495,8 @@ def kepler_prf_2d(params, *args):
     verbose = args[9]
     f, y, x = params
 
-    # interpolate PRF centroid to new pixel position
-    model = shift(prf, [y, x], order=1, mode='constant')
-
-    # extract the PRF model within the data limits
-    model = model[prfY0:prfY0 + prfDimY, prfX0:prfX0 + prfDimX]
+    # interpolate PRF centroid to new pixel position within the data limits
+    model = _shift_prf(prf, [y], [x], prfDimY, prfDimX, prfY0, prfX0)[0]
 
     # rebin the PRF image to the same size and dimension of the data image
     model = rebin2D(model, [np.shape(data)[0], np.shape(data)[1]],
@@ -518,20 +533,14 @@ def kepler_multi_prf_2d(params, *args):
 
     # parameters
     nsrc = len(params) // 3
-    f = np.empty((nsrc))
-    y = np.empty((nsrc))
-    x = np.empty((nsrc))
-    model = np.zeros((prfDimY + 1, prfDimX + 1))
-    for i in range(nsrc):
-        f[i] = params[i]
-        y[i] = params[nsrc + i]
-        x[i] = params[nsrc * 2 + i]
-
-        # interpolate PRF centroid to new pixel position
-        tmp = shift(prf, [y[i], x[i]], order=1, mode='constant')
+    f = np.asarray(params[:nsrc], dtype='float64')
+    y = np.asarray(params[nsrc:nsrc * 2], dtype='float64')
+    x = np.asarray(params[nsrc * 2:nsrc * 3], dtype='float64')
 
-        # extract the PRF model within the data limits
-        model = model + tmp[prfY0:prfY0 + prfDimY, prfX0:prfX0 + prfDimX] * f[i]
+    # interpolate all PRF centroids to new pixel positions within the data
+    # limits and sum them weighted by flux
+    model = np.tensordot(f, _shift_prf(prf, y, x, prfDimY, prfDimX, prfY0, prfX0),
+                         axes=1)
 
     # rebin the PRF image to the same size and dimension of the data image
     model = rebin2D(model, [np.shape(data)[0], np.shape(data)[1]], interpolation,
@@ -544,7 +553,7 @@ def kepler_multi_prf_2d(params, *args):
     # write out parameters
     if verbose:
         txt = ("\rPearson\'s chisq = {0} for {1} dof"
-               .format(np.nansum(square(data - model) / np.absolute(data)),
+               .format(np.nansum(np.square(data - model) / np.absolute(data)),
                        (np.shape(data)[0] * np.shape(data)[1] - len(params))))
         txt += ' ' * 5
         sys.stdout.write(txt)
@@ -569,21 +578,15 @@ def kepler_bkg_multi_prf_2d(params, *args):
 
     # parameters
     nsrc = (len(params) - 1) // 3
-    f = np.empty((nsrc))
-    y = np.empty((nsrc))
-    x = np.empty((nsrc))
+    f = np.asarray(params[:nsrc], dtype='float64')
+    y = np.asarray(params[nsrc:nsrc * 2], dtype='float64')
+    x = np.asarray(params[nsrc * 2:nsrc * 3], dtype='float64')
     b = params[nsrc * 3]
-    model = np.zeros((prfDimY + 1,prfDimX + 1))
-    for i in range(nsrc):
-        f[i] = params[i]
-        y[i] = params[nsrc + i]
-        x[i] = params[nsrc * 2 + i]
-
-        # interpolate PRF centroid to new pixel position
-        tmp = shift(prf, [y[i], x[i]], order=1, mode='constant')
 
-        # extract the PRF model within the data limits
-        model = model + tmp[prfY0:prfY0 + prfDimY, prfX0:prfX0 + prfDimX] * f[i]
+    # interpolate all PRF centroids to new pixel positions within the data
+    # limits and sum them weighted by flux
+    model = np.tensordot(f, _shift_prf(prf, y, x, prfDimY, prfDimX, prfY0, prfX0),
+                         axes=1)
 
     # rebin the PRF image to the same size and dimension of the data image
     model = rebin2D(model, [np.shape(data)[0], np.shape(data)[1]], interpolation, True,
@@ -620,41 +623,30 @@ def kepler_focus_multi_prf_2d(params,*args):
 
     # parameters
     nsrc = (len(params) - 2) // 3
-    f = np.empty((nsrc))
-    y = np.empty((nsrc))
-    x = np.empty((nsrc))
+    f = np.asarray(params[:nsrc], dtype='float64')
+    y = np.asarray(params[nsrc:nsrc * 2], dtype='float64')
+    x = np.asarray(params[nsrc * 2:nsrc * 3], dtype='float64')
     b = params[nsrc * 3]
     w = params[nsrc * 3 + 1]
     if w > 1.5:
         w = 1.5
     elif w < 1.0:
         w = 1.0
-    for i in range(nsrc):
-        f[i] = params[i]
-        y[i] = params[nsrc + i]
-        x[i] = params[nsrc * 2 + i]
 
     # dimensions of data image if it had PRF-sized pixels
     prfDimY = datDimY / prfDelY / w
     prfDimX = datDimX / prfDelX / w
-    print(w, prfDimY, prfDimX)
 
     # location of the data image centered on the PRF image (in PRF pixel units)
     prfY0 = (np.shape(prf)[0] - prfDimY) / 2
     prfX0 = (np.shape(prf)[1] - prfDimX) / 2
 
-    # iterate over each source identified in the mask, build model
-    DY = 0.0; DX = 0.0
-    if int(prfDimY) % 2 == 0: DY = 1.0
-    if int(prfDimX) % 2 == 0: DX = 1.0
-    model = np.zeros((prfDimY+DY,prfDimX+DX))
-
-    for i in range(nsrc):
-        # interpolate PRF centroid to new pixel position
-        tmp = shift(prf,[y[i]/w,x[i]/w],order=1,mode='constant')
-        # extract the PRF model within the data limits
-        model = model + tmp[prfY0:prfY0+prfDimY,prfX0:prfX0+prfDimX] * f[i]
-        # rebin the PRF image to the same size and dimension of the data image
+    # interpolate all PRF centroids to new pixel positions within the data
+    # limits and sum them weighted by flux
+    model = np.tensordot(f, _shift_prf(prf, y / w, x / w, prfDimY, prfDimX,
+                                      prfY0, prfX0), axes=1)
+
+    # rebin the PRF image to the same size and dimension of the data image
     model = rebin2D(model,[np.shape(data)[0],np.shape(data)[1]],interpolation,True,False)
     model = model / prfDelY / prfDelX / w / w
     # add background to model
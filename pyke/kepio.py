@@ -16,8 +16,9 @@ __all__ = ['delete', 'overwrite', 'openascii', 'closeascii', 'splitfits',
            'readsapqualcol', 'readlctable', 'tabappend', 'readimage',
            'writeimage', 'writefits', 'tmpfile', 'symlink', 'fileexists',
            'move', 'copy', 'parselist', 'createdir', 'createtree',
-           'timeranges', 'cadence', 'timekeys', 'filterNaN', 'readTPF',
-           'readMaskDefinition', 'readPRFimage']
+           'timeranges', 'mergeranges', 'inranges', 'cadence', 'timekeys',
+           'filterNaN', 'readTPF', 'readMaskDefinition', 'readPRFimage',
+           'writefitscol', 'finiterows', 'filterrows', 'expandcol']
 
 
 def delete(filename, logfile, verbose):
@@ -87,6 +88,22 @@ def readfitscol(filename, table, column, logfile, verbose):
         kepmsg.err(logfile, message, verbose)
     return data
 
+def writefitscol(filename, table, column, data, logfile, verbose, rows=None):
+    """
+    Writes ``data`` into a column of a FITS table with a single array
+    assignment. If ``rows`` (a boolean mask or an index array) is given,
+    only those rows are written, otherwise ``data`` must hold one value per
+    row of the table.
+    """
+    if rows is None:
+        rows = slice(None)
+    try:
+        table.field(column)[rows] = data
+    except:
+        message = ('ERROR -- KEPIO.WRITEFITSCOL: could not write '
+                   + column + ' data to ' + filename)
+        kepmsg.err(logfile, message, verbose)
+
 def readtimecol(filename, table, logfile, verbose):
     try:
         data = table.field('TIME')
@@ -419,6 +436,61 @@ def timeranges(ranges, logfile, verbose):
 
     return tstart, tstop
 
+def mergeranges(tstart, tstop, closed='both'):
+    """
+    Sorts time ranges and merges those which overlap or touch into disjoint
+    intervals. ``closed`` ('both', 'left', 'right' or 'neither') tells
+    which ends of the ranges are included, so ranges which only share an
+    excluded end are kept apart. Returns the start and stop times of the
+    merged intervals, in increasing order.
+    """
+    tstart = np.asarray(tstart, dtype='float64')
+    tstop = np.asarray(tstop, dtype='float64')
+    # discard empty ranges
+    if closed == 'both':
+        valid = tstop >= tstart
+    else:
+        valid = tstop > tstart
+    order = np.argsort(tstart[valid], kind='mergesort')
+    tstart = tstart[valid][order]
+    tstop = tstop[valid][order]
+    if len(tstart) == 0:
+        return tstart, tstop
+    # a range starts a new interval if it begins after all previous ones end
+    reach = np.maximum.accumulate(tstop)[:-1]
+    if closed == 'neither':
+        new = tstart[1:] >= reach
+    else:
+        new = tstart[1:] > reach
+    first = np.flatnonzero(np.concatenate([[True], new]))
+    return tstart[first], np.maximum.reduceat(tstop, first)
+
+def inranges(time, tstart, tstop, closed='both'):
+    """
+    Returns a boolean mask of the times which fall within any of the time
+    ranges, e.g. as returned by ``timeranges``.
+
+    The ranges are merged into disjoint intervals by ``mergeranges`` and
+    all times are then looked up with a single call to
+    ``numpy.searchsorted``. ``closed`` ('both', 'left', 'right' or
+    'neither') tells which ends of the ranges are included. NaN times
+    are never within a range.
+    """
+    time = np.asarray(time)
+    start, stop = mergeranges(tstart, tstop, closed)
+    if len(start) == 0:
+        return np.zeros(time.shape, dtype=bool)
+    # index of the last interval starting before each time
+    if closed in ('both', 'left'):
+        i = np.searchsorted(start, time, side='right') - 1
+    else:
+        i = np.searchsorted(start, time, side='left') - 1
+    end = stop[np.maximum(i, 0)]
+    with np.errstate(invalid='ignore'):
+        if closed in ('both', 'right'):
+            return (i >= 0) & (time <= end)
+        return (i >= 0) & (time < end)
+
 def cadence(instr, infile, logfile, verbose):
     """manual calculation of median cadence within a time series"""
     try:
@@ -507,12 +579,43 @@ def timekeys(instr, filename, logfile, verbose):
 
     return tstart, tstop, bjdref, cadence
 
+def finiterows(*columns):
+    """Returns a boolean mask of the rows in which all columns are finite"""
+    keep = np.isfinite(columns[0])
+    for column in columns[1:]:
+        keep &= np.isfinite(column)
+    return keep
+
+def filterrows(hdu, keep, outfile, logfile, verbose, nanclean=False):
+    """
+    Keeps the rows of a table extension flagged by the boolean mask
+    ``keep``, with one fancy-indexing operation on the FITS record array.
+    If ``nanclean`` is True, the NANCLEAN keyword is added to the header
+    of the extension. Returns the filtered table.
+    """
+    hdu.data = hdu.data[np.asarray(keep, dtype=bool)]
+    if nanclean:
+        kepkey.new('NANCLEAN', True, 'NaN cadences removed from data', hdu,
+                   outfile, logfile, verbose)
+    return hdu.data
+
+def expandcol(data, keep, fill=np.nan):
+    """
+    Inverse of ``filterrows`` for a single column: returns an array with
+    one element per entry of the boolean mask ``keep``, holding ``data``
+    where ``keep`` is True and ``fill`` elsewhere.
+    """
+    data = np.asarray(data)
+    dtype = np.result_type(data.dtype, np.min_scalar_type(fill))
+    out = np.full(len(keep), fill, dtype=dtype)
+    out[np.asarray(keep, dtype=bool)] = data
+    return out
+
 def filterNaN(instr, datacol, outfile, logfile, verbose):
     """filter input data table"""
     try:
         nanclean = instr[1].header['NANCLEAN']
     except:
-        naxis2 = 0
         for i in range(len(instr[1].columns.names)):
             if 'time' in instr[1].columns.names[i].lower():
                 timecol = instr[1].columns.names[i]
@@ -523,15 +626,10 @@ def filterNaN(instr, datacol, outfile, logfile, verbose):
                    "in the infile".format(datacol))
             kepmsg.err(logfile, msg, verbose)
         try:
-            for i in range(len(instr[1].data.field(0))):
-                if (str(instr[1].data.field(timecol)[i]) != '-inf' and
-                    str(instr[1].data.field(datacol)[i]) != '-inf'):
-                    instr[1].data[naxis2] = instr[1].data[i]
-                    naxis2 += 1
-            instr[1].data = instr[1].data[:naxis2]
-            comment = 'NaN cadences removed from data'
-            kepkey.new('NANCLEAN', True, comment, instr[1], outfile, logfile,
-                       verbose)
+            keep = ~(np.isneginf(instr[1].data.field(timecol))
+                     | np.isneginf(instr[1].data.field(datacol)))
+            filterrows(instr[1], keep, outfile, logfile, verbose,
+                       nanclean=True)
         except:
             errmsg = ('ERROR -- KEPIO.FILTERNAN: Failed to filter NaNs from '
                       + outfile)
@@ -679,38 +777,35 @@ def readMaskDefinition(infile, logfile, verbose):
     """read target pixel mask data"""
 
     # open input file
-    inf = pyfits.open(infile, 'readonly')
+    inf = pyfits.open(infile, 'readonly', memmap=True)
 
     # read bitmap image
     try:
         img = inf['APERTURE'].data
     except:
-        txt = ('WARNING -- KEPIO.READMASKDEFINITION: Cannot read mask '
+        txt = ('ERROR -- KEPIO.READMASKDEFINITION: Cannot read mask '
                'defintion in ' + infile + '[APERTURE]')
-        kepwarn.err(txt, logfile)
+        kepmsg.err(logfile, txt, verbose)
     try:
         naxis1 = inf['APERTURE'].header['NAXIS1']
     except:
-        txt = ('WARNING -- KEPIO.READMASKDEFINITION: Cannot read NAXIS1 '
+        txt = ('ERROR -- KEPIO.READMASKDEFINITION: Cannot read NAXIS1 '
                'keyword in ' + infile + '[APERTURE]')
-        kepwarn.err(txt, logfile)
+        kepmsg.err(logfile, txt, verbose)
     try:
         naxis2 = inf['APERTURE'].header['NAXIS2']
     except:
-        txt = ('WARNING -- KEPIO.READMASKDEFINITION: Cannot read NAXIS2 '
+        txt = ('ERROR -- KEPIO.READMASKDEFINITION: Cannot read NAXIS2 '
                'keyword in ' + infile + '[APERTURE]')
-        kepwarn.err(txt, logfile)
+        kepmsg.err(logfile, txt, verbose)
 
     # read WCS keywords
-    crpix1p, crpix2p, crval1p, crval2p, cdelt1p, cdelt2p = kepkey.getWCSp(
-            infile, inf['APERTURE'], logfile, verbose)
-
-    pixelcoord1 = np.zeros((naxis1, naxis2))
-    pixelcoord2 = np.zeros((naxis1, naxis2))
-    for j in range(naxis2):
-        for i in range(naxis1):
-            pixelcoord1[i, j] = kepkey.wcs(i, crpix1p, crval1p, cdelt1p)
-            pixelcoord2[i, j] = kepkey.wcs(j, crpix2p, crval2p, cdelt2p)
+    wcskeys = kepkey.getWCSp(infile, inf['APERTURE'], logfile, verbose)
+
+    # pixel coordinates, indexed as [NAXIS1, NAXIS2]
+    coord1, coord2 = kepkey.wcsgrid((naxis2, naxis1), *wcskeys)
+    pixelcoord1 = coord1.T
+    pixelcoord2 = coord2.T
     # close input file
     inf.close()
     return img, pixelcoord1, pixelcoord2
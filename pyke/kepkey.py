@@ -1,10 +1,16 @@
 from . import kepmsg
+from collections import OrderedDict
 import numpy as np
 from astropy.io import fits as pyfits
 
 
 __all__ = ['get', 'remove', 'new', 'comment', 'history', 'change', 'cadence',
-           'getWCSp', 'getWCSs', 'wcs', 'emptykeys']
+           'getWCSp', 'getWCSs', 'wcs', 'wcsgrid', 'getWCSgrid', 'emptykeys']
+
+
+# pixel coordinate grids of the most recently requested WCS solutions
+_WCSGRID_CACHE = OrderedDict()
+_WCSGRID_CACHE_SIZE = 32
 
 
 def get(filename, hdu, keyword, logfile, verbose):
@@ -219,6 +225,54 @@ def wcs(i, crpix, crval, cdelt):
     return crval + (float(i + 1) - crpix) * cdelt
 
 
+def wcsgrid(shape, crpix1p, crpix2p, crval1p, crval2p, cdelt1p, cdelt2p):
+    """
+    Returns the physical WCS coordinates of every pixel of an image.
+
+    The grids are built with broadcasting and kept in a bounded cache keyed
+    on the image shape and the WCS keywords, so that the many target pixel
+    files which share a mask geometry compute them only once.
+
+    Parameters
+    ----------
+    shape : tuple
+        Shape ``(nrow, ncol)`` of the image, i.e. ``(NAXIS2, NAXIS1)``.
+    crpix1p, crpix2p, crval1p, crval2p, cdelt1p, cdelt2p : float
+        Physical WCS keywords, as returned by ``getWCSp``.
+
+    Returns
+    -------
+    coord1, coord2 : ndarray
+        Column and row coordinates, of shape ``shape``, such that
+        ``coord1[i, j] == wcs(j, crpix1p, crval1p, cdelt1p)`` and
+        ``coord2[i, j] == wcs(i, crpix2p, crval2p, cdelt2p)``. The arrays
+        are shared through the cache and are read-only.
+    """
+    key = (tuple(int(n) for n in shape), crpix1p, crpix2p, crval1p, crval2p,
+           cdelt1p, cdelt2p)
+    if key in _WCSGRID_CACHE:
+        _WCSGRID_CACHE[key] = _WCSGRID_CACHE.pop(key)
+        return _WCSGRID_CACHE[key]
+    nrow, ncol = key[0]
+    col = crval1p + (np.arange(ncol, dtype='float64') + 1.0 - crpix1p) * cdelt1p
+    row = crval2p + (np.arange(nrow, dtype='float64') + 1.0 - crpix2p) * cdelt2p
+    coord1, coord2 = np.broadcast_arrays(col[np.newaxis, :], row[:, np.newaxis])
+    coord1 = np.array(coord1)
+    coord2 = np.array(coord2)
+    coord1.flags.writeable = False
+    coord2.flags.writeable = False
+    _WCSGRID_CACHE[key] = (coord1, coord2)
+    while len(_WCSGRID_CACHE) > _WCSGRID_CACHE_SIZE:
+        _WCSGRID_CACHE.popitem(last=False)
+    return coord1, coord2
+
+
+def getWCSgrid(filename, struct, logfile, verbose):
+    """get physical WCS coordinates of every pixel of an image extension"""
+    shape = (struct.header['NAXIS2'], struct.header['NAXIS1'])
+    return wcsgrid(shape, *getWCSp(filename, struct, logfile, verbose))
+
+
 def emptykeys(struct, filename, logfile, verbose):
     """remove empty keywords within a FITS file"""
     nhdu = HDUnum(struct)
@@ -2,7 +2,6 @@ from .utils import PyKEArgumentHelpFormatter
 import numpy as np
 from astropy.io import fits as pyfits
 from matplotlib import pyplot as plt
-from tqdm import tqdm
 from . import kepio, kepmsg, kepkey, kepfit, kepstat, kepfunc
 
 
@@ -147,12 +146,9 @@ def kepoutlier(infile, outfile=None, datacol='SAP_FLUX', nsig=3.0, stepsize=1.0,
     except:
         time = kepio.readtimecol(infile, table, logfile, verbose)
         flux = kepio.readfitscol(infile, table, datacol, logfile, verbose)
-        finite_data_mask = np.isfinite(time) & np.isfinite(flux) & (flux != 0)
-        table = table[finite_data_mask]
-        instr[1].data = table
-        comment = 'NaN cadences removed from data'
-        kepkey.new('NANCLEAN', True, comment, instr[1], outfile, logfile,
-                   verbose)
+        keep = kepio.finiterows(time, flux) & (flux != 0)
+        table = kepio.filterrows(instr[1], keep, outfile, logfile, verbose,
+                                 nanclean=True)
 
     # read table columns
     try:
@@ -166,7 +162,7 @@ def kepoutlier(infile, outfile=None, datacol='SAP_FLUX', nsig=3.0, stepsize=1.0,
     indata = indata / cadenom
     # time ranges for region to be corrected
     t1, t2 = kepio.timeranges(ranges, logfile, verbose)
-    cadencelis = kepstat.filterOnRange(intime, t1, t2)
+    inrange = kepio.inranges(intime, t1, t2, closed='neither')
 
     # find limits of each time step
     tstep1, tstep2 = [], []
@@ -265,22 +261,17 @@ def kepoutlier(infile, outfile=None, datacol='SAP_FLUX', nsig=3.0, stepsize=1.0,
             kepmsg.warn(logfile, message, verbose)
 
     # reject outliers
-    rejtime, rejdata = [], []
-    naxis2 = 0
-    for i in tqdm(range(len(masterfit))):
-        if (abs(indata[i] - masterfit[i]) > nsig * mastersigma[i]
-            and i in cadencelis):
-            rejtime.append(intime[i])
-            rejdata.append(indata[i])
-            if operation == 'replace':
-                [rnd] = kepstat.randarray([masterfit[i]], [mastersigma[i]])
-                table[naxis2] = table[i]
-                table.field(datacol)[naxis2] = rnd
-                naxis2 += 1
-        else:
-            table[naxis2] = table[i]
-            naxis2 += 1
-    instr[1].data = table[:naxis2]
+    with np.errstate(invalid='ignore'):
+        reject = (np.abs(indata - masterfit) > nsig * mastersigma) & inrange
+    rejtime = intime[reject]
+    rejdata = indata[reject]
+    instr[1].data = table
+    if operation == 'replace':
+        rnd = kepstat.randarray(masterfit[reject], mastersigma[reject])
+        kepio.writefitscol(outfile, instr[1].data, datacol, rnd, logfile,
+                           verbose, rows=reject)
+    else:
+        kepio.filterrows(instr[1], ~reject, outfile, logfile, verbose)
 
     if plot:
         rejtime = np.array(rejtime, dtype='float64')
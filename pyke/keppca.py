@@ -3,9 +3,7 @@ from . import kepmsg, kepio, kepkey, kepplot
 import re
 import numpy as np
 from astropy.io import fits as pyfits
-from scipy import optimize as opt
 from matplotlib import pyplot as plt
-from tqdm import tqdm
 import random
 
 
@@ -13,7 +11,8 @@ __all__ = ['keppca']
 
 
 def keppca(infile, outfile=None, maskfile='ALL', components='1-3', plotpca=False,
-           nmaps=10, overwrite=False, verbose=False, logfile='keppca.log'):
+           nmaps=10, overwrite=False, verbose=False, logfile='keppca.log',
+           ncomponents=None, method='randomized', blocksize=None):
     """
     keppca -- Perform principal component analysis upon a target pixel file
 
@@ -35,14 +34,15 @@ def keppca(infile, outfile=None, maskfile='ALL', components='1-3', plotpca=False
     this analysis. Principal components are plotted by the tool and written out
     to an output FITS file in an output extension called PRINCIPAL_COMPONENTS.
     The extension contains a 2D table with one row per timestamp recorded in
-    the input file and one column for every principal component. Summing all
-    principal components together will reconstruct a normalized version of the
-    summed pixel within the chosen aperture. The user also has the choice of
-    which principal components to optimally-subtract from the aperture-derived
-    light curve in order to remove motion systematics from the time-series
-    data. The aperture light curve and the corrected light curve are written to
-    the LIGHTCURVE extension of the output file. The first populates the
-    SAP_FLUX data column and the second is written to a column called PCA_FLUX.
+    the input file and one column for each of the leading principal components
+    which were computed (see ``ncomponents``). Summing the principal components
+    together approximates a normalized version of the summed pixel within the
+    chosen aperture. The user also has the choice of which principal components
+    to optimally-subtract from the aperture-derived light curve in order to
+    remove motion systematics from the time-series data. The aperture light
+    curve and the corrected light curve are written to the LIGHTCURVE
+    extension of the output file. The first populates the SAP_FLUX data column
+    and the second is written to a column called PCA_FLUX.
     This output file can be used as input for other PyKE tasks and can be e.g.
     inspected using kepdraw.
 
@@ -59,7 +59,12 @@ def keppca(infile, outfile=None, maskfile='ALL', components='1-3', plotpca=False
         curve with principal components subtracted is stored in column PCA_FLUX
         and a normalized version is stored in PCA_FLUX_NRM. The individual
         principal components are stored within a new FITS extension called
-        PRINCIPAL_COMPONENTS.
+        PRINCIPAL_COMPONENTS, which has a TIME column followed by the columns
+        PC1 to PCn, one per computed component. Note that n is the number of
+        computed components, ``ncomponents``, and no longer the number of
+        pixels in the mask: files written by earlier versions of keppca have
+        one PC column per mask pixel. The number of components is also given
+        by the NCOMP keyword of the extension header.
     maskfile : str
         This string can be one of three options:
 
@@ -98,6 +103,25 @@ def keppca(infile, outfile=None, maskfile='ALL', components='1-3', plotpca=False
         Print informative messages and warnings to the shell and logfile?
     logfile : str
         Name of the logfile containing error and warning message
+    ncomponents : int or None
+        The number of principal components to compute. Only the leading
+        components are computed, which is much faster than a full
+        decomposition for masks of thousands of pixels. If None, it is set to
+        the largest component in ``components`` (or ``nmaps``, if larger and
+        ``plotpca`` is True).
+    method : str
+        Method used to compute the leading principal components, either
+        'randomized' (randomized truncated SVD) or 'svd' (exact SVD).
+    blocksize : int or None
+        If given, the pixel time series are never held in memory as a whole.
+        Instead, blocks of ``blocksize`` cadences are read from the input file
+        and the principal components are found by incremental PCA (Ross et
+        al. 2008), which updates the pixel means, standard deviations and the
+        leading singular vectors one block at a time. A second pass over the
+        blocks projects the data onto the components. Memory use then scales
+        with ``blocksize`` rather than with the length of the observations,
+        at the cost of a slightly approximate decomposition. ``method`` is
+        ignored in this case.
 
     Examples
     --------
@@ -109,8 +133,6 @@ def keppca(infile, outfile=None, maskfile='ALL', components='1-3', plotpca=False
         :align: center
     """
 
-    import mdp
-
     if outfile is None:
         outfile = infile.split('.')[0] + "-{}.fits".format(__all__[0])
     # log the call
@@ -125,7 +147,10 @@ def keppca(infile, outfile=None, maskfile='ALL', components='1-3', plotpca=False
             + ' nmaps={}'.format(nmaps)
             + ' overwrite={}'.format(overwrite)
             + ' verbose={}'.format(verbose)
-            + ' logfile={}'.format(logfile))
+            + ' logfile={}'.format(logfile)
+            + ' ncomponents={}'.format(ncomponents)
+            + ' method={}'.format(method)
+            + ' blocksize={}'.format(blocksize))
     kepmsg.log(logfile, call + '\n', verbose)
 
     kepmsg.clock('KEPPCA started at', logfile, verbose)
@@ -168,14 +193,6 @@ def keppca(infile, outfile=None, maskfile='ALL', components='1-3', plotpca=False
     ra, dec, column, row, kepmag, xdim, ydim, errpixels = \
     kepio.readTPF(infile, 'FLUX_ERR', logfile, verbose)
 
-    kepid, channel, skygroup, module, output, quarter, season, \
-    ra, dec, column, row, kepmag, xdim, ydim, flux_bkg = \
-    kepio.readTPF(infile, 'FLUX_BKG', logfile, verbose)
-
-    kepid, channel, skygroup, module, output, quarter, season, \
-    ra, dec, column, row, kepmag, xdim, ydim, flux_bkg_err = \
-    kepio.readTPF(infile, 'FLUX_BKG_ERR', logfile, verbose)
-
     kepid, channel, skygroup, module, output, quarter, season, \
     ra, dec, column, row, kepmag, xdim, ydim, qual = \
     kepio.readTPF(infile, 'QUALITY', logfile, verbose)
@@ -217,19 +234,14 @@ def keppca(infile, outfile=None, maskfile='ALL', components='1-3', plotpca=False
         ydim = max(masky) - min(masky) + 1   # Find largest y dimension of mask
 
         # pad mask to ensure it is rectangular
-        workx = np.array([], 'int')
-        worky = np.array([], 'int')
-        for ip in np.arange(min(maskx), max(maskx) + 1):
-            for jp in np.arange(min(masky), max(masky) + 1):
-                workx = np.append(workx, ip)
-                worky = np.append(worky, jp)
-        maskx = workx
-        masky = worky
+        maskx, masky = np.meshgrid(np.arange(min(maskx), max(maskx) + 1),
+                                   np.arange(min(masky), max(masky) + 1),
+                                   indexing='ij')
+        maskx = maskx.ravel()
+        masky = masky.ravel()
 
     # define new subimage bitmap...
     if maskfile.lower() != 'all':
-        aperx = np.array([], 'int')
-        apery = np.array([], 'int')
         # aperb is an array that contains the pixel numbers in the mask
         aperb = maskx - x0 + xdimorig * (masky - y0)
         npix = len(aperb)
@@ -260,132 +272,93 @@ def keppca(infile, outfile=None, maskfile='ALL', components='1-3', plotpca=False
             except:
                 errmsg = ('ERROR -- KEPPCA: cannot understand principal'
                           ' component list requested')
-                kepmsg.err(logfile, message, verbose)
+                kepmsg.err(logfile, errmsg, verbose)
 
     pcaout = set(np.sort(pcaout))
     # The list of pca component numbers to be removed
     pcarem = np.array(list(pcaout)) - 1
 
-    # Initialize arrays and variables, and apply pixel mask to the data
-    ntim = 0
-    time = np.array([], dtype='float64')
-    timecorr = np.array([], dtype='float32')
-    cadenceno = np.array([], dtype='int')
-    pixseries = np.array([], dtype='float32')
-    errseries = np.array([], dtype='float32')
-    bkgseries = np.array([], dtype='float32')
-    berseries = np.array([], dtype='float32')
-    quality = np.array([], dtype='float32')
-    pos_corr1 = np.array([], dtype='float32')
-    pos_corr2 = np.array([], dtype='float32')
-    nrows = np.size(fluxpixels, 0)
-
-    # Apply the pixel mask so we are left with only the desired pixels
-    pixseriesb = fluxpixels[:, aperb]
-    errseriesb = errpixels[:, aperb]
-    bkgseriesb = flux_bkg[:, aperb]
-    berseriesb = flux_bkg_err[:, aperb]
-
-    # Read in the data to various arrays
-    for i in range(nrows):
-        if (qual[i] < 10000 and np.isfinite(barytime[i])
-            and np.isfinite(fluxpixels[i, int(ydim * xdim / 2 + 0.5)])
-            and np.isfinite(fluxpixels[i, 1 + int(ydim * xdim / 2 + 0.5)])):
-            ntim += 1
-            time = np.append(time, barytime[i])
-            timecorr = np.append(timecorr, tcorr[i])
-            cadenceno = np.append(cadenceno, cadno[i])
-            pixseries = np.append(pixseries, pixseriesb[i])
-            errseries = np.append(errseries, errseriesb[i])
-            bkgseries = np.append(bkgseries, bkgseriesb[i])
-            berseries = np.append(berseries, berseriesb[i])
-            quality = np.append(quality, qual[i])
-            pos_corr1 = np.append(pos_corr1, pcorr1[i])
-            pos_corr2 = np.append(pos_corr2, pcorr2[i])
-    pixseries = np.reshape(pixseries,(ntim, npix))
-    errseries = np.reshape(errseries,(ntim, npix))
-    bkgseries = np.reshape(bkgseries,(ntim, npix))
-    berseries = np.reshape(berseries,(ntim, npix))
-    tmp =  np.ma.median(np.ma.masked_invalid(pixseries), axis=1)
-
-    for i in range(len(tmp)):
-         pixseries[i] = pixseries[i] - tmp[i]
-    pixseries = np.ma.masked_invalid(pixseries)
+    # Select the good cadences
+    center = int(ydim * xdim / 2 + 0.5)
+    good = ((qual < 10000) & np.isfinite(barytime)
+            & np.isfinite(fluxpixels[:, center])
+            & np.isfinite(fluxpixels[:, center + 1]))
+    time = barytime[good]
+    timecorr = tcorr[good]
+    cadenceno = cadno[good]
+    quality = qual[good]
+    pos_corr1 = pcorr1[good]
+    pos_corr2 = pcorr2[good]
 
     # Figure out which pixels are undefined/nan and remove them.
     # Keep track for adding back in later
-    nanpixels = np.array([], dtype='int')
-    i = 0
-    while i < npix:
-        if np.isnan(pixseries[0, i]):
-            nanpixels = np.append(nanpixels, i)
-            npix = npix - 1
-        i = i + 1
-    pixseries = np.delete(pixseries, nanpixels, 1)
-    errseries = np.delete(errseries, nanpixels, 1)
-    pixseries[np.isnan(pixseries)] = random.gauss(100, 10)
-    errseries[np.isnan(errseries)] = 10
-
-    # Compute statistical weights, means, standard deviations
-    weightseries = (pixseries / errseries) ** 2
-    pixMean = np.average(pixseries, axis=0, weights=weightseries)
-    pixStd  = np.std(pixseries, axis=0)
-
-    # Normalize the input by subtracting the mean and divising by the standard
-    # deviation.
-    # This makes it a correlation-based PCA, which is what we want.
-    pixseriesnorm = (pixseries - pixMean) / pixStd
-
-    # Number of principal components to compute. Setting it equal to the number
-    # of pixels
-    nvecin = npix
-
-    # Run PCA using the MDP Whitening PCA, which produces normalized PCA
-    # components (zero mean and unit variance)
-    pcan = mdp.nodes.WhiteningNode(svd=True)
-    pcar = pcan.execute(pixseriesnorm)
-    eigvec = pcan.get_recmatrix()
+    first = np.flatnonzero(good)[:1]
+    nanpixels = np.where(np.isnan(fluxpixels[first][:, aperb]).all(axis=0))[0]
+    npix = npix - len(nanpixels)
+    fill = random.gauss(100, 10)
+
+    # Number of principal components to compute. Only the components which
+    # are removed or plotted are needed
+    if ncomponents is None:
+        ncomponents = max(max(pcaout), nmaps if plotpca else 0)
+    nvecin = min(ncomponents, npix, len(time))
+    if max(pcaout) > nvecin:
+        errmsg = ('ERROR -- KEPPCA: cannot remove principal component {}, '
+                  'only {} were computed'.format(max(pcaout), nvecin))
+        kepmsg.err(logfile, errmsg, verbose)
+    nmaps = min(nmaps, nvecin)
+
+    # Run PCA, producing normalized PCA components (zero mean and unit
+    # variance) and the matrix which reconstructs the input from them
+    if blocksize is None:
+        # Apply the pixel mask so we are left with only the desired pixels
+        pixseries, errseries = _pixel_series(fluxpixels[good], errpixels[good],
+                                             aperb, nanpixels, fill)
+
+        # Compute statistical weights, means, standard deviations
+        weightseries = (pixseries / errseries) ** 2
+        pixMean = np.average(pixseries, axis=0, weights=weightseries)
+        pixStd  = np.std(pixseries, axis=0)
+
+        # Normalize the input by subtracting the mean and divising by the
+        # standard deviation.
+        # This makes it a correlation-based PCA, which is what we want.
+        pixseriesnorm = (pixseries - pixMean) / pixStd
+        pcar, eigvec = _pca(pixseriesnorm, nvecin, method)
+
+        # Calculate sum of all pixels to display as raw lightcurve and other
+        # quantities
+        pixseriessum = np.sum(pixseries, axis=1)
+    else:
+        # Stream the pixel time series through memory in blocks of cadences
+        def blocks():
+            for start in range(0, len(good), blocksize):
+                sel = good[start:start + blocksize]
+                yield _pixel_series(fluxpixels[start:start + blocksize][sel],
+                                    errpixels[start:start + blocksize][sel],
+                                    aperb, nanpixels, fill)
+        pcar, eigvec, pixMean, pixseriessum = _incremental_pca(blocks, nvecin)
     model = pcar
 
     # Re-insert nan columns as zeros
-    for i in range(len(nanpixels)):
-        nanpixels[i] = nanpixels[i] - i
+    nanpixels = nanpixels - np.arange(len(nanpixels))
     eigvec = np.insert(eigvec, nanpixels, 0, 1)
     pixMean = np.insert(pixMean, nanpixels, 0, 0)
 
     #  Make output eigenvectors (correlation images) into xpix by ypix images
     eigvec = eigvec.reshape(nvecin, ydim, xdim)
-    # Calculate sum of all pixels to display as raw lightcurve and other quantities
-    pixseriessum = np.sum(pixseries, axis=1)
     # Number of components to remove
     nrem = len(pcarem)
-    # Number of pcas to plot - currently set to plot all components, but could set
-    # nplot = nrem to just plot as many components as is being removed
-    nplot = npix
-
-    # Subtract components by fitting them to the summed light curve
-    x0 = np.tile(-1.0, 1)
-    for k in tqdm(range(nrem)):
-        def f(x):
-            fluxcor = pixseriessum
-            for k in range(len(x)):
-                fluxcor = fluxcor - x[k]*model[:, pcarem[k]]
-            return mad(fluxcor)
-        if k == 0:
-            x0 = np.array([-1.0])
-        else:
-            x0 = np.append(x0, 1.0)
-        myfit = opt.fmin(f, x0, maxiter=50000, maxfun=50000, disp=False)
-        x0 = myfit
+
+    # Subtract components by fitting them to the summed light curve,
+    # minimizing the mean absolute deviation of the residuals
+    c = _robust_fit(model[:, pcarem], pixseriessum)
 
     # Now that coefficients for all components have been found, subtract them
     # to produce a calibrated time-series,
     # and then divide by the robust mean to produce a normalized time series
     # as well
-    c = myfit
-    fluxcor = pixseriessum
-    for k in range(0, nrem):
-        fluxcor = fluxcor - c[k] * model[:, pcarem[k]]
+    fluxcor = pixseriessum - np.dot(model[:, pcarem], c)
 
     normfluxcor = fluxcor / np.nanmean(reject_outliers(fluxcor, 2))
 
@@ -434,17 +407,14 @@ def keppca(infile, outfile=None, maskfile='ALL', components='1-3', plotpca=False
 
     # mask bitmap
     if 'aper' not in maskfile.lower() and maskfile.lower() != 'all':
-        for i in range(maskmap.shape[0]):
-            for j in range(maskmap.shape[1]):
-                aperx = append(aperx,crval1p + (j + 1 - crpix1p) * cdelt1p)
-                apery = append(apery,crval2p + (i + 1 - crpix2p) * cdelt2p)
-                if maskmap[i, j] == 0:
-                    pass
-                else:
-                    maskmap[i, j] = 1
-                    for k in range(len(maskx)):
-                        if aperx[-1] == maskx[k] and apery[-1] == masky[k]:
-                            maskmap[i, j] = 3
+        aperx, apery = kepkey.wcsgrid(maskmap.shape, crpix1p, crpix2p,
+                                      crval1p, crval2p, cdelt1p, cdelt2p)
+        maskpix = set(zip(maskx, masky))
+        inmask = np.array([pix in maskpix
+                           for pix in zip(aperx.ravel(), apery.ravel())],
+                          dtype=bool).reshape(maskmap.shape)
+        maskmap[maskmap != 0] = 1
+        maskmap[(maskmap != 0) & inmask] = 3
 
     # construct output primary extension
     hdu0 = pyfits.PrimaryHDU()
@@ -620,6 +590,7 @@ def keppca(infile, outfile=None, maskfile='ALL', components='1-3', plotpca=False
         cols.append(col)
     hdu3 = pyfits.BinTableHDU.from_columns(pyfits.ColDefs(cols))
     hdu3.header['EXTNAME'] = ('PRINCIPAL_COMPONENTS', 'name of extension')
+    hdu3.header['NCOMP'] = (nvecin, 'number of principal components')
     hdu3.header['TTYPE1'] = ('TIME', 'column title: data time stamps')
     hdu3.header['TFORM1'] = ('D', 'data type: float64')
     hdu3.header['TUNIT1'] = ('BJD - 2454833',
@@ -752,6 +723,162 @@ def reject_outliers(data, m):
         print("Warning: Could not reject outliers.")
         return data
 
+def _pca(data, ncomponents, method='randomized', oversample=10, niter=4,
+         seed=0):
+    """
+    Leading principal components of the columns of ``data``.
+
+    Parameters
+    ----------
+    data : ndarray
+        Array of shape (ntimes, npixels).
+    ncomponents : int
+        Number of principal components to compute.
+    method : str
+        'randomized' uses a randomized range finder with ``niter`` power
+        iterations (Halko, Martinsson & Tropp 2011), 'svd' an exact SVD.
+
+    Returns
+    -------
+    components : ndarray
+        Array of shape (ntimes, ncomponents) of whitened principal components,
+        i.e., with zero mean and unit variance.
+    recmatrix : ndarray
+        Array of shape (ncomponents, npixels) such that
+        ``components.dot(recmatrix)`` approximates the mean-subtracted data.
+    """
+    data = data - np.mean(data, axis=0)
+    if method == 'randomized':
+        nsamples = ncomponents + oversample
+        if nsamples < min(data.shape):
+            rng = np.random.RandomState(seed)
+            q = np.linalg.qr(np.dot(data, rng.normal(size=(data.shape[1],
+                                                           nsamples))))[0]
+            for _ in range(niter):
+                q = np.linalg.qr(np.dot(data.T, q))[0]
+                q = np.linalg.qr(np.dot(data, q))[0]
+            u, s, vt = np.linalg.svd(np.dot(q.T, data), full_matrices=False)
+            u = np.dot(q, u)
+        else:
+            u, s, vt = np.linalg.svd(data, full_matrices=False)
+    elif method == 'svd':
+        u, s, vt = np.linalg.svd(data, full_matrices=False)
+    else:
+        raise ValueError("method must be 'randomized' or 'svd', got {}"
+                         .format(method))
+    u, s, vt = u[:, :ncomponents], s[:ncomponents], vt[:ncomponents]
+    signs = _signs(vt)
+    scale = np.sqrt(max(len(data) - 1, 1))
+    return u * signs * scale, (signs * s / scale)[:, None] * vt
+
+def _incremental_pca(blocks, ncomponents):
+    """
+    Leading principal components of the normalized pixel time series,
+    computed one block of cadences at a time.
+
+    Parameters
+    ----------
+    blocks : callable
+        Function which returns an iterator over (pixseries, errseries) blocks
+        of consecutive cadences, as returned by ``_pixel_series``. It is
+        called twice.
+    ncomponents : int
+        Number of principal components to compute.
+
+    Returns
+    -------
+    components, recmatrix : ndarray
+        As returned by ``_pca`` for the mean-subtracted data normalized by
+        the standard deviation of each pixel.
+    pixmean : ndarray
+        Mean of each pixel weighted by its signal-to-noise squared.
+    pixsum : ndarray
+        Sum of the pixels at each cadence.
+    """
+    n = 0
+    wsum = wxsum = 0.
+    pixsum = []
+    for pixseries, errseries in blocks():
+        m = len(pixseries)
+        if m == 0:
+            continue
+        pixseries = pixseries.astype(float)
+        weights = (pixseries / errseries) ** 2
+        wsum += np.sum(weights, axis=0)
+        wxsum += np.sum(weights * pixseries, axis=0)
+        pixsum.append(np.sum(pixseries, axis=1))
+
+        # update the mean and variance of each pixel (Chan et al. 1979)
+        block_mean = np.mean(pixseries, axis=0)
+        block_m2 = np.sum((pixseries - block_mean) ** 2, axis=0)
+        if n == 0:
+            new_mean, m2 = block_mean, block_m2
+        else:
+            delta = block_mean - mean
+            new_mean = mean + delta * m / (n + m)
+            m2 = m2 + block_m2 + delta ** 2 * n * m / (n + m)
+        new_scale = np.sqrt(m2 / (n + m))
+
+        # update the low-rank basis, rescaled to the new standard deviations
+        stack = [(pixseries - block_mean) / new_scale]
+        if n > 0:
+            stack = [basis * (scale / new_scale)] + stack
+            stack.append(np.sqrt(n * m / (n + m))
+                         * (mean - block_mean) / new_scale)
+        u, s, vt = np.linalg.svd(np.vstack(stack), full_matrices=False)
+        basis = s[:ncomponents, None] * vt[:ncomponents]
+        mean, scale, n = new_mean, new_scale, n + m
+
+    s = np.sqrt(np.sum(basis ** 2, axis=1))
+    vt = basis / s[:, None] * _signs(basis)[:, None]
+    norm = np.sqrt(max(n - 1, 1))
+    components = np.vstack([np.dot((pixseries - mean) / scale, vt.T)
+                            for pixseries, _ in blocks() if len(pixseries)])
+    return (components * norm / s, (s / norm)[:, None] * vt, wxsum / wsum,
+            np.concatenate(pixsum))
+
+def _signs(vt):
+    """Signs which make the largest element of each row of ``vt`` positive,
+    fixing the sign ambiguity of singular vectors."""
+    signs = np.sign(vt[np.arange(len(vt)), np.argmax(np.abs(vt), axis=1)])
+    signs[signs == 0] = 1
+    return signs
+
+def _pixel_series(flux, flux_err, aperb, nanpixels, fill):
+    """
+    Pixel time series within the mask ``aperb`` of a set of cadences, minus
+    the median of each cadence, with the pixels ``nanpixels`` removed and
+    remaining NaNs replaced by ``fill`` (or 10 for the errors).
+    """
+    pixseries = flux[:, aperb]
+    pixseries = pixseries - np.nanmedian(pixseries, axis=1)[:, None]
+    pixseries = np.delete(pixseries, nanpixels, 1)
+    errseries = np.delete(flux_err[:, aperb], nanpixels, 1)
+    pixseries[np.isnan(pixseries)] = fill
+    errseries[np.isnan(errseries)] = 10
+    return pixseries, errseries
+
+def _robust_fit(model, data, maxiter=100, tol=1e-8):
+    """
+    Coefficients which minimize the mean absolute deviation of
+    ``data - model.dot(coeffs)``, found by iteratively reweighted least
+    squares with a free offset.
+    """
+    A = np.column_stack([model, np.ones(len(data))])
+    coeffs = np.linalg.lstsq(A, data, rcond=None)[0]
+    floor = 1e-10 * max(np.max(np.abs(data)), 1e-300)
+    for _ in range(maxiter):
+        sqrtw = 1. / np.sqrt(np.maximum(np.abs(data - np.dot(A, coeffs)),
+                                        floor))
+        new_coeffs = np.linalg.lstsq(A * sqrtw[:, None], data * sqrtw,
+                                     rcond=None)[0]
+        converged = (np.max(np.abs(new_coeffs - coeffs))
+                     <= tol * np.max(np.abs(new_coeffs)))
+        coeffs = new_coeffs
+        if converged:
+            break
+    return coeffs[:-1]
+
 def mad(data):
     """
     Mean absolute deviation function used for fitting the PCA components to
@@ -785,6 +912,17 @@ def keppca_main():
                         help='Write to a log file?')
     parser.add_argument('--logfile', '-l', help='Name of ascii log file',
                         default='keppca.log', dest='logfile', type=str)
+    parser.add_argument('--ncomponents', default=None,
+                        help='Number of principal components to compute',
+                        type=int)
+    parser.add_argument('--method', default='randomized',
+                        help='Method used to compute the principal components',
+                        type=str, choices=['randomized', 'svd'])
+    parser.add_argument('--blocksize', default=None,
+                        help=('Number of cadences per block for out-of-core,'
+                              ' incremental PCA'),
+                        type=int)
     args = parser.parse_args()
     keppca(args.infile, args.outfile, args.maskfile, args.components,
-           args.plotpca, args.nmaps, args.overwrite, args.verbose, args.logfile)
+           args.plotpca, args.nmaps, args.overwrite, args.verbose,
+           args.logfile, args.ncomponents, args.method, args.blocksize)
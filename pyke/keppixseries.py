@@ -2,8 +2,7 @@ from .utils import PyKEArgumentHelpFormatter
 import numpy as np
 from astropy.io import fits as pyfits
 from matplotlib import pyplot as plt
-from tqdm import tqdm
-from . import kepio, kepmsg, kepkey, kepplot, kepstat, kepfunc
+from . import kepio, kepmsg, kepkey, kepplot, kepstat, kepconvolve
 
 
 __all__ = ['keppixseries']
@@ -128,9 +127,6 @@ def keppixseries(infile, outfile=None, plotfile=None, plottype='global',
     kepid, channel, skygroup, module, output, quarter, season, \
         ra, dec, column, row, kepmag, xdim, ydim, fluxpixels = \
         kepio.readTPF(infile, 'FLUX', logfile, verbose)
-    kepid, channel, skygroup, module, output, quarter, season, \
-        ra, dec, column, row, kepmag, xdim, ydim, errpixels = \
-        kepio.readTPF(infile, 'FLUX_ERR', logfile, verbose)
     kepid, channel, skygroup, module, output, quarter, season, \
         ra, dec, column, row, kepmag, xdim, ydim, qual = \
         kepio.readTPF(infile, 'QUALITY', logfile, verbose)
@@ -150,36 +146,17 @@ def keppixseries(infile, outfile=None, plotfile=None, plottype='global',
     print('     Module:    {}'.format(module))
     print('     Output:     {}'.format(output))
     print('')
-    # how many quality = 0 rows?
-    npts = 0
-    nrows = len(fluxpixels)
-    for i in range(nrows):
-        if (qual[i] == 0 and np.isfinite(barytime[i])
-            and np.isfinite(fluxpixels[i, ydim * xdim // 2])):
-            npts += 1
-    time = np.empty((npts))
-    timecorr = np.empty((npts))
-    cadenceno = np.empty((npts))
-    quality = np.empty((npts))
-    pixseries = np.empty((ydim, xdim, npts))
-    errseries = np.empty((ydim, xdim, npts))
+    # quality = 0 cadences with a valid time and central pixel
+    good = ((qual == 0) & np.isfinite(barytime)
+            & np.isfinite(fluxpixels[:, ydim * xdim // 2]))
+    time = np.array(barytime[good], dtype='float64')
+    timecorr = np.array(tcorr[good], dtype='float64')
+    cadenceno = np.array(cadno[good], dtype='float64')
+    quality = np.array(qual[good], dtype='float64')
 
-    # construct output light curves
-    nptsx = 0
-    for i in tqdm(range(ydim)):
-        for j in range(xdim):
-            npts = 0
-            for k in range(nrows):
-                if (qual[k] == 0 and np.isfinite(barytime[k])
-                    and np.isfinite(fluxpixels[k, int(ydim*xdim/2)])):
-                    time[npts] = barytime[k]
-                    timecorr[npts] = tcorr[k]
-                    cadenceno[npts] = cadno[k]
-                    quality[npts] = qual[k]
-                    pixseries[i, j, npts] = fluxpixels[k, nptsx]
-                    errseries[i, j, npts] = errpixels[k, nptsx]
-                    npts += 1
-            nptsx += 1
+    # construct output light curves, one per pixel
+    pixseries = np.array(fluxpixels[good].T, dtype='float64').reshape(
+                    (ydim, xdim, len(time)))
     # define data sampling
     if filterlc:
         tpf = pyfits.open(infile)
@@ -187,41 +164,12 @@ def keppixseries(infile, outfile=None, plotfile=None, plottype='global',
         tr = 1.0 / (cadence / 86400)
         timescale = 1.0 / (cutoff / tr)
 
-        # define convolution function
-        if function == 'boxcar':
-            filtfunc = np.ones(int(np.ceil(timescale)))
-        elif function == 'gauss':
-            timescale /= 2
-            dx = np.ceil(timescale * 10 + 1)
-            filtfunc = filtfunc([1.0, dx / 2 - 1.0, timescale],
-                                np.linspace(0, dx - 1, dx))
-        elif function == 'sinc':
-            dx = np.ceil(timescale * 12 + 1)
-            fx = np.linspace(0, dx - 1, dx)
-            fx = fx - dx / 2 + 0.5
-            fx /= timescale
-            filtfunc = np.sinc(fx)
-        filtfunc /= np.sum(filtfunc)
-
-        # pad time series at both ends with noise model
-        for i in range(ydim):
-            for j in range(xdim):
-                ave, sigma = (np.mean(pixseries[i, j, :len(filtfunc)]),
-                              np.std(pixseries[i, j, :len(filtfunc)]))
-                padded = np.append(kepstat.randarray(np.ones(len(filtfunc)) * ave,
-                                   np.ones(len(filtfunc)) * sigma), pixseries[i, j, :])
-                ave, sigma = (np.mean(pixseries[i, j, -len(filtfunc):]),
-                              np.std(pixseries[i, j, -len(filtfunc):]))
-                padded = np.append(padded,
-                                   kepstat.randarray(np.ones(len(filtfunc)) * ave,
-                                   np.ones(len(filtfunc)) * sigma))
-                # convolve data
-                convolved = np.convolve(padded, filtfunc, 'same')
-                # remove padding from the output array
-                outdata = convolved[len(filtfunc): -len(filtfunc)]
-                # subtract low frequencies
-                outmedian = np.median(outdata)
-                pixseries[i, j, :] = pixseries[i, j, :] - outdata + outmedian
+        # filter all pixel series at once, ignoring gaps and the ends
+        # of the time series, and subtract low frequencies
+        filtfunc = kepconvolve.filterkernel(function, timescale)
+        outdata = kepconvolve.convolve(pixseries, filtfunc)
+        outmedian = np.nanmedian(outdata, axis=-1)
+        pixseries = pixseries - outdata + outmedian[..., np.newaxis]
 
     # construct output file
     print("Writing output file {}...".format(outfile))
@@ -470,8 +418,6 @@ def keppixseries(infile, outfile=None, plotfile=None, plottype='global',
         kepmsg.warn(logfile, warnmsg, verbose)
 
     # plot pixel array
-    fmin = 1.0e33
-    fmax = -1.033
     plt.figure()
     plt.clf()
     dx = 0.93 / xdim
@@ -485,19 +431,16 @@ def keppixseries(infile, outfile=None, plotfile=None, plottype='global',
     plt.ylim(np.min(pixcoord2) - 0.5, np.max(pixcoord2) + 0.5)
     plt.xlabel('time', {'color' : 'k'})
     plt.ylabel('arbitrary flux', {'color' : 'k'})
+    tmin = np.amin(time)
+    tmax = np.amax(time)
+    xmin = tmin - (tmax - tmin) / 40
+    xmax = tmax + (tmax - tmin) / 40
+    pixmin = np.amin(pixseries, axis=-1)
+    pixmax = np.amax(pixseries, axis=-1)
     for i in range(ydim):
         for j in range(xdim):
-            tmin = np.amin(time)
-            tmax = np.amax(time)
-            try:
-                np.isfinite(np.amin(pixseries[i, j, :]))
-                np.isfinite(np.amin(pixseries[i, j, :]))
-                fmin = np.amin(pixseries[i, j, :])
-                fmax = np.amax(pixseries[i, j, :])
-            except:
-                ugh = 1
-            xmin = tmin - (tmax - tmin) / 40
-            xmax = tmax + (tmax - tmin) / 40
+            fmin = pixmin[i, j]
+            fmax = pixmax[i, j]
             ymin = fmin - (fmax - fmin) / 20
             ymax = fmax + (fmax - fmin) / 20
             if kepstat.bitInBitmap(maskimg[i, j], 2):
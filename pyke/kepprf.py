@@ -258,14 +258,8 @@ def kepprf(infile, prfdir, frameno, columns, rows, fluxes, background=False,
     ferr = errpixels[frameno-1,:]
 
     # image scale and intensity limits of pixel data
-    n = 0
-    DATimg = np.empty((ydim, xdim))
-    ERRimg = np.empty((ydim, xdim))
-    for i in range(ydim):
-        for j in range(xdim):
-            DATimg[i, j] = flux[n]
-            ERRimg[i, j] = ferr[n]
-            n += 1
+    DATimg = np.asarray(flux, dtype='float64').reshape(ydim, xdim)
+    ERRimg = np.asarray(ferr, dtype='float64').reshape(ydim, xdim)
 
     # read and interpolate PRF
     (splineInterpolation, DATx, DATy, prf, _, _, PRFx0, PRFy0, cdelt1p,
@@ -1,6 +1,5 @@
 import math
 import multiprocessing
-import itertools
 import glob
 import sys
 import time
@@ -11,7 +10,7 @@ from astropy.io import fits as pyfits
 from scipy.optimize import fmin_powell
 from scipy.interpolate import RectBivariateSpline
 from . import kepio, kepmsg, kepkey, kepplot, kepfit, kepfunc
-from .utils import PyKEArgumentHelpFormatter
+from .utils import PyKEArgumentHelpFormatter, pool_imap
 
 
 __all__ = ['kepprfphot']
@@ -19,8 +18,9 @@ __all__ = ['kepprfphot']
 
 def kepprfphot(infile, prfdir, columns, rows, fluxes, border=0,
                background=False, focus=False, ranges='0,0', xtol=1e-4,
-               ftol=1e-2, qualflags=False, outfile=None, plot=False, overwrite=False,
-               verbose=False, logfile='kepprfphot.log'):
+               ftol=1e-2, qualflags=False, outfile=None, plot=False,
+               overwrite=False, verbose=False, logfile='kepprfphot.log',
+               nprocs=1, chunksize=50):
     """
     kepprfphot -- Fit a PSF model to time series observations within a Target
     Pixel File
@@ -119,6 +119,14 @@ def kepprfphot(infile, prfdir, columns, rows, fluxes, border=0,
         Print informative messages and warnings to the shell and logfile?
     logfile : str
         Name of the logfile containing error and warning messages.
+    nprocs : int or None
+        Number of worker processes used to fit the time series. If ``1``,
+        the cadences are fit serially in the current process. If ``None``,
+        one worker per available CPU is used.
+    chunksize : int
+        Number of consecutive cadences fit by a worker in a single task.
+        Within a chunk, the best fit of each cadence is used as the initial
+        guess for the next one.
 
     Examples
     --------
@@ -174,7 +182,9 @@ def kepprfphot(infile, prfdir, columns, rows, fluxes, border=0,
             + ' plot={}'.format(plot)
             + ' overwrite={}'.format(overwrite)
             + ' verbose={}'.format(verbose)
-            + ' logfile={}'.format(logfile))
+            + ' logfile={}'.format(logfile)
+            + ' nprocs={}'.format(nprocs)
+            + ' chunksize={}'.format(chunksize))
     kepmsg.log(logfile, call+'\n', verbose)
 
     # start time
@@ -290,15 +300,9 @@ def kepprfphot(infile, prfdir, columns, rows, fluxes, border=0,
     # Get time ranges for new photometry, flag good data
     barytime += bjdref
     tstart, tstop = kepio.timeranges(ranges, logfile, verbose)
-    incl = np.zeros((len(barytime)), dtype='int')
-    for rownum in range(len(barytime)):
-        for winnum in range(len(tstart)):
-            if (barytime[rownum] >= tstart[winnum]
-                and barytime[rownum] <= tstop[winnum]
-                and (qual[rownum] == 0 or qualflags)
-                and np.isfinite(barytime[rownum])
-                and np.isfinite(np.nansum(fluxpixels[rownum, :]))):
-                incl[rownum] = 1
+    incl = (kepio.inranges(barytime, tstart, tstop)
+            & ((qual == 0) | qualflags)
+            & np.isfinite(np.nansum(fluxpixels, axis=1))).astype('int')
     if not np.in1d(1,incl):
         message = ('ERROR -- KEPPRFPHOT: No legal data within the'
                    ' range {}'.format(ranges))
@@ -342,7 +346,6 @@ def kepprfphot(infile, prfdir, columns, rows, fluxes, border=0,
         dx.append(np.array([], dtype='float32'))
         dy.append(np.array([], dtype='float32'))
     # Preparing fit data message
-    progress = np.arange(nincl)
     if verbose:
         txt  = 'Preparing...'
         sys.stdout.write(txt)
@@ -363,70 +366,13 @@ def kepprfphot(infile, prfdir, columns, rows, fluxes, border=0,
         ftol = ftol
         xtol = xtol
         oldtime = barytime[rownum]
-    # Fit the time series: multi-processing
-    anslist = []
-    cad1 = 0
-    cad2 = 50
-    for i in range(int(nincl/50) + 1):
-        try:
-            fluxp = fluxpixels[cad1:cad2, :]
-            errp = errpixels[cad1:cad2, :]
-            progress = np.arange(cad1, cad2)
-        except:
-            fluxp = fluxpixels[cad1:nincl, :]
-            errp = errpixels[cad1:nincl, :]
-            progress = np.arange(cad1, nincl)
-        try:
-            args = itertools.izip(fluxp, errp, itertools.repeat(DATx),
-                                  itertools.repeat(DATy),
-                                  itertools.repeat(nsrc),
-                                  itertools.repeat(border),
-                                  itertools.repeat(xx),
-                                  itertools.repeat(yy),
-                                  itertools.repeat(PRFx),
-                                  itertools.repeat(PRFy),
-                                  itertools.repeat(splineInterpolation),
-                                  itertools.repeat(guess),
-                                  itertools.repeat(ftol),
-                                  itertools.repeat(xtol),
-                                  itertools.repeat(focus),
-                                  itertools.repeat(background), progress,
-                                  itertools.repeat(np.arange(cad1,nincl)[-1]),
-                                  itertools.repeat(float(x[0])),
-                                  itertools.repeat(float(y[0])),
-                                  itertools.repeat(True))
-            p = multiprocessing.Pool()
-            model = [0.0]
-            model = p.imap(PRFfits, args, chunksize=1)
-            p.close()
-            p.join()
-            cad1 += 50; cad2 += 50
-            ans = np.array([np.array(item) for item in zip(*model)])
-            try:
-                anslist = np.concatenate((anslist, ans.transpose()), axis=0)
-            except:
-                anslist = ans.transpose()
-            guess = anslist[-1]
-            ans = anslist.transpose()
-        except:
-            pass
-
-    # single processor version
-    oldtime = 0.0; ans = []
-    for rownum in range(nincl):
-        proctime = time.time()
-        try:
-            if barytime[rownum] - oldtime > 0.5:
-                ftol = 1.0e-10; xtol = 1.0e-10
-        except:
-            pass
-        args = (fluxpixels[rownum, :], errpixels[rownum, :], DATx, DATy, nsrc,
-                border, xx, yy, PRFx, PRFy, splineInterpolation, guess, ftol,
-                xtol, focus, background, rownum, nincl, float(x[0]),
-                float(y[0]), True)
-        guess = PRFfits(args)
-        ans.append(guess)
-        ftol = ftol; xtol = xtol; oldtime = barytime[rownum]
+    # Fit the time series
+    config = {'DATx': DATx, 'DATy': DATy, 'nsrc': nsrc, 'border': border,
+              'xx': xx, 'yy': yy, 'PRFx': PRFx, 'PRFy': PRFy,
+              'prf': result[3], 'focus': focus, 'background': background,
+              'col': float(x[0]), 'row': float(y[0]), 'barytime': barytime}
+    ans = _fit_time_series(fluxpixels, errpixels, guess, ftol, xtol, config,
+                           nprocs, chunksize, verbose)
     ans = np.array(ans).transpose()
 
     # unpack the best fit parameters
@@ -479,12 +425,7 @@ def kepprfphot(infile, prfdir, columns, rows, fluxes, border=0,
         # calculate residual of DATA - FIT
         xdim = np.shape(xx)[1]
         ydim = np.shape(yy)[0]
-        DATimg = np.empty((ydim, xdim))
-        n = 0
-        for k in range(ydim):
-            for j in range(xdim):
-                DATimg[k,j] = fluxpixels[i, n]
-                n += 1
+        DATimg = np.asarray(fluxpixels[i], dtype='float64').reshape(ydim, xdim)
         PRFres = DATimg - PRFfit
         residual.append(np.nansum(PRFres) / npix)
         # calculate the sum squared difference between data and model
@@ -994,22 +935,112 @@ def kepprfphot(infile, prfdir, columns, rows, fluxes, border=0,
     # stop time
     kepmsg.clock('\n\nKEPPRFPHOT ended at',logfile,verbose)
 
+# state of the process fitting the time series, either a pool worker or
+# the main process when running serially
+_worker = {}
+
+
+def _set_worker_state(fluxpixels, errpixels, config):
+    """Stores the pixel time series and the fit configuration, and builds
+    the PRF spline interpolation once for the current process."""
+    _worker.clear()
+    _worker.update(config)
+    _worker['fluxpixels'] = fluxpixels
+    _worker['errpixels'] = errpixels
+    _worker['splineInterpolation'] = RectBivariateSpline(config['PRFx'],
+                                                         config['PRFy'],
+                                                         config['prf'])
+
+
+def _init_worker(flux_buffer, err_buffer, shape, config):
+    """Pool initializer: wraps the shared memory buffers as numpy arrays."""
+    fluxpixels = np.frombuffer(flux_buffer, dtype='float32').reshape(shape)
+    errpixels = np.frombuffer(err_buffer, dtype='float32').reshape(shape)
+    _set_worker_state(fluxpixels, errpixels, config)
+
+
+def _to_shared_array(array):
+    """Copies an array into a shared memory buffer."""
+    buffer = multiprocessing.RawArray('f', array.size)
+    np.frombuffer(buffer, dtype='float32')[:] = array.ravel()
+    return buffer
+
+
+def _fit_cadences(task):
+    """Fits the cadences in [start, stop) using the current process state.
+    The best fit of each cadence is the initial guess for the next one."""
+    start, stop, guess, ftol, xtol = task
+    w = _worker
+    ans = []
+    oldtime = 0.0
+    for rownum in range(start, stop):
+        if w['barytime'][rownum] - oldtime > 0.5:
+            ftol = 1.0e-10; xtol = 1.0e-10
+        args = (w['fluxpixels'][rownum, :], w['errpixels'][rownum, :],
+                w['DATx'], w['DATy'], w['nsrc'], w['border'], w['xx'],
+                w['yy'], w['PRFx'], w['PRFy'], w['splineInterpolation'],
+                guess, ftol, xtol, w['focus'], w['background'], rownum,
+                len(w['barytime']), w['col'], w['row'], False)
+        guess = PRFfits(args)
+        ans.append(guess)
+        oldtime = w['barytime'][rownum]
+    return ans
+
+
+def _fit_time_series(fluxpixels, errpixels, guess, ftol, xtol, config,
+                     nprocs=1, chunksize=50, verbose=False):
+    """
+    Fits the PRF model to every cadence of the pixel time series.
+
+    The cadences are split into chunks of ``chunksize`` consecutive rows.
+    If ``nprocs`` is not 1, the chunks are distributed to a single pool of
+    worker processes; the pixel time series are shared with the workers
+    through shared memory rather than pickled into every task, and each
+    worker builds the PRF spline interpolation once.
+    """
+    nincl = fluxpixels.shape[0]
+    chunksize = max(int(chunksize), 1)
+    bounds = [(i, min(i + chunksize, nincl)) for i in range(0, nincl, chunksize)]
+    proctime = time.time()
+    ans = []
+
+    if nprocs == 1:
+        _set_worker_state(fluxpixels, errpixels, config)
+        for start, stop in bounds:
+            ans += _fit_cadences((start, stop, guess, ftol, xtol))
+            guess = ans[-1]
+            _print_progress(stop, nincl, proctime, verbose)
+        _worker.clear()
+        return ans
+
+    initargs = (_to_shared_array(fluxpixels), _to_shared_array(errpixels),
+                fluxpixels.shape, config)
+    tasks = [(start, stop, guess, ftol, xtol) for start, stop in bounds]
+    chunks = pool_imap(_fit_cadences, tasks, nprocs, _init_worker, initargs)
+    for chunk, (start, stop) in zip(chunks, bounds):
+        ans += chunk
+        _print_progress(stop, nincl, proctime, verbose)
+    return ans
+
+
+def _print_progress(nrow, nincl, proctime, verbose):
+    if verbose:
+        txt  = '\r%3d%% ' % (float(nrow) / float(nincl) * 100.0)
+        txt += 'nrow = %d ' % nrow
+        txt += 't = %.1f sec' % (time.time() - proctime)
+        txt += ' ' * 5
+        sys.stdout.write(txt)
+        sys.stdout.flush()
+
 def PRFfits(args):
 
     # start time
     proctime = time.time()
 
     # extract image from the time series
-    xdim = np.shape(args[6])[1]
-    ydim = np.shape(args[6])[0]
-    DATimg = np.empty((ydim,xdim))
-    DATerr = np.empty((ydim,xdim))
-    n = 0
-    for i in range(ydim):
-        for j in range(xdim):
-            DATimg[i,j] = args[0][n]
-            DATerr[i,j] = args[1][n]
-            n += 1
+    ydim, xdim = np.shape(args[6])
+    DATimg = np.asarray(args[0], dtype='float64').reshape(ydim, xdim)
+    DATerr = np.asarray(args[1], dtype='float64').reshape(ydim, xdim)
 
     # minimize data and model
     if args[14] and args[15]:
@@ -1091,8 +1122,16 @@ def kepprfphot_main():
                         help='Write to a log file?')
     parser.add_argument('--logfile', '-l', default='kepprfphot.log',
                         help='Name of ascii log file', type=str)
+    parser.add_argument('--nprocs', default=1,
+                        help=('Number of worker processes.'
+                              ' If 0, one per available CPU.'),
+                        type=int)
+    parser.add_argument('--chunksize', default=50,
+                        help='Number of cadences fit per worker task',
+                        type=int)
     args = parser.parse_args()
     kepprfphot(args.infile, args.prfdir, args.columns, args.rows, args.fluxes,
                args.border, args.background, args.focus, args.ranges,
                args.xtol, args.ftol, args.qualflags, args.outfile, args.plot,
-               args.overwrite, args.verbose, args.logfile)
+               args.overwrite, args.verbose, args.logfile,
+               args.nprocs or None, args.chunksize)
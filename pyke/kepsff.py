@@ -1,4 +1,4 @@
-from .utils import PyKEArgumentHelpFormatter
+from .utils import PyKEArgumentHelpFormatter, pool_imap
 import re
 import numpy as np
 from tqdm import tqdm
@@ -13,7 +13,8 @@ __all__ = ['kepsff']
 def kepsff(infile, outfile=None, datacol='DETSAP_FLUX', cenmethod='moments',
            stepsize=5., npoly_cxcy=1, sigma_cxcy=10.0, npoly_ardx=6,
            npoly_dsdt=2, sigma_dsdt=3.0, npoly_arfl=3, sigma_arfl=3.0,
-           plot=False, overwrite=False, verbose=False, logfile='kepsff.log'):
+           plot=False, overwrite=False, verbose=False, logfile='kepsff.log',
+           nprocs=1):
     """
     kepsff -- remove motion-correlated noise from aperture light curve data
 
@@ -241,6 +242,10 @@ def kepsff(infile, outfile=None, datacol='DETSAP_FLUX', cenmethod='moments',
         Print informative messages and warnings to the shell and logfile?
     logfile : str
         Name of the logfile containing error and warning messages.
+    nprocs : int or None
+        Number of worker processes among which the time windows are
+        distributed. If ``1``, the windows are calibrated serially in the
+        current process. If ``None``, one worker per available CPU is used.
     """
 
     if outfile is None:
@@ -265,7 +270,8 @@ def kepsff(infile, outfile=None, datacol='DETSAP_FLUX', cenmethod='moments',
             + ' plot={}'.format(plot)
             + ' overwrite={}'.format(overwrite)
             + ' verbose={}'.format(verbose)
-            + ' logfile={}'.format(logfile))
+            + ' logfile={}'.format(logfile)
+            + ' nprocs={}'.format(nprocs))
 
     kepmsg.log(logfile, call+'\n', verbose)
     # start time
@@ -309,395 +315,27 @@ def kepsff(infile, outfile=None, datacol='DETSAP_FLUX', cenmethod='moments',
     elif len(table.field('TIME')) < winedge[-1]:
         winedge[-1] = len(table.field('TIME'))
     # step through the time windows
-    for iw in tqdm(range(1, len(winedge))):
-        t1 = winedge[iw - 1]
-        t2 = winedge[iw]
-        # filter input data table
-        work1 = np.array([table.field('TIME')[t1:t2],
-                          table.field('CADENCENO')[t1:t2],
-                          table.field(datacol)[t1:t2],
-                          table.field('MOM_CENTR1')[t1:t2],
-                          table.field('MOM_CENTR2')[t1:t2],
-                          table.field('PSF_CENTR1')[t1:t2],
-                          table.field('PSF_CENTR2')[t1:t2],
-                          table.field('SAP_QUALITY')[t1:t2]],'float64')
-        work1 = np.rot90(work1, 3)
-        work2 = work1[(work1[:, 0] == 0.0) | (work1[:, 0] > 1e5)]
-
-
-        # assign table columns
-        intime = work2[:, 7] + bjdref
-        cadenceno = work2[:, 6].astype(int)
-        indata = work2[:, 5]
-        mom_centr1 = work2[:, 4]
-        mom_centr2 = work2[:, 3]
-        psf_centr1 = work2[:, 2]
-        psf_centr2 = work2[:, 1]
-        sap_quality = work2[:, 0]
-        if cenmethod == 'moments':
-            centr1 = np.copy(mom_centr1)
-            centr2 = np.copy(mom_centr2)
-        else:
-            centr1 = np.copy(psf_centr1)
-            centr2 = np.copy(psf_centr2)
-
-        # fit centroid data with low-order polynomial
-        cfit = np.zeros((len(centr2)))
-        csig = np.zeros((len(centr2)))
-        functype = getattr(kepfunc, 'poly' + str(npoly_cxcy))
-        pinit = np.array([np.nanmean(centr2)])
-        if npoly_cxcy > 0:
-            for j in range(npoly_cxcy):
-                pinit = np.append(pinit,0.0)
-        try:
-            coeffs, errors, covar, iiter, sigma, chi2, dof, fit, plotx, ploty = \
-                kepfit.lsqclip(functype, pinit, centr1, centr2, None,
-                               sigma_cxcy, sigma_cxcy, 10, logfile, verbose)
-            for j in range(len(coeffs)):
-                cfit += coeffs[j] * np.power(centr1, j)
-                csig[:] = sigma
-        except:
-            warnmsg = ('WARNING -- KEPSFF: could not fit centroid data with'
-                       ' polynomial. There are no data points within the'
-                       ' range of input rows {} - {}. Either increase the'
-                       ' stepsize (with an appreciation of the effects on'
-                       ' light curve quality this will have!), or better yet'
-                       ' - cut the timeseries up to remove large gaps in the'
-                       ' input light curve using kepclip.'.format(t1, t2))
-            kepmsg.warn(logfile, warnmsg, verbose)
-            continue
-
-        # reject outliers
-        time_good = np.array([], 'float64')
-        centr1_good = np.array([], 'float32')
-        centr2_good = np.array([], 'float32')
-        flux_good = np.array([], 'float32')
-        cad_good = np.array([], 'int')
-        for i in range(len(cfit)):
-            if abs(centr2[i] - cfit[i]) < sigma_cxcy * csig[i]:
-                time_good = np.append(time_good, intime[i])
-                centr1_good = np.append(centr1_good, centr1[i])
-                centr2_good = np.append(centr2_good, centr2[i])
-                flux_good = np.append(flux_good, indata[i])
-                cad_good = np.append(cad_good, cadenceno[i])
-
-        # covariance matrix for centroid time series
-        centr = np.concatenate([[centr1_good] - np.nanmean(centr1_good),
-                                [centr2_good] - np.nanmean(centr2_good)])
-        covar = np.cov(centr)
-        # eigenvector eigenvalues of covariance matrix
-        [_, evec] = np.linalg.eigh(covar)
-        ex = np.arange(-10.0, 10.0, 0.1)
-        epar = evec[1, 1] / evec[0, 1] * ex
-        enor = evec[1, 0] / evec[0, 0] * ex
-        ex = ex + np.nanmean(centr1)
-        epar = epar + np.nanmean(centr2_good)
-        enor = enor + np.nanmean(centr2_good)
-        # rotate centroid data
-        centr_rot = np.dot(evec.T, centr)
-        # fit polynomial to rotated centroids
-        rfit = np.zeros((len(centr2)))
-        rsig = np.zeros((len(centr2)))
-        functype = getattr(kepfunc, 'poly' + str(npoly_ardx))
-        pinit = np.array([np.nanmean(centr_rot[0,:])])
-        pinit = np.array([1.0])
-        if npoly_ardx > 0:
-            for j in range(npoly_ardx):
-                pinit = np.append(pinit,0.0)
-        try:
-            coeffs, errors, covar, iiter, sigma, chi2, dof, fit, plotx, ploty = \
-                kepfit.lsqclip(functype, pinit, centr_rot[1, :],
-                               centr_rot[0, :], None, 100.0, 100.0, 1, logfile,
-                               verbose)
-        except:
-            warnmsg = ('WARNING -- KEPSFF: could not fit rotated centroid data'
-                      ' with polynomial')
-            kepmsg.warn(logfile, warnmsg, verbose)
-            continue
-        rx = np.linspace(np.nanmin(centr_rot[1, :]),
-                         np.nanmax(centr_rot[1, :]), 100)
-        ry = np.zeros((len(rx)))
-        for i in range(len(coeffs)):
-            ry = ry + coeffs[i] * np.power(rx,i)
-
-        # calculate arclength of centroids
-        s = np.zeros((len(rx)))
-        for i in range(1, len(s)):
-            work3 = ((ry[i] - ry[i - 1]) / (rx[i] - rx[i-1])) ** 2
-            s[i] = s[i - 1] + np.sqrt(1.0 + work3) * (rx[i] - rx[i-1])
-
-        # fit arclength as a function of strongest eigenvector
-        sfit = np.zeros((len(centr2)))
-        ssig = np.zeros((len(centr2)))
-        functype = getattr(kepfunc, 'poly' + str(npoly_ardx))
-        pinit = np.array([np.nanmean(s)])
-        if npoly_ardx > 0:
-            for j in range(npoly_ardx):
-                pinit = np.append(pinit, 0.0)
-        try:
-            acoeffs, errors, covar, iiter, sigma, chi2, dof, fit, plotx, ploty = \
-                kepfit.lsqclip(functype, pinit, rx, s, None, 100.0, 100.0, 100,
-                               logfile, verbose)
-        except:
-            warnmsg = ('WARNING -- KEPSFF: could not fit arclength data'
-                       ' with polynomial')
-            kepmsg.warn(logfile, warnmsg, verbose)
-            continue
-
-        # correlate arclength with detrended flux
-        t = np.copy(time_good)
-        c = np.copy(cad_good)
-        y = np.copy(flux_good)
-        z = centr_rot[1, :]
-        x = np.zeros((len(z)))
-        for i in range(len(acoeffs)):
-            x = x + acoeffs[i] * np.power(z, i)
-
-        # calculate time derivative of arclength s
-        dx = np.zeros((len(x)))
-        for i in range(1, len(x)):
-            dx[i] = (x[i] - x[i - 1]) / (t[i] - t[i - 1])
-        dx[0] = dx[1]
-
-        # fit polynomial to derivative and flag outliers (thruster firings)
-        dfit = np.zeros((len(dx)))
-        dsig = np.zeros((len(dx)))
-        functype = getattr(kepfunc, 'poly' + str(npoly_dsdt))
-        pinit = np.array([np.nanmean(dx)])
-        if npoly_dsdt > 0:
-            for j in range(npoly_dsdt):
-                pinit = np.append(pinit, 0.0)
-        try:
-            dcoeffs, errors, covar, iiter, dsigma, chi2, dof, fit, dumx, dumy = \
-                kepfit.lsqclip(functype, pinit, t, dx, None, 3.0, 3.0, 10,
-                               logfile, verbose)
-        except:
-            warnmsg = ('WARNING -- KEPSFF: could not fit arclength derivative'
-                       ' with polynomial.')
-            kepmsg.warn(logfile, warnmsg, verbose)
-            continue
-        for i in range(len(dcoeffs)):
-            dfit = dfit + dcoeffs[i] * np.power(t, i)
-        centr1_pnt = np.array([], 'float32')
-        centr2_pnt = np.array([], 'float32')
-        time_pnt = np.array([], 'float64')
-        flux_pnt = np.array([], 'float32')
-        dx_pnt = np.array([], 'float32')
-        s_pnt = np.array([], 'float32')
-        time_thr = np.array([], 'float64')
-        flux_thr = np.array([], 'float32')
-        dx_thr = np.array([], 'float32')
-        thr_cadence = []
-        for i in range(len(t)):
-            if (dx[i] < dfit[i] + sigma_dsdt * dsigma
-                and dx[i] > dfit[i] - sigma_dsdt * dsigma):
-                time_pnt = np.append(time_pnt, time_good[i])
-                flux_pnt = np.append(flux_pnt, flux_good[i])
-                dx_pnt = np.append(dx_pnt, dx[i])
-                s_pnt = np.append(s_pnt, x[i])
-                centr1_pnt = np.append(centr1_pnt, centr1_good[i])
-                centr2_pnt = np.append(centr2_pnt, centr2_good[i])
-            else:
-                time_thr = np.append(time_thr, time_good[i])
-                flux_thr = np.append(flux_thr, flux_good[i])
-                dx_thr = np.append(dx_thr, dx[i])
-                thr_cadence.append(cad_good[i])
-
-        # fit arclength-flux correlation
-        cfit = np.zeros((len(time_pnt)))
-        csig = np.zeros((len(time_pnt)))
-        functype = getattr(kepfunc, 'poly' + str(npoly_arfl))
-        pinit = np.array([np.nanmean(flux_pnt)])
-        if npoly_arfl > 0:
-            for j in range(npoly_arfl):
-                pinit = np.append(pinit, 0.0)
-        try:
-            ccoeffs, errors, covar, iiter, sigma, chi2, dof, fit, plx, ply = \
-                kepfit.lsqclip(functype, pinit, s_pnt, flux_pnt, None,
-                               sigma_arfl, sigma_arfl, 100, logfile, verbose)
-        except:
-            warnmsg = ('WARNING -- KEPSFF: could not fit arclength-flux'
-                       ' correlation with polynomial')
-            kepmsg.warn(logfile, warnmsg, verbose)
+    columns = ['TIME', 'CADENCENO', datacol, 'MOM_CENTR1', 'MOM_CENTR2',
+               'PSF_CENTR1', 'PSF_CENTR2', 'SAP_QUALITY']
+    config = {'cenmethod': cenmethod, 'bjdref': bjdref,
+              'npoly_cxcy': npoly_cxcy, 'sigma_cxcy': sigma_cxcy,
+              'npoly_ardx': npoly_ardx, 'npoly_dsdt': npoly_dsdt,
+              'sigma_dsdt': sigma_dsdt, 'npoly_arfl': npoly_arfl,
+              'sigma_arfl': sigma_arfl, 'logfile': logfile, 'verbose': verbose}
+    tasks = [(winedge[iw - 1], winedge[iw],
+              np.array([table.field(col)[winedge[iw - 1]:winedge[iw]]
+                        for col in columns], 'float64'), config)
+             for iw in range(1, len(winedge))]
+    windows = pool_imap(_sff_window, tasks, nprocs)
+    for iw, window in enumerate(tqdm(windows, total=len(tasks)), 1):
+        if window is None:
             continue
-
-        # correction factors for unfiltered data
-        centr = np.concatenate([[centr1] - np.nanmean(centr1_good),
-                                [centr2] - np.nanmean(centr2_good)])
-        centr_rot = np.dot(evec.T, centr)
-        yy = np.copy(indata)
-        zz = centr_rot[1, :]
-        xx = np.zeros((len(zz)))
-        cfac = np.zeros((len(zz)))
-        for i in range(len(acoeffs)):
-            xx = xx + acoeffs[i] * np.power(zz, i)
-        for i in range(len(ccoeffs)):
-            cfac = cfac + ccoeffs[i] * np.power(xx, i)
-
-        # apply correction to flux time-series
-        out_detsap = indata / cfac
-        # split time-series data for plotting
-        tim_gd = np.array([], 'float32')
-        flx_gd = np.array([], 'float32')
-        tim_bd = np.array([], 'float32')
-        flx_bd = np.array([], 'float32')
-        for i in range(len(indata)):
-            if intime[i] in time_pnt:
-                tim_gd = np.append(tim_gd, intime[i])
-                flx_gd = np.append(flx_gd, out_detsap[i])
-            else:
-                tim_bd = np.append(tim_bd, intime[i])
-                flx_bd = np.append(flx_bd, out_detsap[i])
         if plot:
-            # plot style and size
-            #kepplot.define(16, 14, logfile, verbose)
-            plt.figure(figsize=[20, 8])
-            plt.clf()
-
-            # plot x-centroid vs y-centroid
-            ax = kepplot.location([0.04, 0.57, 0.16, 0.41])
-            px = np.copy(centr1)
-            py = np.copy(centr2)
-            pxmin = px.min()
-            pxmax = px.max()
-            pymin = py.min()
-            pymax = py.max()
-            pxr = pxmax - pxmin
-            pyr = pymax - pymin
-            pad = 0.05
-            if pxr > pyr:
-                dely = (pxr - pyr) / 2
-                plt.xlim(pxmin - pxr * pad, pxmax + pxr * pad)
-                plt.ylim(pymin - dely - pyr * pad, pymax + dely + pyr * pad)
-            else:
-                delx = (pyr - pxr) / 2
-                plt.ylim(pymin - pyr * pad, pymax + pyr * pad)
-                plt.xlim(pxmin - delx - pxr * pad, pxmax + delx + pxr * pad)
-            plt.plot(px, py, color='#980000', markersize=5, marker='D', ls='')
-            plt.plot(centr1_good, centr2_good,color='#009900', markersize=5,
-                     marker='D', ls='')
-            plt.plot(ex,epar,color='k',ls='-')
-            plt.plot(ex,enor,color='k',ls='-')
-            for tick in ax.xaxis.get_major_ticks():
-                tick.label.set_fontsize(14)
-            for tick in ax.yaxis.get_major_ticks():
-                tick.label.set_fontsize(14)
-            kepplot.labels('CCD Column', 'CCD Row', 'k', 16)
-            plt.grid()
-
-            # plot arclength fits vs drift along strongest eigenvector
-            ax = kepplot.location([0.24, 0.57, 0.16, 0.41])
-            px = rx - rx[0]
-            py = s - rx - (s[0] - rx[0])
-            py, ylab = kepplot.cleany(py, 1.0, logfile, verbose)
-            kepplot.RangeOfPlot(px, py, 0.05, False)
-            plt.plot(px, py, color='#009900', markersize=5, marker='D', ls='')
-            px = plotx - rx[0]
-            py = ploty - plotx - (s[0] - rx[0])
-            py, ylab = kepplot.cleany(py, 1.0, logfile, verbose)
-            plt.plot(px, py, color='r', ls='-', lw=3)
-            for tick in ax.xaxis.get_major_ticks():
-                tick.label.set_fontsize(14)
-            for tick in ax.yaxis.get_major_ticks():
-                tick.label.set_fontsize(14)
-            ylab = re.sub(' e\S+', ' pixels)', ylab)
-            ylab = re.sub(' s\S+', '', ylab)
-            ylab = re.sub('Flux', 's $-$ x\'', ylab)
-            kepplot.labels('Linear Drift [x\'] (pixels)', ylab, 'k', 16)
-            plt.grid()
-
-            # plot time derivative of arclength s
-            ax = kepplot.location([0.04,0.08,0.16,0.41])
-            px = np.copy(time_pnt)
-            py = np.copy(dx_pnt)
-            px, xlab = kepplot.cleanx(px,logfile,verbose)
-            kepplot.RangeOfPlot(px, dx, 0.05, False)
-            plt.plot(px, py, color='#009900', markersize=5, marker='D', ls='')
-            try:
-                px = np.copy(time_thr)
-                py = np.copy(dx_thr)
-                px, xlab = kepplot.cleanx(px, logfile, verbose)
-                plt.plot(px, py, color='#980000', markersize=5, marker='D', ls='')
-            except:
-                pass
-            px = np.copy(t)
-            py = np.copy(dfit)
-            px, xlab = kepplot.cleanx(px, logfile, verbose)
-            plt.plot(px, py, color='r', ls='-', lw=3)
-            py = np.copy(dfit + sigma_dsdt * dsigma)
-            plt.plot(px, py, color='r', ls='--', lw=3)
-            py = np.copy(dfit-sigma_dsdt*dsigma)
-            plt.plot(px,py,color='r',ls='--',lw=3)
-            for tick in ax.xaxis.get_major_ticks():
-                tick.label.set_fontsize(14)
-            for tick in ax.yaxis.get_major_ticks():
-                tick.label.set_fontsize(14)
-            kepplot.labels(xlab, 'ds/dt (pixels day$^{-1}$)', 'k', 16)
-            plt.grid()
-            # plot relation of arclength vs detrended flux
-            ax = kepplot.location([0.24, 0.08, 0.16, 0.41])
-            px = np.copy(s_pnt)
-            py = np.copy(flux_pnt)
-            py, ylab = kepplot.cleany(py, 1.0, logfile, verbose)
-            kepplot.RangeOfPlot(px, py, 0.05, False)
-            plt.plot(px, py, color='#009900', markersize=5, marker='D', ls='')
-            plt.plot(plx, ply, color='r', ls='-', lw=3)
-            for tick in ax.xaxis.get_major_ticks():
-                tick.label.set_fontsize(14)
-            for tick in ax.yaxis.get_major_ticks():
-                tick.label.set_fontsize(14)
-            kepplot.labels('Arclength [s] (pixels)', ylab, 'k', 16)
-            plt.grid()
-
-            # plot aperture photometry
-            kepplot.location([0.44, 0.53, 0.55, 0.45])
-            px, xlab = kepplot.cleanx(intime, logfile, verbose)
-            py, ylab = kepplot.cleany(indata, 1.0, logfile, verbose)
-            kepplot.RangeOfPlot(px, py, 0.01, True)
-            kepplot.plot1d(px, py, cadence, '#0000ff', 1.0, '#ffff00', 0.2, True)
-            kepplot.labels(' ',ylab,'k',16)
-            plt.setp(plt.gca(),xticklabels=[])
-            kepplot.labels(xlab,re.sub('Flux','Aperture Flux',ylab),'k',16)
-            plt.grid()
-            kepplot.location([0.44, 0.08, 0.55, 0.45])
-            kepplot.RangeOfPlot(px, py, 0.01, True)
-            px, xlab = kepplot.cleanx(tim_gd, logfile, verbose)
-            py, ylab = kepplot.cleany(flx_gd, 1.0, logfile, verbose)
-            kepplot.plot1d(px, py, cadence, '#0000ff', 1.0, '#ffff00', 0.2, True)
-            try:
-                px, xlab = kepplot.cleanx(tim_bd,logfile,verbose)
-                py = np.copy(flx_bd)
-                plt.plot(px, py,color='#980000',markersize=5,marker='D',ls='')
-            except:
-                pass
-            kepplot.labels(xlab,re.sub('Flux', 'Corrected Flux', ylab), 'k', 16)
-            plt.grid()
-            # render plot
-            plt.show()
-            plt.savefig(re.sub('.fits','_%d.png' % (iw + 1), outfile))
+            _plot_window(window, iw, cadence, sigma_dsdt, outfile, logfile,
+                         verbose)
 
         # correct fluxes within the output file
-        intime = work1[:, 7] + bjdref
-        cadenceno = work1[:, 6].astype(int)
-        indata = work1[:, 5]
-        mom_centr1 = work1[:, 4]
-        mom_centr2 = work1[:, 3]
-        psf_centr1 = work1[:, 2]
-        psf_centr2 = work1[:, 1]
-        centr1 = np.copy(mom_centr1)
-        centr2 = np.copy(mom_centr2)
-        centr = np.concatenate([[centr1] - np.nanmean(centr1_good),
-                               [centr2] - np.nanmean(centr2_good)])
-        centr_rot = np.dot(evec.T, centr)
-        yy = np.copy(indata)
-        zz = centr_rot[1,:]
-        xx = np.zeros((len(zz)))
-        cfac = np.zeros((len(zz)))
-        for i in range(len(acoeffs)):
-            xx = xx + acoeffs[i] * np.power(zz, i)
-        for i in range(len(ccoeffs)):
-            cfac = cfac + ccoeffs[i] * np.power(xx, i)
-        out_detsap = yy / cfac
+        t1, t2, cfac = window['t1'], window['t2'], window['cfac']
         instr[1].data.field('SAP_FLUX')[t1:t2] /= cfac
         instr[1].data.field('PDCSAP_FLUX')[t1:t2] /= cfac
         try:
@@ -706,9 +344,7 @@ def kepsff(infile, outfile=None, datacol='DETSAP_FLUX', cenmethod='moments',
             pass
 
         # add quality flag to output file for thruster firings
-        for i in range(len(intime)):
-            if cadenceno[i] in thr_cadence:
-                instr[1].data.field('SAP_QUALITY')[t1 + i] += 131072
+        instr[1].data.field('SAP_QUALITY')[t1:t2][window['thrusters']] += 131072
     # write output file
     kepmsg.log(logfile, "Writing output file {}...".format(outfile), True)
     instr.writeto(outfile)
@@ -717,6 +353,331 @@ def kepsff(infile, outfile=None, datacol='DETSAP_FLUX', cenmethod='moments',
     # end time
     kepmsg.clock('KEPSFF completed at', logfile, verbose)
 
+
+def _polyval(coeffs, x):
+    """Evaluates a polynomial with coefficients in increasing order."""
+    return np.polynomial.polynomial.polyval(x, coeffs)
+
+def _sff_window(task):
+    """
+    Calibrates the motion-flux relation within one time window.
+
+    ``task`` is a tuple (t1, t2, work, config), where ``work`` holds the
+    TIME, CADENCENO, flux, MOM_CENTR1, MOM_CENTR2, PSF_CENTR1, PSF_CENTR2 and
+    SAP_QUALITY columns of rows t1 to t2 and ``config`` the fit parameters of
+    ``kepsff``. Returns a dict with the correction factors ``cfac`` and the
+    mask of thruster firings ``thrusters`` for all rows of the window,
+    together with the quantities plotted by ``_plot_window``, or None if a
+    fit failed.
+    """
+    t1, t2, work, config = task
+    bjdref = config['bjdref']
+    logfile = config['logfile']
+    verbose = config['verbose']
+    npoly_cxcy = config['npoly_cxcy']
+    sigma_cxcy = config['sigma_cxcy']
+    npoly_ardx = config['npoly_ardx']
+    npoly_dsdt = config['npoly_dsdt']
+    sigma_dsdt = config['sigma_dsdt']
+    npoly_arfl = config['npoly_arfl']
+    sigma_arfl = config['sigma_arfl']
+    if config['cenmethod'] == 'moments':
+        centr_rows = [3, 4]
+    else:
+        centr_rows = [5, 6]
+
+    # filter input data table
+    quality = work[7]
+    work2 = work[:, (quality == 0.0) | (quality > 1e5)]
+    intime = work2[0] + bjdref
+    cadenceno = work2[1].astype(int)
+    indata = work2[2]
+    centr1, centr2 = work2[centr_rows]
+
+    # fit centroid data with low-order polynomial
+    functype = getattr(kepfunc, 'poly' + str(npoly_cxcy))
+    pinit = np.append(np.nanmean(centr2), np.zeros(npoly_cxcy))
+    try:
+        coeffs, errors, covar, iiter, sigma, chi2, dof, fit, plotx, ploty = \
+            kepfit.lsqclip(functype, pinit, centr1, centr2, None,
+                           sigma_cxcy, sigma_cxcy, 10, logfile, verbose)
+    except:
+        warnmsg = ('WARNING -- KEPSFF: could not fit centroid data with'
+                   ' polynomial. There are no data points within the'
+                   ' range of input rows {} - {}. Either increase the'
+                   ' stepsize (with an appreciation of the effects on'
+                   ' light curve quality this will have!), or better yet'
+                   ' - cut the timeseries up to remove large gaps in the'
+                   ' input light curve using kepclip.'.format(t1, t2))
+        kepmsg.warn(logfile, warnmsg, verbose)
+        return None
+    cfit = _polyval(coeffs, centr1)
+
+    # reject outliers
+    good = np.abs(centr2 - cfit) < sigma_cxcy * sigma
+    time_good = intime[good]
+    centr1_good = centr1[good]
+    centr2_good = centr2[good]
+    flux_good = indata[good]
+    cad_good = cadenceno[good]
+
+    # covariance matrix for centroid time series
+    centr = np.array([centr1_good - np.nanmean(centr1_good),
+                      centr2_good - np.nanmean(centr2_good)])
+    covar = np.cov(centr)
+    # eigenvector eigenvalues of covariance matrix
+    [_, evec] = np.linalg.eigh(covar)
+    ex = np.arange(-10.0, 10.0, 0.1)
+    epar = evec[1, 1] / evec[0, 1] * ex
+    enor = evec[1, 0] / evec[0, 0] * ex
+    ex = ex + np.nanmean(centr1)
+    epar = epar + np.nanmean(centr2_good)
+    enor = enor + np.nanmean(centr2_good)
+    # rotate centroid data
+    centr_rot = np.dot(evec.T, centr)
+    # fit polynomial to rotated centroids
+    functype = getattr(kepfunc, 'poly' + str(npoly_ardx))
+    pinit = np.append(1.0, np.zeros(npoly_ardx))
+    try:
+        coeffs, errors, covar, iiter, sigma, chi2, dof, fit, plotx, ploty = \
+            kepfit.lsqclip(functype, pinit, centr_rot[1, :],
+                           centr_rot[0, :], None, 100.0, 100.0, 1, logfile,
+                           verbose)
+    except:
+        warnmsg = ('WARNING -- KEPSFF: could not fit rotated centroid data'
+                   ' with polynomial')
+        kepmsg.warn(logfile, warnmsg, verbose)
+        return None
+    rx = np.linspace(np.nanmin(centr_rot[1, :]),
+                     np.nanmax(centr_rot[1, :]), 100)
+    ry = _polyval(coeffs, rx)
+
+    # calculate arclength of centroids
+    drx = np.diff(rx)
+    s = np.concatenate([[0.0], np.cumsum(np.sqrt(1.0 + (np.diff(ry) / drx) ** 2)
+                                         * drx)])
+
+    # fit arclength as a function of strongest eigenvector
+    functype = getattr(kepfunc, 'poly' + str(npoly_ardx))
+    pinit = np.append(np.nanmean(s), np.zeros(npoly_ardx))
+    try:
+        acoeffs, errors, covar, iiter, sigma, chi2, dof, fit, plotx, ploty = \
+            kepfit.lsqclip(functype, pinit, rx, s, None, 100.0, 100.0, 100,
+                           logfile, verbose)
+    except:
+        warnmsg = ('WARNING -- KEPSFF: could not fit arclength data'
+                   ' with polynomial')
+        kepmsg.warn(logfile, warnmsg, verbose)
+        return None
+
+    # correlate arclength with detrended flux
+    t = time_good
+    x = _polyval(acoeffs, centr_rot[1, :])
+
+    # calculate time derivative of arclength s
+    dx = np.empty(len(x))
+    dx[1:] = np.diff(x) / np.diff(t)
+    dx[0] = dx[1]
+
+    # fit polynomial to derivative and flag outliers (thruster firings)
+    functype = getattr(kepfunc, 'poly' + str(npoly_dsdt))
+    pinit = np.append(np.nanmean(dx), np.zeros(npoly_dsdt))
+    try:
+        dcoeffs, errors, covar, iiter, dsigma, chi2, dof, fit, dumx, dumy = \
+            kepfit.lsqclip(functype, pinit, t, dx, None, 3.0, 3.0, 10,
+                           logfile, verbose)
+    except:
+        warnmsg = ('WARNING -- KEPSFF: could not fit arclength derivative'
+                   ' with polynomial.')
+        kepmsg.warn(logfile, warnmsg, verbose)
+        return None
+    dfit = _polyval(dcoeffs, t)
+    pnt = ((dx < dfit + sigma_dsdt * dsigma)
+           & (dx > dfit - sigma_dsdt * dsigma))
+    time_pnt = time_good[pnt]
+    flux_pnt = flux_good[pnt]
+    dx_pnt = dx[pnt]
+    s_pnt = x[pnt]
+    time_thr = time_good[~pnt]
+    dx_thr = dx[~pnt]
+    thr_cadence = cad_good[~pnt]
+
+    # fit arclength-flux correlation
+    functype = getattr(kepfunc, 'poly' + str(npoly_arfl))
+    pinit = np.append(np.nanmean(flux_pnt), np.zeros(npoly_arfl))
+    try:
+        ccoeffs, errors, covar, iiter, sigma, chi2, dof, fit, plx, ply = \
+            kepfit.lsqclip(functype, pinit, s_pnt, flux_pnt, None,
+                           sigma_arfl, sigma_arfl, 100, logfile, verbose)
+    except:
+        warnmsg = ('WARNING -- KEPSFF: could not fit arclength-flux'
+                   ' correlation with polynomial')
+        kepmsg.warn(logfile, warnmsg, verbose)
+        return None
+
+    def correction(centr1, centr2):
+        centr = np.array([centr1 - np.nanmean(centr1_good),
+                          centr2 - np.nanmean(centr2_good)])
+        centr_rot = np.dot(evec.T, centr)
+        return _polyval(ccoeffs, _polyval(acoeffs, centr_rot[1, :]))
+
+    # correction factors for unfiltered data, split for plotting
+    out_detsap = indata / correction(centr1, centr2)
+    gd = np.isin(intime, time_pnt)
+
+    return {'t1': t1, 't2': t2,
+            'cfac': correction(*work[centr_rows]),
+            'thrusters': np.isin(work[1].astype(int), thr_cadence),
+            'centr1': centr1, 'centr2': centr2,
+            'centr1_good': centr1_good, 'centr2_good': centr2_good,
+            'ex': ex, 'epar': epar, 'enor': enor, 'rx': rx, 's': s,
+            'plotx': plotx, 'ploty': ploty, 't': t, 'dx': dx,
+            'time_pnt': time_pnt, 'dx_pnt': dx_pnt, 'time_thr': time_thr,
+            'dx_thr': dx_thr, 'dfit': dfit, 'dsigma': dsigma,
+            's_pnt': s_pnt, 'flux_pnt': flux_pnt, 'plx': plx, 'ply': ply,
+            'intime': intime, 'indata': indata,
+            'tim_gd': intime[gd], 'flx_gd': out_detsap[gd],
+            'tim_bd': intime[~gd], 'flx_bd': out_detsap[~gd]}
+
+def _plot_window(window, iw, cadence, sigma_dsdt, outfile, logfile, verbose):
+    """Plots the calibration of one time window."""
+    (centr1, centr2, centr1_good, centr2_good, ex, epar, enor, rx, s, plotx,
+     ploty, t, dx, time_pnt, dx_pnt, time_thr, dx_thr, dfit, dsigma, s_pnt,
+     flux_pnt, plx, ply, intime, indata, tim_gd, flx_gd, tim_bd, flx_bd) = \
+        [window[k] for k in ['centr1', 'centr2', 'centr1_good', 'centr2_good',
+                             'ex', 'epar', 'enor', 'rx', 's', 'plotx', 'ploty',
+                             't', 'dx', 'time_pnt', 'dx_pnt', 'time_thr',
+                             'dx_thr', 'dfit', 'dsigma', 's_pnt', 'flux_pnt',
+                             'plx', 'ply', 'intime', 'indata', 'tim_gd',
+                             'flx_gd', 'tim_bd', 'flx_bd']]
+    # plot style and size
+    #kepplot.define(16, 14, logfile, verbose)
+    plt.figure(figsize=[20, 8])
+    plt.clf()
+
+    # plot x-centroid vs y-centroid
+    ax = kepplot.location([0.04, 0.57, 0.16, 0.41])
+    px = np.copy(centr1)
+    py = np.copy(centr2)
+    pxmin = px.min()
+    pxmax = px.max()
+    pymin = py.min()
+    pymax = py.max()
+    pxr = pxmax - pxmin
+    pyr = pymax - pymin
+    pad = 0.05
+    if pxr > pyr:
+        dely = (pxr - pyr) / 2
+        plt.xlim(pxmin - pxr * pad, pxmax + pxr * pad)
+        plt.ylim(pymin - dely - pyr * pad, pymax + dely + pyr * pad)
+    else:
+        delx = (pyr - pxr) / 2
+        plt.ylim(pymin - pyr * pad, pymax + pyr * pad)
+        plt.xlim(pxmin - delx - pxr * pad, pxmax + delx + pxr * pad)
+    plt.plot(px, py, color='#980000', markersize=5, marker='D', ls='')
+    plt.plot(centr1_good, centr2_good,color='#009900', markersize=5,
+             marker='D', ls='')
+    plt.plot(ex,epar,color='k',ls='-')
+    plt.plot(ex,enor,color='k',ls='-')
+    for tick in ax.xaxis.get_major_ticks():
+        tick.label.set_fontsize(14)
+    for tick in ax.yaxis.get_major_ticks():
+        tick.label.set_fontsize(14)
+    kepplot.labels('CCD Column', 'CCD Row', 'k', 16)
+    plt.grid()
+
+    # plot arclength fits vs drift along strongest eigenvector
+    ax = kepplot.location([0.24, 0.57, 0.16, 0.41])
+    px = rx - rx[0]
+    py = s - rx - (s[0] - rx[0])
+    py, ylab = kepplot.cleany(py, 1.0, logfile, verbose)
+    kepplot.RangeOfPlot(px, py, 0.05, False)
+    plt.plot(px, py, color='#009900', markersize=5, marker='D', ls='')
+    px = plotx - rx[0]
+    py = ploty - plotx - (s[0] - rx[0])
+    py, ylab = kepplot.cleany(py, 1.0, logfile, verbose)
+    plt.plot(px, py, color='r', ls='-', lw=3)
+    for tick in ax.xaxis.get_major_ticks():
+        tick.label.set_fontsize(14)
+    for tick in ax.yaxis.get_major_ticks():
+        tick.label.set_fontsize(14)
+    ylab = re.sub(' e\S+', ' pixels)', ylab)
+    ylab = re.sub(' s\S+', '', ylab)
+    ylab = re.sub('Flux', 's $-$ x\'', ylab)
+    kepplot.labels('Linear Drift [x\'] (pixels)', ylab, 'k', 16)
+    plt.grid()
+
+    # plot time derivative of arclength s
+    ax = kepplot.location([0.04,0.08,0.16,0.41])
+    px = np.copy(time_pnt)
+    py = np.copy(dx_pnt)
+    px, xlab = kepplot.cleanx(px,logfile,verbose)
+    kepplot.RangeOfPlot(px, dx, 0.05, False)
+    plt.plot(px, py, color='#009900', markersize=5, marker='D', ls='')
+    try:
+        px = np.copy(time_thr)
+        py = np.copy(dx_thr)
+        px, xlab = kepplot.cleanx(px, logfile, verbose)
+        plt.plot(px, py, color='#980000', markersize=5, marker='D', ls='')
+    except:
+        pass
+    px = np.copy(t)
+    py = np.copy(dfit)
+    px, xlab = kepplot.cleanx(px, logfile, verbose)
+    plt.plot(px, py, color='r', ls='-', lw=3)
+    py = np.copy(dfit + sigma_dsdt * dsigma)
+    plt.plot(px, py, color='r', ls='--', lw=3)
+    py = np.copy(dfit-sigma_dsdt*dsigma)
+    plt.plot(px,py,color='r',ls='--',lw=3)
+    for tick in ax.xaxis.get_major_ticks():
+        tick.label.set_fontsize(14)
+    for tick in ax.yaxis.get_major_ticks():
+        tick.label.set_fontsize(14)
+    kepplot.labels(xlab, 'ds/dt (pixels day$^{-1}$)', 'k', 16)
+    plt.grid()
+    # plot relation of arclength vs detrended flux
+    ax = kepplot.location([0.24, 0.08, 0.16, 0.41])
+    px = np.copy(s_pnt)
+    py = np.copy(flux_pnt)
+    py, ylab = kepplot.cleany(py, 1.0, logfile, verbose)
+    kepplot.RangeOfPlot(px, py, 0.05, False)
+    plt.plot(px, py, color='#009900', markersize=5, marker='D', ls='')
+    plt.plot(plx, ply, color='r', ls='-', lw=3)
+    for tick in ax.xaxis.get_major_ticks():
+        tick.label.set_fontsize(14)
+    for tick in ax.yaxis.get_major_ticks():
+        tick.label.set_fontsize(14)
+    kepplot.labels('Arclength [s] (pixels)', ylab, 'k', 16)
+    plt.grid()
+
+    # plot aperture photometry
+    kepplot.location([0.44, 0.53, 0.55, 0.45])
+    px, xlab = kepplot.cleanx(intime, logfile, verbose)
+    py, ylab = kepplot.cleany(indata, 1.0, logfile, verbose)
+    kepplot.RangeOfPlot(px, py, 0.01, True)
+    kepplot.plot1d(px, py, cadence, '#0000ff', 1.0, '#ffff00', 0.2, True)
+    kepplot.labels(' ',ylab,'k',16)
+    plt.setp(plt.gca(),xticklabels=[])
+    kepplot.labels(xlab,re.sub('Flux','Aperture Flux',ylab),'k',16)
+    plt.grid()
+    kepplot.location([0.44, 0.08, 0.55, 0.45])
+    kepplot.RangeOfPlot(px, py, 0.01, True)
+    px, xlab = kepplot.cleanx(tim_gd, logfile, verbose)
+    py, ylab = kepplot.cleany(flx_gd, 1.0, logfile, verbose)
+    kepplot.plot1d(px, py, cadence, '#0000ff', 1.0, '#ffff00', 0.2, True)
+    try:
+        px, xlab = kepplot.cleanx(tim_bd,logfile,verbose)
+        py = np.copy(flx_bd)
+        plt.plot(px, py,color='#980000',markersize=5,marker='D',ls='')
+    except:
+        pass
+    kepplot.labels(xlab,re.sub('Flux', 'Corrected Flux', ylab), 'k', 16)
+    plt.grid()
+    # render plot
+    plt.show()
+    plt.savefig(re.sub('.fits','_%d.png' % (iw + 1), outfile))
+
+
 def kepsff_main():
     import argparse
     parser = argparse.ArgumentParser(
@@ -766,9 +727,13 @@ def kepsff_main():
                         help='Write to a log file?')
     parser.add_argument('--logfile', '-l', help='Name of ascii log file',
                         default='kepsff.log', dest='logfile', type=str)
+    parser.add_argument('--nprocs', default=1,
+                        help=('Number of worker processes.'
+                              ' If 0, one per available CPU.'),
+                        type=int)
     args = parser.parse_args()
     kepsff(args.infile, args.outfile, args.datacol, args.cenmethod,
            args.stepsize, args.npoly_cxcy, args.sigma_cxcy, args.npoly_ardx,
            args.npoly_dsdt, args.sigma_dsdt, args.npoly_arfl,
            args.sigma_arfl, args.plot, args.overwrite, args.verbose,
-           args.logfile)
+           args.logfile, args.nprocs or None)
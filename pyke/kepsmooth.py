@@ -2,7 +2,6 @@ from .utils import PyKEArgumentHelpFormatter
 import numpy as np
 from astropy.io import fits as pyfits
 from matplotlib import pyplot as plt
-from tqdm import tqdm
 from . import kepio, kepmsg, kepkey, kepfunc
 
 
@@ -114,16 +113,9 @@ def kepsmooth(infile, outfile=None, datacol='SAP_FLUX', function='flat',
     try:
         nanclean = instr[1].header['NANCLEAN']
     except:
-        naxis2 = 0
-        for i in tqdm(range(len(table.field(0)))):
-            if (np.isfinite(barytime[i]) and np.isfinite(flux[i])
-                and flux[i] != 0.0):
-                table[naxis2] = table[i]
-                naxis2 += 1
-        instr[1].data = table[:naxis2]
-        comment = 'NaN cadences removed from data'
-        kepkey.new('NANCLEAN', True, comment, instr[1], outfile, logfile,
-                   verbose)
+        keep = kepio.finiterows(barytime, flux) & (flux != 0.0)
+        kepio.filterrows(instr[1], keep, outfile, logfile, verbose,
+                         nanclean=True)
 
     ## read table columns
     try:
@@ -202,8 +194,8 @@ def kepsmooth(infile, outfile=None, datacol='SAP_FLUX', function='flat',
 
     ## write output file
     print("Writing output file {}...".format(outfile))
-    for i in tqdm(range(len(outdata))):
-        instr[1].data.field(datacol)[i] = outdata[i]
+    kepio.writefitscol(outfile, instr[1].data, datacol, outdata, logfile,
+                       verbose)
     instr.writeto(outfile)
     ## close input file
     instr.close()
@@ -2,7 +2,7 @@ import math
 import random
 import numpy as np
 from scipy import linalg
-from . import kepmsg
+from . import kepmsg, kepio
 
 
 def mean_err(array):
@@ -31,27 +31,17 @@ def randarray(signal, err):
 
 def removeinfinlc(x, cols):
     """remove infinities from light curve data"""
+    finite = np.isfinite(x)
     for j in range(len(cols)):
-        work = []
-        datatype = cols[j].dtype
-        for i in range(len(x)):
-            if np.isfinite(x[i]):
-                work.append(cols[j][i])
-        cols[j] = np.array(work, dtype=datatype)
+        col = np.asarray(cols[j])
+        cols[j] = np.array(col[finite], dtype=col.dtype)
     return cols
 
 
 def filterOnRange(intime,tstart,tstop):
-    """filter on data within time ranges"""
-    outlist = []
-    for i in range(len(intime)):
-        for j in range(len(tstart)):
-            if intime[i] > tstart[j] and intime[i] < tstop[j]:
-                if len(outlist) == 0:
-                    outlist.append(i)
-                elif i > outlist[-1]:
-                    outlist.append(i)
-    return outlist
+    """indices of the data within the open time ranges"""
+    return np.flatnonzero(kepio.inranges(intime, tstart, tstop,
+                                         closed='neither'))
 
 
 def inv_normal_cummulative_function(p):
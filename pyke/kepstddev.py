@@ -9,7 +9,6 @@ from astropy.io import fits as pyfits
 from matplotlib import pyplot as plt
 from scipy import stats
 from copy import copy
-from tqdm import tqdm
 
 
 __all__ = ['kepstddev']
@@ -119,7 +118,8 @@ def kepstddev(infile, outfile=None, datacol='PDCSAP_FLUX', timescale=6.5,
     # filter input data table
     work1 = np.array([table.field('time'), table.field(datacol)])
     work1 = np.rot90(work1, 3)
-    work1 = work1[~np.isnan(work1).any(1)]
+    finite = ~np.isnan(work1).any(1)
+    work1 = work1[finite]
 
     # read table columns
     intime = work1[:, 1] + bjdref
@@ -215,16 +215,8 @@ def kepstddev(infile, outfile=None, datacol='PDCSAP_FLUX', timescale=6.5,
     plt.show()
 
     # add NaNs back into data
-    n = 0
-    work1 = np.array([], dtype='float32')
     instr = pyfits.open(infile)
-    table = kepio.readfitstab(infile, instr[1], logfile, verbose)
-    for i in tqdm(range(len(table.field(0)))):
-        if np.isfinite(table.field('time')[i]) and np.isfinite(table.field(datacol)[i]):
-            work1 = np.append(work1, cdpp[n])
-            n += 1
-        else:
-            work1 = np.append(work1, np.nan)
+    work1 = kepio.expandcol(cdpp, finite)
 
     # write output file
     print("Writing output file {}...".format(outfile))
@@ -1,4 +1,5 @@
 from .utils import PyKEArgumentHelpFormatter
+from multiprocessing.pool import ThreadPool
 import numpy as np
 from astropy.io import fits as pyfits
 from . import kepio, kepmsg, kepkey, kepstat
@@ -8,7 +9,7 @@ __all__ = ['kepstitch']
 
 
 def kepstitch(infiles, outfile=None, overwrite=False, verbose=False,
-              logfile='kepstich.log'):
+              logfile='kepstich.log', nthreads=1):
     """
     kepstitch -- Append short cadence months and/or long cadence quarters
 
@@ -39,6 +40,11 @@ def kepstitch(infiles, outfile=None, overwrite=False, verbose=False,
         Print informative messages and warnings to the shell and logfile?
     logfile : str
         Name of the logfile containing error and warning messages.
+    nthreads : int
+        Number of threads which read the headers of the input files in
+        parallel. The output table is allocated once from the row counts
+        in the headers, and the data of each file are then copied into
+        their slice of the table.
 
     Examples
     --------
@@ -59,9 +65,6 @@ def kepstitch(infiles, outfile=None, overwrite=False, verbose=False,
     if outfile is None:
         outfile = infiles[0].split('.')[0] + "-{}.fits".format(__all__[0])
 
-    # startup parameters
-    lct, bjd = [], []
-
     # log the call
     hashline = '--------------------------------------------------------------'
     kepmsg.log(logfile, hashline, verbose)
@@ -70,7 +73,8 @@ def kepstitch(infiles, outfile=None, overwrite=False, verbose=False,
             + ' outfile={}'.format(outfile)
             + ' overwrite={}'.format(overwrite)
             + ' verbose={}'.format(verbose)
-            + ' logfile={}'.format(logfile))
+            + ' logfile={}'.format(logfile)
+            + ' nthreads={}'.format(nthreads))
     kepmsg.log(logfile, call+'\n', verbose)
 
     # start time
@@ -88,56 +92,42 @@ def kepstitch(infiles, outfile=None, overwrite=False, verbose=False,
         errmsg = 'ERROR -- KEPSTITCH: {} exists. Use --overwrite'.format(outfile)
         kepmsg.err(logfile, errmsg, verbose)
 
-    # open output file
+    # first pass: row counts and time ranges from the headers
+    readers = [(infile, logfile, verbose) for infile in infiles]
+    if nthreads == 1:
+        summaries = [_read_summary(reader) for reader in readers]
+    else:
+        pool = ThreadPool(processes=nthreads)
+        try:
+            summaries = pool.map(_read_summary, readers)
+        finally:
+            pool.close()
+            pool.join()
+    nrows, lct, bjd, fitsvers = zip(*summaries)
+    fitsvers = fitsvers[-1]
+    offsets = np.cumsum((0,) + nrows)
+
+    # second pass: allocate the output table once, and copy the data of
+    # each file into its slice
     outstr = pyfits.open(infiles[0], 'readonly')
-    nrows1 = outstr[1].data.shape[0]
     head0 = outstr[0].header
     head1 = outstr[1].header
-
-    # open input files
-    nfiles = 0
-    for infile in infiles:
-        instr = pyfits.open(infile, 'readonly')
-        # append table data
-        if nfiles > 0:
-            nrows2 = instr[1].data.shape[0]
-            nrows = nrows1 + nrows2
-            outtab = pyfits.BinTableHDU.from_columns(outstr[1].columns, nrows=nrows)
-            for name in outstr[1].columns.names:
-                try:
-                    outtab.data.field(name)[nrows1:]=instr[1].data.field(name)
-                except:
-                    warnmsg = ('ERROR -- KEPSTITCH: column {} missing from'
-                               ' some files.'.format(name))
-                    kepmsg.warn(logfile, warnmsg, verbose)
-                    pass
-            outstr[1] = outtab
-            outstr[0].header = head0
-            outstr[1].header = head1
-            nrows1 = nrows
-
-        # start and stop times of data
-        fitsvers = 1.0
-        lc_start = kepkey.get(infile, instr[1], 'LC_START', logfile, verbose)
-        lc_end = kepkey.get(infile, instr[1], 'LC_END', logfile, verbose)
-        try:
-            startbjd = instr[1].header['STARTBJD']
-        except:
-            startbjd = kepkey.get(infile, instr[1], 'TSTART', logfile, verbose)
-            fitsvers = 2.0
-        try:
-            endbjd = instr[1].header['ENDBJD']
-        except:
-            endbjd = kepkey.get(infile, instr[1], 'TSTOP', logfile, verbose)
-            fitsvers = 2.0
-        lct.append(lc_start)
-        lct.append(lc_end)
-        bjd.append(startbjd)
-        bjd.append(endbjd)
-
+    outtab = pyfits.BinTableHDU.from_columns(outstr[1].columns,
+                                             header=head1, nrows=offsets[-1])
+    for i in range(1, len(infiles)):
+        instr = pyfits.open(infiles[i], 'readonly')
+        for name in outstr[1].columns.names:
+            try:
+                outtab.data.field(name)[offsets[i]:offsets[i + 1]] = \
+                    instr[1].data.field(name)
+            except:
+                warnmsg = ('ERROR -- KEPSTITCH: column {} missing from'
+                           ' some files.'.format(name))
+                kepmsg.warn(logfile, warnmsg, verbose)
         # close input files
         instr.close()
-        nfiles += 1
+    outstr[1] = outtab
+    outstr[0].header = head0
 
     # maxmimum and minimum times in file sample
     lc_start = np.min(lct)
@@ -164,6 +154,32 @@ def kepstitch(infiles, outfile=None, overwrite=False, verbose=False,
     ## end time
     kepmsg.clock('KEPSTITCH completed at', logfile, verbose)
 
+
+def _read_summary(reader):
+    """Returns the number of rows, the start and end cadence times, the
+    start and end BJDs, and the file version of the light curve table of a
+    file, from its header only."""
+    infile, logfile, verbose = reader
+    with pyfits.open(infile, 'readonly') as instr:
+        header = instr[1].header
+        nrows = header['NAXIS2']
+        # start and stop times of data
+        fitsvers = 1.0
+        lc_start = kepkey.get(infile, instr[1], 'LC_START', logfile, verbose)
+        lc_end = kepkey.get(infile, instr[1], 'LC_END', logfile, verbose)
+        try:
+            startbjd = header['STARTBJD']
+        except:
+            startbjd = kepkey.get(infile, instr[1], 'TSTART', logfile, verbose)
+            fitsvers = 2.0
+        try:
+            endbjd = header['ENDBJD']
+        except:
+            endbjd = kepkey.get(infile, instr[1], 'TSTOP', logfile, verbose)
+            fitsvers = 2.0
+    return (nrows, (lc_start, lc_end), (startbjd, endbjd), fitsvers)
+
+
 def kepstitch_main():
     import argparse
 
@@ -183,6 +199,9 @@ def kepstitch_main():
                         help='Write to a log file?')
     parser.add_argument('--logfile', '-l', help='Name of ascii log file',
                         default='kepstitch.log', dest='logfile', type=str)
+    parser.add_argument('--nthreads', default=1,
+                        help='Number of threads which read the input headers',
+                        type=int)
     args = parser.parse_args()
     kepstitch(args.infiles, args.outfile, args.overwrite, args.verbose,
-              args.logfile)
+              args.logfile, args.nthreads)
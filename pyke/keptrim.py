@@ -1,9 +1,7 @@
 from .utils import PyKEArgumentHelpFormatter
-import time, urllib
-import sys
+from .catalog import KeplerTargetCatalog
 import numpy as np
 from astropy.io import fits as pyfits
-from matplotlib import pyplot as plt
 from . import kepio
 from . import kepmsg
 from . import kepkey
@@ -13,7 +11,8 @@ __all__ = ['keptrim']
 
 
 def keptrim(infile, column, row, imsize, outfile=None, kepid=None,
-            overwrite=False, verbose=False, logfile='keptrim.log'):
+            overwrite=False, verbose=False, logfile='keptrim.log',
+            catalog=None):
     """
     keptrim -- trim pixels from Target Pixel Files
 
@@ -24,6 +23,11 @@ def keptrim(infile, column, row, imsize, outfile=None, kepid=None,
     calculations such as kepprfphot considertably and provides manual
     convenience for tasks such as kepmask.
 
+    Only the requested window of each cadence is read from the memory-mapped
+    input file, and the output is written in chunks of cadences, so that
+    the time and memory spent are proportional to the size of the subimage
+    rather than to the size of the input file.
+
     Parameters
     ----------
     infile : str
@@ -40,9 +44,9 @@ def keptrim(infile, column, row, imsize, outfile=None, kepid=None,
         to the same FITS format as archived light curves.
     kepid : None or int
         If the target is catalogued within the Kepler Input Catalog (KIC), then
-        the pixel row and column location will be extracted from the KIC
-        provided the Kepler ID is provided. The user must be online for this
-        feature to execute. If provided kepid will override column and row.
+        the pixel row and column location will be extracted from the local
+        target catalog provided the Kepler ID is provided. If provided kepid
+        will override column and row.
     overwrite : bool
         Overwrite the output file?
     verbose : bool
@@ -50,6 +54,10 @@ def keptrim(infile, column, row, imsize, outfile=None, kepid=None,
         the shell and a logfile.
     logfile : str
         Name of the logfile containing error and warning messages.
+    catalog : None or str
+        Filename of the local target catalog in which kepid is looked up.
+        See `KeplerTargetCatalog` for its format. If None, the default
+        catalog ``~/.pyke/catalog.fits`` is used.
 
     Examples
     --------
@@ -76,7 +84,8 @@ def keptrim(infile, column, row, imsize, outfile=None, kepid=None,
             + ' kepid={}'.format(kepid)
             + ' overwrite={}'.format(overwrite)
             + ' verbose={}'.format(verbose)
-            + ' logfile={}'.format(logfile))
+            + ' logfile={}'.format(logfile)
+            + ' catalog={}'.format(catalog))
     kepmsg.log(logfile, call+'\n', verbose)
 
     # start time
@@ -102,13 +111,15 @@ def keptrim(infile, column, row, imsize, outfile=None, kepid=None,
         season = cards0['SEASON'].value
     except:
         season = 0
-    # retrieve column and row from KIC
-    try:
-        kic = FOVKepID(str(kepid))
-        column = int(kic[98 + season * 5])
-        row = int(kic[97 + season * 5])
-    except:
-        pass
+    # retrieve column and row from the target catalog
+    if kepid is not None:
+        try:
+            _, column, row = KeplerTargetCatalog.load(catalog).position(
+                    kepid, season)
+        except (IOError, KeyError, ValueError) as e:
+            errmsg = ('ERROR -- KEPTRIM: cannot find the position of target '
+                      '{} in the target catalog. {}'.format(kepid, e))
+            kepmsg.err(logfile, errmsg, verbose)
 
     # convert CCD column and row to image column and row
     if imsize % 2 == 0:
@@ -138,39 +149,6 @@ def keptrim(infile, column, row, imsize, outfile=None, kepid=None,
                   'or relocate it''s center.'.format(infile))
         kepmsg.err(logfile, errmsg, verbose)
 
-    # time series data
-    time = instr[1].data.field('TIME')[:]
-    timecorr = instr[1].data.field('TIMECORR')[:]
-    cadenceno = instr[1].data.field('CADENCENO')[:]
-    raw_cnts = instr[1].data.field('RAW_CNTS')[:]
-    flux = instr[1].data.field('FLUX')[:]
-    flux_err = instr[1].data.field('FLUX_ERR')[:]
-    flux_bkg = instr[1].data.field('FLUX_BKG')[:]
-    flux_bkg_err = instr[1].data.field('FLUX_BKG_ERR')[:]
-    cosmic_rays = instr[1].data.field('COSMIC_RAYS')[:]
-    quality = instr[1].data.field('QUALITY')[:]
-    pos_corr1 = instr[1].data.field('POS_CORR1')[:]
-    pos_corr2 = instr[1].data.field('POS_CORR2')[:]
-
-    # resize time series
-    raw_cnts = raw_cnts[:, y1:y2, x1:x2]
-    flux = flux[:, y1:y2, x1:x2]
-    flux_err = flux_err[:, y1:y2, x1:x2]
-    flux_bkg = flux_bkg[:, y1:y2, x1:x2]
-    flux_bkg_err = flux_bkg_err[:, y1:y2, x1:x2]
-    cosmic_rays = cosmic_rays[:, y1:y2, x1:x2]
-
-    # reshape time series images
-    isize = np.shape(flux)[0]
-    jsize = np.shape(flux)[1]
-    ksize = np.shape(flux)[2]
-    raw_cnts = np.reshape(raw_cnts, (isize, jsize * ksize))
-    flux = np.reshape(flux, (isize, jsize * ksize))
-    flux_err = np.reshape(flux_err, (isize, jsize * ksize))
-    flux_bkg = np.reshape(flux_bkg, (isize, jsize * ksize))
-    flux_bkg_err = np.reshape(flux_bkg_err, (isize, jsize * ksize))
-    cosmic_rays = np.reshape(cosmic_rays, (isize, jsize * ksize))
-
     # pixel map data
     maskmap = np.array(instr[2].data[y1:y2,x1:x2])
 
@@ -185,38 +163,31 @@ def keptrim(infile, column, row, imsize, outfile=None, kepid=None,
         except:
             pass
     kepkey.history(call, hdu0, outfile, logfile, verbose)
-    outstr = pyfits.HDUList(hdu0)
 
     # construct output light curve extension
     coldim = '(' + str(imsize) + ',' + str(imsize) + ')'
     eformat = str(imsize*imsize) + 'E'
     jformat = str(imsize*imsize) + 'J'
-    kformat = str(imsize*imsize) + 'K'
-    col1 =  pyfits.Column(name='TIME', format='D', unit='BJD - 2454833',
-                          array=time)
-    col2 =  pyfits.Column(name='TIMECORR', format='E', unit='d',
-                          array=timecorr)
-    col3 =  pyfits.Column(name='CADENCENO', format='J', array=cadenceno)
+    col1 =  pyfits.Column(name='TIME', format='D', unit='BJD - 2454833')
+    col2 =  pyfits.Column(name='TIMECORR', format='E', unit='d')
+    col3 =  pyfits.Column(name='CADENCENO', format='J')
     col4 =  pyfits.Column(name='RAW_CNTS', format=jformat, unit='count',
-                          dim=coldim, array=raw_cnts)
-    col5 =  pyfits.Column(name='FLUX', format=eformat, unit='e-/s', dim=coldim,
-                          array=flux)
+                          dim=coldim)
+    col5 =  pyfits.Column(name='FLUX', format=eformat, unit='e-/s', dim=coldim)
     col6 =  pyfits.Column(name='FLUX_ERR', format=eformat, unit='e-/s',
-                          dim=coldim,array=flux_err)
+                          dim=coldim)
     col7 =  pyfits.Column(name='FLUX_BKG', format=eformat, unit='e-/s',
-                          dim=coldim,array=flux_bkg)
+                          dim=coldim)
     col8 =  pyfits.Column(name='FLUX_BKG_ERR', format=eformat, unit='e-/s',
-                          dim=coldim, array=flux_bkg_err)
+                          dim=coldim)
     col9 =  pyfits.Column(name='COSMIC_RAYS', format=eformat,unit='e-/s',
-                          dim=coldim, array=cosmic_rays)
-    col10 = pyfits.Column(name='QUALITY', format='J', array=quality)
-    col11 = pyfits.Column(name='POS_CORR1', format='E', unit='pixel',
-                          array=pos_corr1)
-    col12 = pyfits.Column(name='POS_CORR2', format='E', unit='pixel',
-                          array=pos_corr2)
+                          dim=coldim)
+    col10 = pyfits.Column(name='QUALITY', format='J')
+    col11 = pyfits.Column(name='POS_CORR1', format='E', unit='pixel')
+    col12 = pyfits.Column(name='POS_CORR2', format='E', unit='pixel')
     cols =  pyfits.ColDefs([col1, col2, col3, col4, col5, col6, col7, col8,
                             col9, col10, col11, col12])
-    hdu1 =  pyfits.BinTableHDU.from_columns(cols)
+    hdu1 =  pyfits.BinTableHDU.from_columns(cols, nrows=0)
     for i in range(len(cards1)):
         try:
             if cards1[i].keyword not in hdu1.header.keys():
@@ -226,55 +197,16 @@ def keptrim(infile, column, row, imsize, outfile=None, kepid=None,
                 hdu1.header.cards[cards1[i].keyword].comment = cards1[i].comment
         except:
             pass
-    hdu1.header['1CRV4P'] = (crval1p,
-                             '[pixel] detector coordinate at reference pixel')
-    hdu1.header['2CRV4P'] = (crval2p,
-                             '[pixel] detector coordinate at reference pixel')
-    hdu1.header['1CRPX4'] = ((imsize + 1) / 2,
-                             '[pixel] reference pixel along image axis 1')
-    hdu1.header['2CRPX4'] = ((imsize + 1) / 2,
-                             '[pixel] reference pixel along image axis 2')
-    hdu1.header['1CRV5P'] = (crval1p,
-                             '[pixel] detector coordinate at reference pixel')
-    hdu1.header['2CRV5P'] = (crval2p,
-                             '[pixel] detector coordinate at reference pixel')
-    hdu1.header['1CRPX5'] = ((imsize + 1) / 2,
-                             '[pixel] reference pixel along image axis 1')
-    hdu1.header['2CRPX5'] = ((imsize + 1) / 2,
-                             '[pixel] reference pixel along image axis 2')
-    hdu1.header['1CRV6P'] = (crval1p,
-                             '[pixel] detector coordinate at reference pixel')
-    hdu1.header['2CRV6P'] = (crval2p,
-                             '[pixel] detector coordinate at reference pixel')
-    hdu1.header['1CRPX6'] = ((imsize + 1) / 2,
-                             '[pixel] reference pixel along image axis 1')
-    hdu1.header['2CRPX6'] = ((imsize + 1) / 2,
-                             '[pixel] reference pixel along image axis 2')
-    hdu1.header['1CRV7P'] = (crval1p,
-                             '[pixel] detector coordinate at reference pixel')
-    hdu1.header['2CRV7P'] = (crval2p,
-                             '[pixel] detector coordinate at reference pixel')
-    hdu1.header['1CRPX7'] = ((imsize + 1) / 2,
-                             '[pixel] reference pixel along image axis 1')
-    hdu1.header['2CRPX7'] = ((imsize + 1) / 2,
-                             '[pixel] reference pixel along image axis 2')
-    hdu1.header['1CRV8P'] = (crval1p,
-                             '[pixel] detector coordinate at reference pixel')
-    hdu1.header['2CRV8P'] = (crval2p,
-                             '[pixel] detector coordinate at reference pixel')
-    hdu1.header['1CRPX8'] = ((imsize + 1) / 2,
-                             '[pixel] reference pixel along image axis 1')
-    hdu1.header['2CRPX8'] = ((imsize + 1) / 2,
-                             '[pixel] reference pixel along image axis 2')
-    hdu1.header['1CRV9P'] = (crval1p,
-                             '[pixel] detector coordinate at reference pixel')
-    hdu1.header['2CRV9P'] = (crval2p,
-                             '[pixel] detector coordinate at reference pixel')
-    hdu1.header['1CRPX9'] = ((imsize + 1) / 2,
-                             '[pixel] reference pixel along image axis 1')
-    hdu1.header['2CRPX9'] = ((imsize + 1) / 2,
-                             '[pixel] reference pixel along image axis 2')
-    outstr.append(hdu1)
+    for n in range(4, 10):
+        hdu1.header['1CRV{}P'.format(n)] = (crval1p,
+                '[pixel] detector coordinate at reference pixel')
+        hdu1.header['2CRV{}P'.format(n)] = (crval2p,
+                '[pixel] detector coordinate at reference pixel')
+        hdu1.header['1CRPX{}'.format(n)] = ((imsize + 1) / 2,
+                '[pixel] reference pixel along image axis 1')
+        hdu1.header['2CRPX{}'.format(n)] = ((imsize + 1) / 2,
+                '[pixel] reference pixel along image axis 2')
+    hdu1.header['NAXIS2'] = len(instr[1].data)
 
     # construct output mask bitmap extension
     hdu2 = pyfits.ImageHDU(maskmap)
@@ -297,35 +229,59 @@ def keptrim(infile, column, row, imsize, outfile=None, kepid=None,
                               '[pixel] reference pixel along image axis 1')
     hdu2.header['CRPIX2' ] = ((imsize + 1) / 2,
                               '[pixel] reference pixel along image axis 2')
-    outstr.append(hdu2)
 
-    # write output file
+    # write output file, streaming the subimage time series
     print("Writing output file {}...".format(outfile))
-    outstr.writeto(outfile,checksum=True)
+    hdu0.writeto(outfile, checksum=True)
+    streamcutout(outfile, hdu1.header, cols, instr[1].data, y1, y2, x1, x2)
+    pyfits.append(outfile, hdu2.data, hdu2.header, checksum=True)
+    with pyfits.open(outfile, mode='update', memmap=True) as outstr:
+        outstr[1].add_checksum()
     # close input structure
     instr.close()
     # end time
     kepmsg.clock('KEPTRIM finished at', logfile, verbose)
 
-def FOVKepID(id):
-    """KIC retrieval based upon KepID"""
+def streamcutout(outfile, header, cols, intable, y1, y2, x1, x2,
+                 chunksize=1024):
+    """
+    Appends the subimage [y1:y2, x1:x2] of a target pixel table to a FITS
+    file.
 
-    # build mast query
-    url  = ('http://archive.stsci.edu/kepler/kepler_fov/search.php?'
-            'action=Search&kic_kepler_id={}'.format(id) + '&max_records=100'
-            '&verb=3&outputformat=CSV')
+    The cadences are processed in chunks of ``chunksize`` rows. Only the
+    subimage window of the pixel columns is read from ``intable``, which is
+    expected to be memory-mapped, and each chunk is streamed to the output
+    file before the next one is read.
 
-    # retrieve results from MAST
-    out = ''
-    lines = urllib.urlopen(url)
-    for line in lines:
-        line = line.strip()
-        if (len(line) > 0
-            and 'Kepler' not in line
-            and 'integer' not in line
-            and 'no rows found' not in line):
-            out = line.split(',')
-    return out
+    Parameters
+    ----------
+    outfile : str
+        Name of the output FITS file.
+    header : astropy.io.fits.Header
+        Header of the output table extension, with NAXIS2 set to the number
+        of rows of ``intable``.
+    cols : astropy.io.fits.ColDefs
+        Columns of the output table. Columns with an image per row are
+        trimmed, the other ones are copied.
+    intable : astropy.io.fits.FITS_rec
+        Input target pixel table.
+    """
+    dtype = cols.dtype.newbyteorder('>')
+    fields = [(name, intable.field(name)) for name in dtype.names]
+    nrows = len(intable)
+    stream = pyfits.StreamingHDU(outfile, header)
+    try:
+        for start in range(0, nrows, chunksize):
+            stop = min(start + chunksize, nrows)
+            rows = np.zeros(stop - start, dtype=dtype)
+            for name, field in fields:
+                if field.ndim == 3:
+                    rows[name] = field[start:stop, y1:y2, x1:x2]
+                else:
+                    rows[name] = field[start:stop]
+            stream.write(rows.view('uint8'))
+    finally:
+        stream.close()
 
 def keptrim_main():
     import argparse
@@ -352,6 +308,10 @@ def keptrim_main():
                         help='Write to a log file?')
     parser.add_argument('--logfile', '-l', help='Name of ascii log file',
                         default='keptrim.log', type=str)
+    parser.add_argument('--catalog', default=None,
+                        help=('Local target catalog in which kepid is looked'
+                              ' up'), type=str)
     args = parser.parse_args()
     keptrim(args.infile, args.column, args.row, args.imsize, args.outfile,
-            args.kepid, args.overwrite, args.verbose, args.logfile)
+            args.kepid, args.overwrite, args.verbose, args.logfile,
+            args.catalog)
@@ -1,16 +1,18 @@
 import copy
+from collections import OrderedDict
 import numpy as np
-from scipy import signal
+from scipy import signal, interpolate, ndimage
 from astropy.io import fits as pyfits
 from astropy.stats import sigma_clip
 from tqdm import tqdm
 import oktopus
-import requests
-from bs4 import BeautifulSoup
-from .utils import running_mean, channel_to_module_output, KeplerQualityFlags
+from .utils import (running_mean, channel_to_module_output, KeplerQualityFlags,
+                    pool_imap)
+from .cbv import KeplerCBVStore
 from matplotlib import pyplot as plt
 
-__all__ = ['LightCurve', 'KeplerLightCurveFile', 'KeplerCBVCorrector',
+__all__ = ['LightCurve', 'LightCurveCollection', 'KeplerLightCurveFile',
+           'KeplerCBVCorrector', 'KeplerCBVBatchCorrector', 'ArcLengthDetrender',
            'SimplePixelLevelDecorrelationDetrender']
 
 
@@ -26,7 +28,15 @@ class LightCurve(object):
         Data flux for every time point
     flux_err : array-like
         Uncertainty on each flux data point
+    segments : array-like
+        Index of the first cadence of each light curve from which this one
+        was stitched, followed by the total length. None if the light curve
+        was not stitched.
     """
+    # per-cadence attributes, and attributes which describe the whole
+    # light curve
+    _columns = ('time', 'flux', 'flux_err')
+    _metadata = ()
 
     def __init__(self, time, flux, flux_err=None):
         self.time = np.asarray(time)
@@ -35,36 +45,75 @@ class LightCurve(object):
             self.flux_err = np.asarray(flux_err)
         else:
             self.flux_err = None
+        self.segments = None
 
-    def stitch(self, *others):
+    def stitch(self, *others, **kwargs):
         """
         Stitches LightCurve objects.
 
+        Every per-cadence column (e.g. ``time``, ``flux``, ``flux_err`` and,
+        for a ``KeplerLightCurve``, ``cadenceno`` and ``quality``) is
+        concatenated in a single pass. Columns which are missing in any of
+        the light curves, or do not match the length of its time, are set
+        to None. Metadata, such as ``channel`` or
+        ``quarter``, are kept if they are the same in all light curves and
+        set to None otherwise.
+
         Parameters
         ----------
         *others : LightCurve objects
             Light curves to be stitched.
+        normalize : bool, optional
+            If True, the flux and flux_err of each light curve are divided
+            by its median flux before stitching. Defaults to False.
 
         Returns
         -------
         stitched_lc : LightCurve object
-            Stitched light curve.
+            Stitched light curve, of the same class as this one. Its
+            ``segments`` attribute holds the index of the first cadence of
+            each input light curve, followed by the total length.
         """
-        time = self.time
-        flux = self.flux
-        flux_err = self.flux_err
-
-        for i in range(len(others)):
-            time = np.append(time, others[i].time)
-            flux = np.append(flux, others[i].flux)
-            flux_err = np.append(flux_err, others[i].flux_err)
-
-        return LightCurve(time=time, flux=flux, flux_err=flux_err)
+        normalize = kwargs.pop('normalize', False)
+        if kwargs:
+            raise TypeError("stitch() got an unexpected keyword argument "
+                            "'{}'".format(next(iter(kwargs))))
+        lcs = (self,) + others
+        stitched_lc = copy.copy(self)
+        for name in self._columns:
+            columns = [getattr(lc, name, None) for lc in lcs]
+            if any(column is None or len(column) != len(lc.time)
+                   for column, lc in zip(columns, lcs)):
+                setattr(stitched_lc, name, None)
+            else:
+                setattr(stitched_lc, name, np.concatenate(columns))
+        for name in self._metadata:
+            if any(getattr(lc, name, None) != getattr(self, name)
+                   for lc in others):
+                setattr(stitched_lc, name, None)
+        stitched_lc.segments = np.concatenate([[0], np.cumsum([len(lc.time)
+                                                               for lc in lcs])])
 
-    def flatten(self, window_length=101, polyorder=3, **kwargs):
+        if normalize:
+            norm = np.repeat([np.nanmedian(lc.flux) for lc in lcs],
+                             np.diff(stitched_lc.segments))
+            stitched_lc.flux = stitched_lc.flux / norm
+            if stitched_lc.flux_err is not None:
+                stitched_lc.flux_err = stitched_lc.flux_err / norm
+        return stitched_lc
+
+    def flatten(self, window_length=101, polyorder=3, break_tolerance=5,
+                niters=1, sigma=3., **kwargs):
         """
         Removes low frequency trend using scipy's Savitzky-Golay filter.
 
+        The light curve is split into contiguous segments, at the boundaries
+        recorded by `stitch` and wherever the time between consecutive
+        cadences exceeds ``break_tolerance`` times the median cadence, so
+        that the trend is not smeared across gaps. Each segment is filtered
+        independently; segments shorter than ``window_length`` are filtered
+        with the longest window which fits.
+
         Parameters
         ----------
         window_length : int
@@ -73,6 +122,17 @@ class LightCurve(object):
         polyorder : int
             The order of the polynomial used to fit the samples. ``polyorder``
             must be less than window_length.
+        break_tolerance : float or None
+            Gaps longer than ``break_tolerance`` times the median time
+            between cadences split the light curve. If None, only the
+            boundaries recorded by `stitch` are used.
+        niters : int
+            Number of iterations. After each iteration but the last, the
+            fluxes which deviate from the trend by more than ``sigma``
+            standard deviations are replaced by the trend, so that outliers
+            and transits do not bias it.
+        sigma : float
+            Clipping threshold used when ``niters`` > 1.
         **kwargs : dict
             Dictionary of arguments to be passed to `scipy.signal.savgol_filter`.
 
@@ -84,18 +144,49 @@ class LightCurve(object):
             Trend in the lightcurve data
         """
         lc_clean = self.remove_nans()  # The SG filter does not allow NaNs
-        trend_signal = signal.savgol_filter(x=lc_clean.flux,
-                                            window_length=window_length,
-                                            polyorder=polyorder, **kwargs)
+        offsets = lc_clean._segment_offsets(break_tolerance)
+        flux = lc_clean.flux
+        for i in range(niters):
+            trend_signal = _segmented_savgol(flux, offsets, window_length,
+                                             polyorder, **kwargs)
+            if i < niters - 1:
+                residual = lc_clean.flux - trend_signal
+                outlier_mask = np.ma.getmaskarray(sigma_clip(residual,
+                                                             sigma=sigma))
+                flux = np.where(outlier_mask, trend_signal, lc_clean.flux)
         flatten_lc = copy.copy(lc_clean)
         flatten_lc.flux = lc_clean.flux / trend_signal
         if flatten_lc.flux_err is not None:
             flatten_lc.flux_err = lc_clean.flux_err / trend_signal
-        trend_lc = copy.copy(self)
+        trend_lc = copy.copy(lc_clean)
         trend_lc.flux = trend_signal
 
         return flatten_lc, trend_lc
 
+    def _segment_offsets(self, break_tolerance=5):
+        """Returns the index of the first cadence of each contiguous segment,
+        followed by the length of the light curve."""
+        breaks = [[0, len(self.time)]]
+        if self.segments is not None:
+            breaks.append(self.segments)
+        if break_tolerance is not None and len(self.time) > 1:
+            dt = np.diff(self.time)
+            breaks.append(np.flatnonzero(dt > break_tolerance
+                                         * np.nanmedian(dt)) + 1)
+        return np.unique(np.concatenate(breaks)).astype(int)
+
+    def _take(self, mask):
+        """Returns a copy holding the cadences where ``mask`` is True,
+        in every per-cadence column."""
+        lc = copy.copy(self)
+        for name in self._columns:
+            column = getattr(self, name, None)
+            if column is not None and len(column) == len(mask):
+                setattr(lc, name, np.asarray(column)[mask])
+        if self.segments is not None:
+            lc.segments = np.concatenate([[0], np.cumsum(mask)])[self.segments]
+        return lc
+
     def fold(self, period, phase=0.):
         """Folds the lightcurve at a specified ``period`` and ``phase``.
 
@@ -131,13 +222,7 @@ class LightCurve(object):
         clean_lightcurve : LightCurve object
             A new ``LightCurve`` from which NaNs fluxes have been removed.
         """
-        lc = copy.copy(self)
-        nan_mask = np.isnan(lc.flux)
-        lc.time = self.time[~nan_mask]
-        lc.flux = self.flux[~nan_mask]
-        if lc.flux_err is not None:
-            lc.flux_err = self.flux_err[~nan_mask]
-        return lc
+        return self._take(~np.isnan(self.flux))
 
     def remove_outliers(self, sigma=5.):
         """Removes outlier flux values using sigma-clipping.
@@ -157,13 +242,9 @@ class LightCurve(object):
         clean_lightcurve : LightCurve object
             A new ``LightCurve`` in which outliers have been removed.
         """
-        new_lc = copy.copy(self)
-        outlier_mask = sigma_clip(data=new_lc.flux, sigma=sigma).mask
-        new_lc.time = self.time[~outlier_mask]
-        new_lc.flux = self.flux[~outlier_mask]
-        if new_lc.flux_err is not None:
-            new_lc.flux_err = self.flux_err[~outlier_mask]
-        return new_lc
+        outlier_mask = np.ma.getmaskarray(sigma_clip(data=self.flux,
+                                                     sigma=sigma))
+        return self._take(~outlier_mask)
 
     def cdpp(self, transit_duration=13, savgol_window=101, savgol_polyorder=2,
              sigma_clip=5.):
@@ -312,6 +393,10 @@ class KeplerLightCurve(LightCurve):
     keplerid : int
         Kepler ID number
     """
+    _columns = LightCurve._columns + ('centroid_col', 'centroid_row',
+                                      'quality', 'cadenceno')
+    _metadata = ('quality_bitmask', 'channel', 'campaign', 'quarter',
+                 'mission', 'keplerid')
 
     def __init__(self, time, flux, flux_err=None, centroid_col=None,
                  centroid_row=None, quality=None, quality_bitmask=None,
@@ -333,6 +418,373 @@ class KeplerLightCurve(LightCurve):
         raise NotImplementedError()
 
 
+class LightCurveCollection(object):
+    """
+    Stores many light curves in flat columns and applies the ``LightCurve``
+    operations to all of them at once.
+
+    The time, flux and flux_err of all members are concatenated into single
+    arrays; member ``i`` occupies the range ``offsets[i]:offsets[i + 1]``.
+    The operations are implemented as vectorized computations along the
+    concatenated time axis, rather than as one Python call per member.
+    Individual ``LightCurve`` objects are only created when members are
+    accessed, by indexing or iterating over the collection.
+
+    Attributes
+    ----------
+    time : array-like
+        Concatenated time measurements of all members
+    flux : array-like
+        Concatenated flux of all members
+    offsets : array-like
+        Start index of each member in the concatenated arrays, followed by
+        their total length
+    flux_err : array-like
+        Concatenated flux uncertainties of all members
+
+    Examples
+    --------
+    >>> from pyke import LightCurve, LightCurveCollection
+    >>> lcs = LightCurveCollection.from_lightcurves([lc1, lc2]) # doctest: +SKIP
+    >>> flat, trend = lcs.remove_nans().flatten() # doctest: +SKIP
+    >>> lcs.cdpp() # doctest: +SKIP
+    >>> flat[0].plot() # doctest: +SKIP
+    """
+
+    def __init__(self, time, flux, offsets, flux_err=None):
+        self.time = np.asarray(time)
+        self.flux = np.asarray(flux)
+        self.offsets = np.asarray(offsets, dtype=int)
+        if flux_err is not None:
+            self.flux_err = np.asarray(flux_err)
+        else:
+            self.flux_err = None
+
+    @classmethod
+    def from_lightcurves(cls, lightcurves):
+        """Concatenates a sequence of ``LightCurve`` objects into a
+        collection. ``flux_err`` is kept only if every member has one."""
+        lightcurves = list(lightcurves)
+        offsets = np.concatenate([[0], np.cumsum([len(lc.time)
+                                                  for lc in lightcurves])])
+        if lightcurves and all(lc.flux_err is not None for lc in lightcurves):
+            flux_err = np.concatenate([lc.flux_err for lc in lightcurves])
+        else:
+            flux_err = None
+        return cls(np.concatenate([lc.time for lc in lightcurves] or [[]]),
+                   np.concatenate([lc.flux for lc in lightcurves] or [[]]),
+                   offsets, flux_err=flux_err)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        i = range(len(self))[i]
+        start, stop = self.offsets[i], self.offsets[i + 1]
+        flux_err = None
+        if self.flux_err is not None:
+            flux_err = self.flux_err[start:stop]
+        return LightCurve(self.time[start:stop], self.flux[start:stop],
+                          flux_err=flux_err)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    @property
+    def lengths(self):
+        """Number of cadences of each member."""
+        return np.diff(self.offsets)
+
+    def _segments(self):
+        """Returns the index of the member of each cadence."""
+        return np.repeat(np.arange(len(self)), self.lengths)
+
+    def _select(self, mask, order=None):
+        """Returns the collection of the cadences where ``mask`` is True,
+        optionally reordered by ``order``."""
+        counts = np.concatenate([[0], np.cumsum(mask)])
+        index = np.flatnonzero(mask) if order is None else order[mask[order]]
+        flux_err = None
+        if self.flux_err is not None:
+            flux_err = self.flux_err[index]
+        return LightCurveCollection(self.time[index], self.flux[index],
+                                    counts[self.offsets], flux_err=flux_err)
+
+    def remove_nans(self):
+        """Removes cadences where the flux is NaN from all members.
+
+        Returns
+        -------
+        clean_collection : LightCurveCollection object
+        """
+        return self._select(~np.isnan(self.flux))
+
+    def remove_outliers(self, sigma=5.):
+        """Removes outlier flux values from all members using
+        sigma-clipping around the median of each member, as
+        `LightCurve.remove_outliers` does.
+
+        Parameters
+        ----------
+        sigma : float, optional
+            The number of standard deviations to use for clipping outliers.
+            Defaults to 5.
+
+        Returns
+        -------
+        clean_collection : LightCurveCollection object
+        """
+        return self._select(_segmented_sigma_clip(self.flux, self.offsets,
+                                                  sigma))
+
+    def flatten(self, window_length=101, polyorder=3, break_tolerance=5):
+        """
+        Removes the low frequency trend of all members using a
+        Savitzky-Golay filter, as `LightCurve.flatten` does.
+
+        Parameters
+        ----------
+        window_length : int
+            The length of the filter window (i.e. the number of coefficients).
+            ``window_length`` must be a positive odd integer.
+        polyorder : int
+            The order of the polynomial used to fit the samples. ``polyorder``
+            must be less than window_length.
+        break_tolerance : float or None
+            Gaps longer than ``break_tolerance`` times the median time
+            between the cadences of a member split it into segments which
+            are filtered independently.
+
+        Returns
+        -------
+        flatten_collection : LightCurveCollection object
+            Flattened light curves
+        trend_collection : LightCurveCollection object
+            Trends in the light curves
+        """
+        clean = self.remove_nans()
+        offsets = clean.offsets
+        if break_tolerance is not None and len(clean.time) > 1:
+            segments = clean._segments()
+            dt = np.diff(clean.time)
+            internal = segments[1:] == segments[:-1]
+            dt_offsets = np.concatenate([[0], np.cumsum(np.bincount(
+                segments[1:][internal], minlength=len(clean)))])
+            median_dt = _segmented_median(dt[internal], dt_offsets)
+            with np.errstate(invalid='ignore'):
+                gaps = internal & (dt > break_tolerance
+                                   * median_dt[segments[1:]])
+            offsets = np.union1d(offsets, np.flatnonzero(gaps) + 1)
+        trend_signal = _segmented_savgol(clean.flux, offsets, window_length,
+                                         polyorder)
+        flux_err = None
+        if clean.flux_err is not None:
+            flux_err = clean.flux_err / trend_signal
+        flatten_collection = LightCurveCollection(clean.time,
+                                                  clean.flux / trend_signal,
+                                                  clean.offsets,
+                                                  flux_err=flux_err)
+        trend_collection = LightCurveCollection(clean.time, trend_signal,
+                                                clean.offsets)
+        return flatten_collection, trend_collection
+
+    def fold(self, period, phase=0.):
+        """Folds all members at the specified ``period`` and ``phase``,
+        which are either scalars or arrays holding one value per member.
+
+        Returns
+        -------
+        folded_collection : LightCurveCollection object
+            Collection in which each member is folded and sorted by phase.
+        """
+        segments = self._segments()
+        period = np.broadcast_to(period, (len(self),))[segments]
+        phase = np.broadcast_to(phase, (len(self),))[segments]
+        fold_time = ((self.time - phase + 0.5 * period) / period) % 1 - 0.5
+        order = _segmented_argsort(fold_time, segments)
+        folded = self._select(np.ones(len(self.time), dtype=bool), order)
+        folded.time = fold_time[order]
+        return folded
+
+    def cdpp(self, transit_duration=13, savgol_window=101, savgol_polyorder=2,
+             sigma_clip=5.):
+        """Estimates the CDPP noise metric of all members using the
+        Savitzky-Golay (SG) method. See `LightCurve.cdpp` for a
+        description of the method and the parameters.
+
+        Returns
+        -------
+        cdpp : array
+            Savitzky-Golay CDPP noise metric of each member, in units
+            parts-per-million (ppm).
+        """
+        if not isinstance(transit_duration, int):
+            raise TypeError("transit_duration must be an integer")
+        detrended, _ = self.flatten(window_length=savgol_window,
+                                    polyorder=savgol_polyorder)
+        cleaned = detrended.remove_outliers(sigma=sigma_clip)
+        segments = cleaned._segments()
+        lengths = cleaned.lengths
+        # running mean of the deviations from the mean of each member,
+        # which keeps the cumulative sum small
+        deviation = cleaned.flux - _segmented_mean(cleaned.flux, segments,
+                                                   lengths)[segments]
+        cumsum = np.concatenate([[0.], np.cumsum(deviation)])
+        starts = np.flatnonzero(np.arange(len(deviation)) + transit_duration
+                                <= cleaned.offsets[1:][segments])
+        mean = (cumsum[starts + transit_duration]
+                - cumsum[starts]) / float(transit_duration)
+        mean_lengths = np.clip(lengths - transit_duration + 1, 0, None)
+        mean_segments = segments[starts]
+        mean -= _segmented_mean(mean, mean_segments, mean_lengths)[mean_segments]
+        variance = _segmented_mean(mean ** 2, mean_segments, mean_lengths)
+        return np.sqrt(variance) * 1e6
+
+
+def _segmented_mean(values, segments, lengths):
+    """Returns the mean of ``values`` within each segment."""
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return (np.bincount(segments, values, minlength=len(lengths))
+                / lengths)
+
+
+def _segmented_argsort(values, segments):
+    """Returns the indices which sort ``values`` within each segment,
+    keeping the segments in order. Faster than `numpy.lexsort`."""
+    order = np.argsort(values, kind='mergesort')
+    return order[np.argsort(segments[order], kind='mergesort')]
+
+
+def _sorted_segments(values, offsets):
+    """Returns ``values`` sorted within each segment, with the NaNs at the
+    end of each segment, the index of the segment of each value and the
+    number of non-NaN values of each segment."""
+    lengths = np.diff(offsets)
+    segments = np.repeat(np.arange(len(lengths)), lengths)
+    order = _segmented_argsort(values, segments)
+    count = np.bincount(segments, ~np.isnan(values),
+                        minlength=len(lengths)).astype(int)
+    return values[order], segments, count
+
+
+def _segmented_take(sorted_values, offsets, index):
+    """Returns the ``index``-th sorted value of each segment, or NaN where
+    the segment is empty."""
+    if len(sorted_values) == 0:
+        return np.full(len(index), np.nan)
+    position = np.minimum(offsets[:-1] + index, len(sorted_values) - 1)
+    return np.where(np.diff(offsets) > 0, sorted_values[position], np.nan)
+
+
+def _segmented_median(values, offsets):
+    """Returns the median of the non-NaN values of each segment."""
+    if len(offsets) < 2:
+        return np.zeros(0)
+    values, _, count = _sorted_segments(np.asarray(values, dtype=float),
+                                        offsets)
+    return 0.5 * (_segmented_take(values, offsets,
+                                  np.maximum(count - 1, 0) // 2)
+                  + _segmented_take(values, offsets, count // 2))
+
+
+def _segmented_sigma_clip(values, offsets, sigma, maxiters=5):
+    """
+    Returns a mask of the values which are kept by iterative sigma-clipping
+    around the median of each segment, as `astropy.stats.sigma_clip` does
+    with its default arguments. NaNs are always rejected.
+
+    The values are sorted once within each segment, so that the values kept
+    by every iteration are a contiguous range of ranks within their segment;
+    medians are then read at the middle of the ranges, and means and
+    standard deviations are accumulated per segment with `numpy.bincount`.
+    All the work arrays have the size of ``values``.
+    """
+    values = np.asarray(values, dtype=float)
+    if len(values) == 0:
+        return np.zeros(0, dtype=bool)
+    ordered, segments, hi = _sorted_segments(values, offsets)
+    nsegments = len(hi)
+    rank = np.arange(len(values)) - offsets[:-1][segments]
+    lo = np.zeros(nsegments, dtype=int)
+    for _ in range(maxiters):
+        count = hi - lo
+        kept = (rank >= lo[segments]) & (rank < hi[segments])
+        with np.errstate(invalid='ignore', divide='ignore'):
+            median = 0.5 * (
+                _segmented_take(ordered, offsets,
+                                np.maximum(lo + (count - 1) // 2, 0))
+                + _segmented_take(ordered, offsets, lo + count // 2))
+            mean = np.bincount(segments, np.where(kept, ordered, 0.),
+                               minlength=nsegments) / count
+            deviation = np.where(kept, ordered - mean[segments], 0.)
+            std = np.sqrt(np.bincount(segments, deviation ** 2,
+                                      minlength=nsegments) / count)
+            lower = median - sigma * std
+            upper = median + sigma * std
+            new_lo = np.maximum(lo, np.bincount(
+                        segments, ordered < lower[segments],
+                        minlength=nsegments).astype(int))
+            new_hi = np.minimum(hi, np.bincount(
+                        segments, ordered <= upper[segments],
+                        minlength=nsegments).astype(int))
+        new_hi = np.maximum(new_hi, new_lo)
+        if np.array_equal(new_lo, lo) and np.array_equal(new_hi, hi):
+            break
+        lo, hi = new_lo, new_hi
+    with np.errstate(invalid='ignore'):
+        return (values >= lower[segments]) & (values <= upper[segments])
+
+
+def _segmented_savgol(values, offsets, window_length, polyorder, **kwargs):
+    """
+    Applies `scipy.signal.savgol_filter`, with its default 'interp' mode, to
+    each segment of ``values``: interior points are computed by a single
+    convolution of the concatenated values, and the edges of each segment
+    are replaced by polynomial fits to their first and last
+    ``window_length`` values. Segments shorter than ``window_length`` are
+    filtered with the longest odd window which fits, or replaced by their
+    mean if that window is not longer than ``polyorder``. If any
+    ``kwargs`` are given, they are passed to `scipy.signal.savgol_filter`,
+    which is then called on each segment.
+    """
+    values = np.asarray(values, dtype=float)
+    lengths = np.diff(offsets)
+    full = lengths >= window_length
+    if kwargs:
+        filtered = np.empty(len(values))
+        for start, stop in zip(offsets[:-1][full], offsets[1:][full]):
+            filtered[start:stop] = signal.savgol_filter(values[start:stop],
+                                                        window_length,
+                                                        polyorder, **kwargs)
+    else:
+        coeffs = signal.savgol_coeffs(window_length, polyorder)
+        filtered = ndimage.convolve1d(values, coeffs, mode='constant')
+        # polynomial fit to a window, evaluated at its first and last half
+        halflen = window_length // 2
+        position = np.arange(window_length)
+        fit = np.linalg.pinv(np.vander(position, polyorder + 1))
+        edge = np.dot(np.vander(position, polyorder + 1), fit)
+        window = position[np.newaxis, :]
+        for start, rows in [(offsets[:-1][full], slice(None, halflen)),
+                            (offsets[1:][full] - window_length,
+                             slice(-halflen, None))]:
+            index = start[:, np.newaxis] + window
+            filtered[index[:, rows]] = np.dot(values[index], edge[rows].T)
+    # short segments are filtered together, grouped by length
+    short_starts = offsets[:-1][~full]
+    for length in np.unique(lengths[~full]):
+        index = (short_starts[lengths[~full] == length][:, np.newaxis]
+                 + np.arange(length))
+        short_window = length - 1 + length % 2
+        if short_window > polyorder:
+            filtered[index] = signal.savgol_filter(values[index], short_window,
+                                                   polyorder, axis=1, **kwargs)
+        elif length > 0:
+            filtered[index] = np.mean(values[index], axis=1)[:, np.newaxis]
+    return filtered
+
+
 class KeplerLightCurveFile(object):
     """Defines a class for a given light curve FITS file from NASA's Kepler and
     K2 missions.
@@ -517,6 +969,9 @@ class KeplerCBVCorrector(SystematicsCorrector):
         A class that describes a cost function.
         The default is :class:`oktopus.LaplacianLikelihood`, which is tantamount
         to the L1 norm.
+    cbv_store : KeplerCBVStore object or None
+        Local repository from which the CBV files are read. If None, a store
+        in the default directory, shared by all correctors, is used.
 
     Examples
     --------
@@ -534,14 +989,18 @@ class KeplerCBVCorrector(SystematicsCorrector):
     >>> plt.legend() # doctest: +SKIP
     """
 
-    def __init__(self, lc_file, loss_function=oktopus.LaplacianLikelihood):
+    _default_cbv_store = None
+
+    def __init__(self, lc_file, loss_function=oktopus.LaplacianLikelihood,
+                 cbv_store=None):
         self.lc_file = lc_file
         self.loss_function = loss_function
-
-        if self.lc_file.mission == 'Kepler':
-            self.cbv_base_url = "http://archive.stsci.edu/missions/kepler/cbv/"
-        elif self.lc_file.mission == 'K2':
-            self.cbv_base_url = "http://archive.stsci.edu/missions/k2/cbv/"
+        if cbv_store is None:
+            if KeplerCBVCorrector._default_cbv_store is None:
+                KeplerCBVCorrector._default_cbv_store = KeplerCBVStore()
+            cbv_store = KeplerCBVCorrector._default_cbv_store
+        self.cbv_store = cbv_store
+        self.cbv_base_url = KeplerCBVStore.BASE_URLS.get(self.lc_file.mission)
 
     @property
     def lc_file(self):
@@ -584,13 +1043,11 @@ class KeplerCBVCorrector(SystematicsCorrector):
             The list of cotrending basis vectors to fit to the data. For example,
             [1, 2] will fit the first two basis vectors.
         """
-        module, output = channel_to_module_output(self.lc_file.channel)
-        cbv_file = pyfits.open(self.get_cbv_url())
-        cbv_data = cbv_file['MODOUT_{0}_{1}'.format(module, output)].data
+        cbv_data = self.get_cbvs()
 
         cbv_array = []
         for i in cbvs:
-            cbv_array.append(cbv_data.field('VECTOR_{}'.format(i))[self.lc_file.quality_mask])
+            cbv_array.append(cbv_data['VECTOR_{}'.format(i)][self.lc_file.quality_mask])
         cbv_array = np.asarray(cbv_array)
 
         sap_lc = self.lc_file.SAP_FLUX
@@ -610,36 +1067,376 @@ class KeplerCBVCorrector(SystematicsCorrector):
 
         return LightCurve(time=sap_lc.time, flux=flux_hat.reshape(-1))
 
+    def get_cbvs(self):
+        """
+        Returns the table of cotrending basis vectors of the module/output
+        of the light curve, read from ``cbv_store``.
+        """
+        if self._cadence == 'short':
+            raise ValueError("CBVs are only available for long cadence data. "
+                             "Use kepcotrend, which interpolates them, to "
+                             "cotrend short cadence light curves.")
+        module, output = channel_to_module_output(self.lc_file.channel)
+        return self.cbv_store.get_cbvs(self.lc_file.mission, self._period,
+                                       module, output, self._cadence)
+
     def get_cbv_url(self):
-        # gets the html page and finds all references to 'a' tag
-        # keeps the ones for which 'href' ends with 'fits'
-        # this might slow things down in case the user wants to fit 1e3 stars
-        soup = BeautifulSoup(requests.get(self.cbv_base_url).text, 'html.parser')
-        cbv_files = [fn['href'] for fn in soup.find_all('a') if fn['href'].endswith('fits')]
-
-        if self.lc_file.mission == 'Kepler':
-            if self.lc_file.quarter < 10:
-                quarter = 'q0' + str(self.lc_file.quarter)
-            else:
-                quarter = 'q' + str(self.lc_file.quarter)
-            for cbv_file in cbv_files:
-                if quarter + '-d25' in cbv_file:
-                    break
-        elif self.lc_file.mission == 'K2':
-            if self.lc_file.campaign <= 8:
-                campaign = 'c0' + str(self.lc_file.campaign)
-            else:
-                campaign = 'c' + str(self.lc_file.campaign)
-            for cbv_file in cbv_files:
-                if campaign in cbv_file:
-                    break
+        """Returns the url of the CBV file at MAST."""
+        return self.cbv_store.get_url(self.lc_file.mission, self._period,
+                                      self._cadence)
 
-        return self.cbv_base_url + cbv_file
+    @property
+    def _period(self):
+        if self.lc_file.mission == 'K2':
+            return self.lc_file.campaign
+        return self.lc_file.quarter
+
+    @property
+    def _cadence(self):
+        obsmode = self.lc_file.header(ext=0).get('OBSMODE', 'long cadence')
+        return 'short' if 'short' in obsmode else 'long'
+
+
+class KeplerCBVBatchCorrector(SystematicsCorrector):
+    r"""Remove systematic trends from many Kepler light curves at once by
+    fitting cotrending basis vectors.
+
+    The light curves are grouped by mission, quarter/campaign, cadence type
+    and channel. Since all targets in a group share the same basis vectors,
+    the CBV design matrix is built once per group and the coefficients of
+    all targets are obtained with a few batched linear algebra calls:
+    a weighted least-squares solve for the L2 norm, and iteratively
+    reweighted least squares (IRLS) for the L1 norm.
+
+    Attributes
+    ----------
+    lc_files : list of KeplerLightCurveFile objects or str
+        Light curve files, or paths to them, to be cotrended.
+    loss_function : oktopus.Likelihood subclass
+        Either :class:`oktopus.LaplacianLikelihood` (L1 norm, the default) or
+        :class:`oktopus.GaussianLikelihood` (L2 norm). The objective is the
+        same as in :class:`KeplerCBVCorrector`.
+    cbv_store : KeplerCBVStore object or None
+        Local repository from which the CBV files are read. If None, the
+        default store shared by all correctors is used.
+
+    Examples
+    --------
+    >>> from pyke import KeplerCBVBatchCorrector
+    >>> batch = KeplerCBVBatchCorrector(filenames) # doctest: +SKIP
+    >>> cbv_lcs = batch.correct(cbvs=[1, 2, 3]) # doctest: +SKIP
+    >>> batch.coeffs.shape # doctest: +SKIP
+    (2000, 3)
+    """
+
+    def __init__(self, lc_files, loss_function=oktopus.LaplacianLikelihood,
+                 cbv_store=None):
+        if loss_function not in (oktopus.LaplacianLikelihood,
+                                 oktopus.GaussianLikelihood):
+            raise ValueError("loss_function must be either LaplacianLikelihood"
+                             " or GaussianLikelihood, got {}.".format(loss_function))
+        self.correctors = [KeplerCBVCorrector(lc_file, loss_function, cbv_store)
+                           for lc_file in lc_files]
+        self.loss_function = loss_function
+
+    @property
+    def coeffs(self):
+        """
+        Returns the fitted coefficients, one row per light curve.
+        """
+        return self._coeffs
+
+    def correct(self, cbvs=[1, 2], max_iter=100, tol=1e-8):
+        """
+        Correct the SAP_FLUX of all light curves by fitting a number of
+        cotrending basis vectors `cbvs`.
+
+        Parameters
+        ----------
+        cbvs : list of ints
+            The list of cotrending basis vectors to fit to the data. For example,
+            [1, 2] will fit the first two basis vectors.
+        max_iter : int
+            Maximum number of IRLS iterations (L1 norm only).
+        tol : float
+            The IRLS iterations stop when no coefficient changes by more than
+            ``tol`` (L1 norm only).
+
+        Returns
+        -------
+        cbv_lcs : list of LightCurve objects
+            Corrected light curves, in the same order as ``lc_files``.
+        """
+        groups = OrderedDict()
+        for idx, corrector in enumerate(self.correctors):
+            lcf = corrector.lc_file
+            key = (lcf.mission, corrector._period, corrector._cadence, lcf.channel)
+            groups.setdefault(key, []).append(idx)
+
+        self._coeffs = np.zeros((len(self.correctors), len(cbvs)))
+        cbv_lcs = [None] * len(self.correctors)
+        for idxs in groups.values():
+            cbv_data = self.correctors[idxs[0]].get_cbvs()
+            # design matrix, shape (ncadences, ncbvs)
+            X = np.array([cbv_data['VECTOR_{}'.format(i)] for i in cbvs],
+                         dtype='float64').T
+            lcs = [self.correctors[idx].lc_file.SAP_FLUX for idx in idxs]
+            masks = [self.correctors[idx].lc_file.quality_mask for idx in idxs]
+            if any(len(mask) != X.shape[0] for mask in masks):
+                raise ValueError("The light curves and the CBVs must have the "
+                                 "same number of cadences.")
+
+            # normalized fluxes and errors, shape (ncadences, ntargets)
+            median = np.array([np.nanmedian(lc.flux) for lc in lcs])
+            flux = np.full((X.shape[0], len(lcs)), np.nan)
+            var = np.full((X.shape[0], len(lcs)), np.nan)
+            for k in range(len(lcs)):
+                flux[masks[k], k] = lcs[k].flux / median[k] - 1
+                var[masks[k], k] = lcs[k].flux_err / median[k]
+            with np.errstate(invalid='ignore'):
+                good = np.isfinite(flux) & np.isfinite(var) & (var > 0)
+            flux[~good] = 0.
+            var[~good] = 1.
+
+            coeffs = self._fit(X, flux, var, good, max_iter, tol)
+            model = np.dot(X, coeffs)
+            for k, idx in enumerate(idxs):
+                self._coeffs[idx] = coeffs[:, k]
+                flux_hat = lcs[k].flux - median[k] * model[masks[k], k]
+                cbv_lcs[idx] = LightCurve(time=lcs[k].time, flux=flux_hat)
+        return cbv_lcs
+
+    def _fit(self, X, flux, var, good, max_iter, tol):
+        """Returns the coefficients, shape (ncbvs, ntargets), which minimize
+        the loss of every column of ``flux``."""
+        if self.loss_function is oktopus.GaussianLikelihood:
+            return _weighted_lstsq(X, flux, good / var)
+
+        # L1: IRLS approximation of sum |r| / sqrt(var)
+        weights = good / np.sqrt(var)
+        coeffs = _weighted_lstsq(X, flux, weights)
+        for i in range(max_iter):
+            residuals = np.abs(flux - np.dot(X, coeffs))
+            new_coeffs = _weighted_lstsq(X, flux,
+                                         weights / np.maximum(residuals, 1e-10))
+            converged = np.nanmax(np.abs(new_coeffs - coeffs)) < tol
+            coeffs = new_coeffs
+            if converged:
+                break
+        return coeffs
+
+
+def _weighted_lstsq(X, y, w):
+    """
+    Solves the weighted least-squares problems
+    min_c sum_t w[t, k] * (y[t, k] - X[t] . c[:, k]) ** 2
+    for all columns k at once, through their normal equations.
+
+    Parameters
+    ----------
+    X : ndarray, shape (n, p)
+    y, w : ndarray, shape (n, K)
+
+    Returns
+    -------
+    c : ndarray, shape (p, K)
+    """
+    n, p = X.shape
+    # A[k] = X^T diag(w[:, k]) X, computed for all k with a single product
+    A = np.dot(w.T, (X[:, :, np.newaxis] * X[:, np.newaxis, :]).reshape(n, p * p))
+    A = A.reshape(-1, p, p)
+    b = np.dot(X.T, w * y).T[:, :, np.newaxis]
+    try:
+        c = np.linalg.solve(A, b)[:, :, 0]
+    except np.linalg.LinAlgError:
+        c = np.array([np.linalg.lstsq(A[k], b[k, :, 0], rcond=None)[0]
+                      for k in range(A.shape[0])])
+    return c.T
 
 
 class ArcLengthDetrender(Detrender):
-    def detrend(time, flux):
-        pass
+    """
+    Implements the Self Flat Fielding (SFF) method of Vanderburg & Johnson
+    [1]_ in memory, i.e., without the intermediate files used by ``kepsff``.
+
+    Within each time window, the centroids are rotated onto their principal
+    axes, the motion is parametrized by the arclength along a polynomial
+    fitted to the rotated centroids, and the flux is divided by its
+    dependence on the arclength, estimated by interpolating between binned
+    medians. Long-term variability is removed by a least-squares spline in
+    time before each iteration.
+
+    Attributes
+    ----------
+    lc : KeplerLightCurve object
+        Light curve to be corrected. Its ``centroid_col`` and
+        ``centroid_row`` must be defined.
+
+    Examples
+    --------
+    >>> from pyke import KeplerLightCurveFile
+    >>> lc = KeplerLightCurveFile(path).get_lightcurve('SAP_FLUX') # doctest: +SKIP
+    >>> corrected_lc = ArcLengthDetrender(lc).detrend(windows=10) # doctest: +SKIP
+
+    References
+    ----------
+    .. [1] Vanderburg & Johnson. A Technique for Extracting Highly Precise \
+           Photometry for the Two-Wheeled Kepler Mission.
+    """
+
+    def __init__(self, lc):
+        if lc.centroid_col is None or lc.centroid_row is None:
+            raise ValueError("ArcLengthDetrender requires a light curve "
+                             "with centroid_col and centroid_row.")
+        self.lc = lc
+
+    def detrend(self, windows=1, polyorder=5, bins=15, niters=3, sigma_1=3.,
+                sigma_2=5., knotspacing=1.5, restore_trend=False):
+        """
+        Parameters
+        ----------
+        windows : int
+            Number of contiguous time windows which are corrected
+            independently.
+        polyorder : int
+            Degree of the polynomial which describes the path of the rotated
+            centroids.
+        bins : int
+            Number of arclength bins, holding equal numbers of cadences, in
+            which the flux-arclength relation is estimated.
+        niters : int
+            Number of iterations of long-term detrending and arclength
+            correction.
+        sigma_1 : float
+            Clipping threshold for the flux within each arclength bin.
+        sigma_2 : float
+            Clipping threshold for the rotated centroids.
+        knotspacing : float
+            Spacing, in days, of the knots of the long-term spline.
+        restore_trend : bool
+            Whether to multiply the corrected flux back by the long-term
+            trend.
+
+        Returns
+        -------
+        corrected_lc : LightCurve object
+            Copy of ``lc`` with the corrected flux. Cadences in which the
+            time, flux or centroids are not finite are set to NaN.
+        """
+        time = np.asarray(self.lc.time, dtype=float)
+        flux = np.asarray(self.lc.flux, dtype=float)
+        col = np.asarray(self.lc.centroid_col, dtype=float)
+        row = np.asarray(self.lc.centroid_row, dtype=float)
+        good = (np.isfinite(time) & np.isfinite(flux)
+                & np.isfinite(col) & np.isfinite(row))
+
+        correction = np.full(len(time), np.nan)
+        for idx in np.array_split(np.flatnonzero(good), windows):
+            if len(idx) > 0:
+                correction[idx] = self._correct_window(time[idx], flux[idx],
+                                                       col[idx], row[idx],
+                                                       polyorder, bins, niters,
+                                                       sigma_1, sigma_2,
+                                                       knotspacing, restore_trend)
+
+        corrected_lc = copy.copy(self.lc)
+        corrected_lc.flux = flux / correction
+        if self.lc.flux_err is not None:
+            corrected_lc.flux_err = np.asarray(self.lc.flux_err) / correction
+        return corrected_lc
+
+    def _correct_window(self, time, flux, col, row, polyorder, bins, niters,
+                        sigma_1, sigma_2, knotspacing, restore_trend):
+        """Returns the factors by which the flux of one window is divided."""
+        s = self.arclength(col, row, polyorder, sigma_2)
+        order = np.argsort(s)
+        trend = np.ones(len(time))
+        correction = np.ones(len(time))
+        for _ in range(niters):
+            iter_trend = self._long_term_trend(time, flux / correction / trend,
+                                               knotspacing)
+            trend *= iter_trend
+            normflux = flux / correction / trend
+            correction *= self._bin_and_interpolate(s, normflux, order, bins,
+                                                    sigma_1)
+        if restore_trend:
+            return correction
+        return correction * trend
+
+    @staticmethod
+    def arclength(col, row, polyorder=5, sigma=5.):
+        """
+        Returns the arclength of each cadence along the path of the
+        centroids, measured from the start of the path.
+
+        The centroids are rotated onto their principal axes, a polynomial of
+        degree ``polyorder`` is fitted to the minor as a function of the
+        major coordinate, and the arclength along the polynomial is
+        integrated on a fine grid.
+        """
+        centroids = np.array([col - np.mean(col), row - np.mean(row)])
+        _, eig_vecs = np.linalg.eigh(np.cov(centroids))
+        # eigh sorts the eigenvalues in ascending order
+        minor, major = np.dot(eig_vecs.T, centroids)
+        if np.ptp(major) == 0:
+            return np.zeros(len(major))
+        mask = ~np.ma.getmaskarray(sigma_clip(minor, sigma=sigma))
+        if mask.sum() <= polyorder:
+            mask = np.ones(len(minor), dtype=bool)
+        poly = np.poly1d(np.polyfit(major[mask], minor[mask], polyorder))
+        x = np.linspace(major.min(), major.max(), 1000)
+        ds = np.sqrt(1. + poly.deriv()(x) ** 2)
+        s = np.concatenate([[0.], np.cumsum(0.5 * (ds[1:] + ds[:-1])
+                                            * np.diff(x))])
+        return np.interp(major, x, s)
+
+    @staticmethod
+    def _long_term_trend(time, flux, knotspacing):
+        """Fits a cubic least-squares spline with knots placed at quantiles
+        of ``time`` roughly every ``knotspacing`` days."""
+        nknots = int((time[-1] - time[0]) / knotspacing)
+        nknots = min(nknots, len(time) // 4 - 1)
+        if nknots < 1:
+            return np.full(len(time), np.median(flux))
+        knots = np.percentile(time, np.linspace(0, 100, nknots + 2)[1:-1])
+        try:
+            spline = interpolate.LSQUnivariateSpline(time, flux, knots, k=3)
+        except ValueError:
+            return np.full(len(time), np.median(flux))
+        return spline(time)
+
+    @staticmethod
+    def _bin_and_interpolate(s, flux, order, bins, sigma, maxiters=5):
+        """Interpolates linearly between the sigma-clipped medians of the
+        flux in ``bins`` arclength bins of equal occupation."""
+        bins = max(1, min(bins, len(s) // 2))
+        # lay the bins out as the rows of NaN-padded arrays
+        size = -(-len(s) // bins)
+        s_bin = np.full(bins * size, np.nan)
+        flux_bin = np.full(bins * size, np.nan)
+        start = np.linspace(0, len(s), bins + 1).astype(int)
+        slot = (np.arange(len(s)) - np.repeat(start[:-1], np.diff(start))
+                + np.repeat(np.arange(bins) * size, np.diff(start)))
+        s_bin[slot] = s[order]
+        flux_bin[slot] = flux[order]
+        s_bin = s_bin.reshape(bins, size)
+        flux_bin = flux_bin.reshape(bins, size)
+        for _ in range(maxiters):
+            deviation = np.abs(flux_bin - np.nanmedian(flux_bin, axis=1)[:, None])
+            with np.errstate(invalid='ignore'):
+                clip = deviation > sigma * np.nanstd(flux_bin, axis=1)[:, None]
+            if not clip.any():
+                break
+            flux_bin[clip] = np.nan
+        s_bin, unique = np.unique(np.nanmedian(s_bin, axis=1),
+                                  return_index=True)
+        flux_bin = np.nanmedian(flux_bin, axis=1)[unique]
+        if len(s_bin) == 1:
+            return np.full(len(s), flux_bin[0])
+        interp = interpolate.interp1d(s_bin, flux_bin, bounds_error=False,
+                                      fill_value='extrapolate',
+                                      assume_sorted=True)
+        return interp(s)
 
 
 class SimplePixelLevelDecorrelationDetrender(Detrender):
@@ -674,27 +1471,95 @@ class SimplePixelLevelDecorrelationDetrender(Detrender):
         self.time = time
         self.tpf_flux = tpf_flux
 
-    def detrend(self, window_length=None, polyorder=2):
+    def detrend(self, window_length=None, polyorder=2, pld_order=1,
+                n_pca_terms=10, regularization=0., nprocs=1):
+        """
+        Parameters
+        ----------
+        window_length : int
+            Number of cadences in each window, which are detrended
+            independently. Defaults to half the length of the time series.
+        polyorder : int
+            Degree of the polynomial in time added to the design matrix.
+        pld_order : int
+            Order of the PLD. If 2, products of pairs of fractional pixel
+            fluxes are added to the first order terms.
+        n_pca_terms : int
+            Number of principal components kept of the fractional pixel
+            fluxes before their products are formed, and of the second
+            order terms. The number of second order regressors is bounded
+            by ``n_pca_terms`` regardless of the size of the aperture.
+        regularization : float
+            Strength of the L2 (ridge) penalty applied to the PLD weights.
+            If 0, the design matrix is solved by ordinary least squares.
+        nprocs : int or None
+            Number of worker processes among which the windows are
+            distributed. If ``None``, one worker per available CPU is used.
+
+        Returns
+        -------
+        detrended_lc : LightCurve object
+            Detrended light curve, offset by the median of the total flux.
+        """
         k = window_length
         if not k:
             k = int(len(self.time) / 2) - 1
         n_windows = int(len(self.time) / k)
-        flux_detrended = np.array([])
-        for n in range(1, n_windows + 1):
-            flux_detrended = np.append(flux_detrended,
-                                       self._pld(self.tpf_flux[(n - 1) * k:n * k], polyorder))
-        flux_detrended = np.append(flux_detrended, self._pld(self.tpf_flux[n * k:], polyorder))
+        edges = [n * k for n in range(n_windows + 1)] + [len(self.time)]
+        tasks = [(self.tpf_flux[start:stop], polyorder, pld_order,
+                  n_pca_terms, regularization)
+                 for start, stop in zip(edges[:-1], edges[1:])]
+
+        flux_detrended = np.empty(len(self.time))
+        windows = pool_imap(_pld_window, tasks, nprocs)
+        for window_flux, (start, stop) in zip(windows, zip(edges[:-1],
+                                                           edges[1:])):
+            flux_detrended[start:stop] = window_flux
         return LightCurve(self.time, flux_detrended + np.nanmedian(np.nansum(self.tpf_flux, axis=(1, 2))))
 
-    def _pld(self, tpf_flux, polyorder=2):
+    @staticmethod
+    def _pld(tpf_flux, polyorder=2, pld_order=1, n_pca_terms=10,
+             regularization=0.):
         if len(tpf_flux) == 0:
             return np.array([])
         pixels_series = tpf_flux.reshape((tpf_flux.shape[0], -1))
-        lightcurve = np.nansum(pixels_series, axis=1).reshape(-1, 1)
+        lightcurve = np.nansum(pixels_series, axis=1)
+        # pixels with missing data are left out of the design matrix
+        pixels_series = pixels_series[:, np.isfinite(pixels_series).all(axis=0)]
         # design matrix
-        X = pixels_series / lightcurve
-        X = np.hstack((X, np.array([np.linspace(0, 1, tpf_flux.shape[0]) ** n for n in range(polyorder+1)]).T))
-        opt_weights = np.linalg.solve(np.dot(X.T, X), np.dot(X.T, lightcurve))
-        model = np.dot(X, opt_weights)
+        X = pixels_series / lightcurve[:, np.newaxis]
+        regressors = [X]
+        if pld_order > 1:
+            components = _principal_components(X, n_pca_terms)
+            i, j = np.triu_indices(components.shape[1])
+            products = components[:, i] * components[:, j]
+            regressors.append(_principal_components(products, n_pca_terms))
+        time_poly = np.vander(np.linspace(0, 1, tpf_flux.shape[0]),
+                              polyorder + 1, increasing=True)
+        X = np.hstack(regressors + [time_poly])
+        y = lightcurve
+        if regularization > 0:
+            # ridge penalty on the PLD weights, as extra rows of the system
+            n_pld = X.shape[1] - time_poly.shape[1]
+            penalty = np.zeros((n_pld, X.shape[1]))
+            penalty[:, :n_pld] = np.sqrt(regularization) * np.eye(n_pld)
+            X = np.vstack((X, penalty))
+            y = np.concatenate((y, np.zeros(n_pld)))
+        opt_weights = np.linalg.lstsq(X, y, rcond=None)[0]
+        model = np.dot(X[:len(lightcurve)], opt_weights)
         flux_detrended = lightcurve - model
         return flux_detrended
+
+
+def _principal_components(X, n_components):
+    """Returns the projections of the mean-subtracted columns of ``X`` onto
+    its ``n_components`` leading principal axes."""
+    X = X - X.mean(axis=0)
+    u, s, _ = np.linalg.svd(X, full_matrices=False)
+    n_components = min(n_components, len(s))
+    return u[:, :n_components] * s[:n_components]
+
+
+def _pld_window(task):
+    """Detrends one window of a SimplePixelLevelDecorrelationDetrender."""
+    return SimplePixelLevelDecorrelationDetrender._pld(*task)
@@ -1,6 +1,8 @@
 from abc import abstractmethod
 import math
 import scipy
+import scipy.interpolate
+import scipy.sparse
 import numpy as np
 import tqdm
 import sys
@@ -29,7 +31,8 @@ else:
         return len(signature(func).parameters)
 
 
-__all__ = ['PRFPhotometry', 'SceneModel', 'KeplerPRF', 'SimpleKeplerPRF', 'get_initial_guesses']
+__all__ = ['PRFPhotometry', 'SceneModel', 'SparseSceneModel', 'KeplerPRF',
+           'SimpleKeplerPRF', 'get_initial_guesses']
 
 
 class PRFPhotometry(object):
@@ -177,10 +180,10 @@ class SceneModel(object):
         bkg_params : scalar or array-like
             Parameters for the background model
         """
-        self.mm = []
-        for i in range(self.n_models):
-            self.mm.append(self.prfs[i](*params[self.n_params[i]:self.n_params[i+1]]))
-        self.scene_model = np.sum(self.mm, axis=0) + self.bkg_model(*params[-self.bkg_order:])
+        self.scene_model = self.prfs[0](*params[self.n_params[0]:self.n_params[1]])
+        for i in range(1, self.n_models):
+            self.scene_model = self.scene_model + self.prfs[i](*params[self.n_params[i]:self.n_params[i+1]])
+        self.scene_model = self.scene_model + self.bkg_model(*params[-self.bkg_order:])
         return self.scene_model
 
     def gradient(self, *params):
@@ -198,6 +201,133 @@ class SceneModel(object):
                            self.prfs[0].row, self.prfs[0].row + self.prfs[0].shape[0]), **kwargs)
 
 
+class SparseSceneModel(SceneModel):
+    """
+    Scene model for crowded fields in which every PRF is evaluated only
+    within a truncated footprint around its center.
+
+    The model image is preallocated once and each source is accumulated
+    in place into its footprint, so that the cost of an evaluation scales
+    with the number of sources times the footprint size rather than with
+    the number of sources times the stamp size.
+
+    Attributes
+    ----------
+    prfs : list of KeplerPRF or SimpleKeplerPRF
+        A list of prfs. All of them must be defined on the same stamp,
+        i.e., share the same ``shape``, ``column`` and ``row``.
+    bkg_model : callable
+        A function that models the background variation.
+        Default is a constant background
+    footprint : float or None
+        Half-width, in pixels, of the square region around each center in
+        which the PRF is evaluated. If None, the support of the calibrated
+        PRF, stretched by the scale parameters of each source, is used.
+
+    Examples
+    --------
+    >>> from pyke import SimpleKeplerPRF, SparseSceneModel
+    >>> prfs = [SimpleKeplerPRF(channel=16, shape=[50, 50], column=0, row=0)
+    ...         for i in range(3)] # doctest: +SKIP
+    >>> scene = SparseSceneModel(prfs=prfs, footprint=5) # doctest: +SKIP
+    >>> image = scene(1e4, 10, 10, 2e3, 30, 25, 5e3, 40, 12, 100) # doctest: +SKIP
+    >>> jac = scene.jacobian(1e4, 10, 10, 2e3, 30, 25, 5e3, 40, 12, 100) # doctest: +SKIP
+    """
+
+    def __init__(self, prfs, bkg_model=lambda bkg: np.array([bkg]),
+                 footprint=None):
+        super(SparseSceneModel, self).__init__(prfs, bkg_model)
+        shape = tuple(self.prfs[0].shape)
+        for prf in self.prfs:
+            if (tuple(prf.shape) != shape or prf.column != self.prfs[0].column
+                or prf.row != self.prfs[0].row):
+                raise ValueError("All prfs must be defined on the same stamp.")
+        self.shape = shape
+        self.footprint = footprint
+        self.scene_model = np.zeros(self.shape)
+
+    def _footprint_slices(self, i, prf_params):
+        """Returns the (row, column) slices of the stamp covered by the
+        footprint of the i-th source."""
+        prf = self.prfs[i]
+        if self.footprint is None:
+            half_col, half_row = prf.support_halfwidths(*prf_params[3:])
+        else:
+            half_col = half_row = self.footprint
+        center_col, center_row = prf_params[1], prf_params[2]
+        col_start = int(np.clip(math.floor(center_col - half_col - prf.column), 0, self.shape[1]))
+        col_stop = int(np.clip(math.ceil(center_col + half_col - prf.column), 0, self.shape[1]))
+        row_start = int(np.clip(math.floor(center_row - half_row - prf.row), 0, self.shape[0]))
+        row_stop = int(np.clip(math.ceil(center_row + half_row - prf.row), 0, self.shape[0]))
+        return slice(row_start, row_stop), slice(col_start, col_stop)
+
+    def evaluate(self, *params):
+        """
+        Evaluates the scene model. See ``SceneModel.evaluate``.
+
+        Note that the returned image is a buffer which is overwritten by
+        the next call to ``evaluate``.
+        """
+        self.scene_model.fill(0.)
+        for i in range(self.n_models):
+            prf_params = params[self.n_params[i]:self.n_params[i+1]]
+            rows, cols = self._footprint_slices(i, prf_params)
+            if rows.start == rows.stop or cols.start == cols.stop:
+                continue
+            self.scene_model[rows, cols] += self.prfs[i]._evaluate_on(self.prfs[i].col_coord[cols],
+                                                                      self.prfs[i].row_coord[rows],
+                                                                      *prf_params)
+        self.scene_model += self.bkg_model(*params[-self.bkg_order:])
+        return self.scene_model
+
+    def jacobian(self, *params):
+        """
+        Returns the Jacobian of the scene model with respect to all of its
+        parameters as a sparse matrix.
+
+        Each PRF only contributes to the pixels within its footprint, hence
+        most of the entries of the Jacobian are structurally zero. The
+        background model must either provide a ``gradient`` method or be a
+        constant background, whose derivatives are equal to one everywhere.
+
+        Returns
+        -------
+        jac : scipy.sparse.csc_matrix
+            Matrix of shape (npix, nparams), in which npix is the number of
+            pixels in the stamp (flattened in row-major order) and nparams is
+            the total number of parameters of the scene model.
+        """
+        pix = np.arange(self.shape[0] * self.shape[1]).reshape(self.shape)
+        data, indices, indptr = [], [], [0]
+        for i in range(self.n_models):
+            prf_params = params[self.n_params[i]:self.n_params[i+1]]
+            rows, cols = self._footprint_slices(i, prf_params)
+            footprint_pix = pix[rows, cols].ravel()
+            if footprint_pix.size == 0:
+                grad = [footprint_pix] * len(prf_params)
+            else:
+                grad = self.prfs[i]._gradient_on(self.prfs[i].col_coord[cols],
+                                                 self.prfs[i].row_coord[rows],
+                                                 *prf_params)
+            for g in grad:
+                data.append(np.ravel(g))
+                indices.append(footprint_pix)
+                indptr.append(indptr[-1] + footprint_pix.size)
+        if hasattr(self.bkg_model, 'gradient'):
+            bkg_grad = self.bkg_model.gradient(*params[-self.bkg_order:])
+            bkg_grad = [np.broadcast_to(g, self.shape) for g in bkg_grad]
+        else:
+            bkg_grad = [np.ones(self.shape)] * self.bkg_order
+        for g in bkg_grad:
+            data.append(np.ravel(g))
+            indices.append(pix.ravel())
+            indptr.append(indptr[-1] + pix.size)
+        return scipy.sparse.csc_matrix((np.concatenate(data),
+                                        np.concatenate(indices),
+                                        np.asarray(indptr)),
+                                       shape=(pix.size, len(indptr) - 1))
+
+
 class KeplerPRF(object):
     """
     Kepler's Pixel Response Function as designed by [1]_.
@@ -276,19 +406,92 @@ class KeplerPRF(object):
             Two dimensional array representing the PRF values parametrized
             by flux, centroids, widths, and rotation.
         """
+        self.prf_model = self._evaluate_on(self.col_coord, self.row_coord, flux,
+                                           center_col, center_row, scale_col,
+                                           scale_row, rotation_angle)
+        return self.prf_model
+
+    def gradient(self, flux, center_col, center_row, scale_col, scale_row,
+                 rotation_angle):
+        """
+        This function returns the gradient of the KeplerPRF model with
+        respect to flux, center_col, center_row, scale_col, scale_row,
+        and rotation_angle.
+
+        Returns
+        -------
+        grad_prf : list
+            Returns a list of arrays where the elements are the derivative
+            of the KeplerPRF model with respect to each parameter, in the
+            same order as in ``evaluate``.
+        """
+        return self._gradient_on(self.col_coord, self.row_coord, flux,
+                                 center_col, center_row, scale_col, scale_row,
+                                 rotation_angle)
+
+    def _rotate(self, col_coord, row_coord, center_col, center_row,
+                rotation_angle):
         cosa = math.cos(rotation_angle)
         sina = math.sin(rotation_angle)
 
-        delta_col = self.col_coord - center_col
-        delta_row = self.row_coord - center_row
+        delta_col = col_coord - center_col
+        delta_row = row_coord - center_row
         delta_col, delta_row = np.meshgrid(delta_col, delta_row)
 
         rot_row = delta_row * cosa - delta_col * sina
         rot_col = delta_row * sina + delta_col * cosa
-
-        self.prf_model = flux * self.interpolate(rot_row.flatten() * scale_row,
-                                                 rot_col.flatten() * scale_col, grid=False).reshape(self.shape)
-        return self.prf_model
+        return rot_row, rot_col, cosa, sina
+
+    def _evaluate_on(self, col_coord, row_coord, flux, center_col, center_row,
+                     scale_col, scale_row, rotation_angle):
+        """Evaluates the PRF model on the pixel centers given by
+        ``col_coord`` and ``row_coord``."""
+        rot_row, rot_col, _, _ = self._rotate(col_coord, row_coord, center_col,
+                                              center_row, rotation_angle)
+        return flux * self.interpolate(rot_row.ravel() * scale_row,
+                                       rot_col.ravel() * scale_col,
+                                       grid=False).reshape(rot_row.shape)
+
+    def _gradient_on(self, col_coord, row_coord, flux, center_col, center_row,
+                     scale_col, scale_row, rotation_angle):
+        """Evaluates the gradient of the PRF model on the pixel centers given
+        by ``col_coord`` and ``row_coord``."""
+        rot_row, rot_col, cosa, sina = self._rotate(col_coord, row_coord,
+                                                    center_col, center_row,
+                                                    rotation_angle)
+        u = rot_row.ravel() * scale_row
+        v = rot_col.ravel() * scale_col
+        shape = rot_row.shape
+        prf = self.interpolate(u, v, grid=False).reshape(shape)
+        # x-axis correspond to row-axis in scipy.RectBivariate
+        prf_du = flux * self.interpolate(u, v, dx=1, grid=False).reshape(shape)
+        prf_dv = flux * self.interpolate(u, v, dy=1, grid=False).reshape(shape)
+
+        deriv_flux = prf
+        deriv_center_col = prf_du * sina * scale_row - prf_dv * cosa * scale_col
+        deriv_center_row = - prf_du * cosa * scale_row - prf_dv * sina * scale_col
+        deriv_scale_col = prf_dv * rot_col
+        deriv_scale_row = prf_du * rot_row
+        deriv_rotation_angle = (- prf_du * rot_col * scale_row
+                                + prf_dv * rot_row * scale_col)
+
+        return [deriv_flux, deriv_center_col, deriv_center_row,
+                deriv_scale_col, deriv_scale_row, deriv_rotation_angle]
+
+    @property
+    def support(self):
+        """Radius, in pixels, of the region in which the calibrated PRF is
+        defined, accounting for an arbitrary rotation."""
+        return self.support_halfwidths()[0]
+
+    def support_halfwidths(self, scale_col=1., scale_row=1., rotation_angle=0.):
+        """Half-widths (column, row), in pixels, of the region in which the
+        PRF is defined once stretched by ``scale_col`` and ``scale_row``,
+        accounting for an arbitrary rotation."""
+        knots_row, knots_col = self.interpolate.get_knots()
+        radius = math.hypot(np.abs(knots_row).max() / abs(scale_row),
+                            np.abs(knots_col).max() / abs(scale_col))
+        return radius, radius
 
     def _read_prf_calibration_file(self, path, ext):
         prf_cal_file = pyfits.open(path)
@@ -392,10 +595,8 @@ class SimpleKeplerPRF(KeplerPRF):
             Two dimensional array representing the PRF values parametrized
             by flux and centroids.
         """
-        delta_col = self.col_coord - center_col
-        delta_row = self.row_coord - center_row
-        self.prf_model = flux * self.interpolate(delta_row, delta_col)
-
+        self.prf_model = self._evaluate_on(self.col_coord, self.row_coord,
+                                           flux, center_col, center_row)
         return self.prf_model
 
     def gradient(self, flux, center_col, center_row):
@@ -417,8 +618,17 @@ class SimpleKeplerPRF(KeplerPRF):
             of the KeplerPRF model with respect to flux, center_col, and
             center_row, respectively.
         """
-        delta_col = self.col_coord - center_col
-        delta_row = self.row_coord - center_row
+        return self._gradient_on(self.col_coord, self.row_coord,
+                                 flux, center_col, center_row)
+
+    def _evaluate_on(self, col_coord, row_coord, flux, center_col, center_row):
+        delta_col = col_coord - center_col
+        delta_row = row_coord - center_row
+        return flux * self.interpolate(delta_row, delta_col)
+
+    def _gradient_on(self, col_coord, row_coord, flux, center_col, center_row):
+        delta_col = col_coord - center_col
+        delta_row = row_coord - center_row
 
         deriv_flux = self.interpolate(delta_row, delta_col)
         deriv_center_col = - flux * self.interpolate(delta_row, delta_col, dy=1)
@@ -426,6 +636,18 @@ class SimpleKeplerPRF(KeplerPRF):
 
         return [deriv_flux, deriv_center_col, deriv_center_row]
 
+    @property
+    def support(self):
+        """Radius, in pixels, of the region in which the calibrated PRF is
+        defined."""
+        return max(self.support_halfwidths())
+
+    def support_halfwidths(self):
+        """Half-widths (column, row), in pixels, of the region in which the
+        calibrated PRF is defined."""
+        knots_row, knots_col = self.interpolate.get_knots()
+        return np.abs(knots_col).max(), np.abs(knots_row).max()
+
 
 def get_initial_guesses(data, ref_col, ref_row):
     """
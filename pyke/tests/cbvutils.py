@@ -0,0 +1,39 @@
+import numpy as np
+from astropy.io import fits as pyfits
+
+
+def make_cbv_file(path, quarter=8, module=16, output=4, nrows=None,
+                  nvectors=4, cadenceno=None):
+    """Writes a fake Kepler CBV file with a single module/output table.
+    If ``cadenceno`` is given, the table also has a CADENCENO column and
+    ``nrows`` defaults to its length."""
+    if nrows is None:
+        nrows = len(cadenceno)
+    primary = pyfits.PrimaryHDU()
+    primary.header['QUARTER'] = quarter
+    t = np.linspace(0, 1, nrows)
+    cols = []
+    if cadenceno is not None:
+        cols.append(pyfits.Column(name='CADENCENO', format='J',
+                                  array=cadenceno))
+    cols += [pyfits.Column(name='VECTOR_{}'.format(i + 1), format='E',
+                           array=np.sin((i + 1) * np.pi * t))
+             for i in range(nvectors)]
+    table = pyfits.BinTableHDU.from_columns(cols)
+    table.header['EXTNAME'] = 'MODOUT_{}_{}'.format(module, output)
+    pyfits.HDUList([primary, table]).writeto(path)
+
+
+def make_sc_lc_file(lc_file, path):
+    """Writes a copy of the long cadence light curve file ``lc_file`` which
+    is flagged as short cadence data. Each long cadence spans 30 short
+    cadences, and long cadence number n is centred on short cadence number
+    (n + 0.5) * 30 - 11540 (see ``kepcotrend.sc_cadenceno``). The copy
+    starts at the centre of the first long cadence and keeps the same
+    number of consecutive cadences."""
+    with pyfits.open(lc_file) as hdus:
+        hdus[0].header['OBSMODE'] = 'short cadence'
+        cadenceno = hdus[1].data['CADENCENO']
+        first = (cadenceno[0] + 0.5) * 30 - 11540
+        hdus[1].data['CADENCENO'] = first + np.arange(len(cadenceno))
+        hdus.writeto(path)
@@ -0,0 +1,73 @@
+import pytest
+import numpy as np
+from numpy.testing import assert_array_equal
+from astropy.io import fits as pyfits
+from ..catalog import KeplerTargetCatalog
+
+
+def write_catalog(path):
+    """Writes a fake KIC extract, with per-season positions."""
+    with open(path, 'w') as f:
+        f.write('kepid,ra,dec,kepmag,channel_0,column_0,row_0,'
+                'channel_2,column_2,row_2\n')
+        f.write('30,290.1,44.2,12.5,4,500,600,52,700,800\n')
+        f.write('10,291.3,45.0,14.0,5,510,610,53,710,810\n')
+        f.write('20,289.9,43.1,9.1,6,520,620,54,720,820\n')
+
+
+def test_catalog_lookup(tmpdir):
+    path = str(tmpdir.join('kic.csv'))
+    write_catalog(path)
+    cat = KeplerTargetCatalog.load(path)
+    assert KeplerTargetCatalog.load(path) is cat
+    assert len(cat) == 3
+    assert_array_equal(cat.index([20, 30, 10]), [2, 0, 1])
+    assert cat.lookup(10)['KEPMAG'] == 14.0
+    assert cat.position(10, season=2) == (53, 710, 810)
+    channel, column, row = cat.position([20, 30], season=0)
+    assert_array_equal(column, [520, 500])
+    with pytest.raises(KeyError):
+        cat.position(40)
+    assert_array_equal(cat.contains([40, 20, 5, 10]),
+                       [False, True, False, True])
+    with pytest.raises(KeyError):
+        cat.position(10, season=1)
+    # FITS extracts give the same answers
+    table = pyfits.BinTableHDU.from_columns(
+            [pyfits.Column(name=name, format='D', array=col)
+             for name, col in cat.columns.items()])
+    table.writeto(str(tmpdir.join('kic.fits')))
+    fcat = KeplerTargetCatalog(str(tmpdir.join('kic.fits')))
+    assert fcat.position(10, season=2) == (53, 710, 810)
+
+
+def test_catalog_cone_search(tmpdir):
+    rng = np.random.RandomState(0)
+    n = 2000
+    ra = 290. + rng.uniform(-0.1, 0.1, n)
+    dec = 44. + rng.uniform(-0.1, 0.1, n)
+    table = pyfits.BinTableHDU.from_columns(
+            [pyfits.Column(name='KEPID', format='K', array=np.arange(n)),
+             pyfits.Column(name='RA', format='D', array=ra),
+             pyfits.Column(name='DEC', format='D', array=dec)])
+    path = str(tmpdir.join('kic.fits'))
+    table.writeto(path)
+    cat = KeplerTargetCatalog(path)
+
+    def separation(ra0, dec0):
+        cosd = (np.sin(np.radians(dec)) * np.sin(np.radians(dec0))
+                + np.cos(np.radians(dec)) * np.cos(np.radians(dec0))
+                * np.cos(np.radians(ra - ra0)))
+        return np.degrees(np.arccos(np.clip(cosd, -1., 1.))) * 3600.
+
+    sep = separation(290.02, 44.03)
+    expected = np.where(sep < 60.)[0]
+    rows = cat.cone_search(290.02, 44.03, 60.)
+    assert_array_equal(rows, expected[np.argsort(sep[expected])])
+    i, s = cat.nearest(290.02, 44.03)
+    assert i == np.argmin(sep)
+    assert abs(s - sep.min()) < 1e-3
+    # vectorized queries, with a position far from any target
+    i, s = cat.nearest([ra[5], 10.], [dec[5], 10.], radius=1.)
+    assert_array_equal(i, [5, -1])
+    assert s[0] < 1e-3 and np.isinf(s[1])
@@ -0,0 +1,96 @@
+import os
+import shutil
+import pytest
+from numpy.testing import assert_array_equal, assert_allclose
+from oktopus import GaussianLikelihood, LaplacianLikelihood
+from astropy.utils.data import get_pkg_data_filename
+from ..cbv import KeplerCBVStore
+from ..lightcurve import (KeplerCBVCorrector, KeplerCBVBatchCorrector,
+                          KeplerLightCurveFile)
+from .cbvutils import make_cbv_file
+
+# a fraction of the 8th Quarter of Tabby's star (module 16, output 4)
+DIP_LC = get_pkg_data_filename("data/dip_llc.fits")
+
+
+def test_cbv_store(tmpdir):
+    make_cbv_file(str(tmpdir.join('kplr2011073133259-q08-d25_lcbv.fits')),
+                  8, 16, 4, nrows=490)
+    store = KeplerCBVStore(str(tmpdir), cache_size=1, offline=True)
+    assert store.index == {'Kepler/8/long': 'kplr2011073133259-q08-d25_lcbv.fits'}
+    assert os.path.isfile(str(tmpdir.join(KeplerCBVStore.INDEX_FILENAME)))
+    cbvs = store.get_cbvs('Kepler', 8, 16, 4)
+    assert store.get_cbvs('Kepler', 8, 16, 4) is cbvs
+    assert len(cbvs['VECTOR_1']) == 490
+    with pytest.raises(IOError):
+        store.get_cbvs('Kepler', 9, 16, 4)
+
+    # a new store reads the index written by the first one
+    assert KeplerCBVStore(str(tmpdir)).index == store.index
+
+
+def test_cbv_store_rescan(tmpdir):
+    """Files copied into the directory after the index was written are
+    found without rebuilding the index by hand."""
+    make_cbv_file(str(tmpdir.join('kplr2011073133259-q08-d25_lcbv.fits')),
+                  8, 16, 4, nrows=490)
+    store = KeplerCBVStore(str(tmpdir), offline=True)
+    assert list(store.index) == ['Kepler/8/long']
+    make_cbv_file(str(tmpdir.join('kplr2011177032512-q09-d25_lcbv.fits')),
+                  9, 16, 4, nrows=300)
+    assert len(store.get_cbvs('Kepler', 9, 16, 4)['VECTOR_1']) == 300
+    assert sorted(store.index) == ['Kepler/8/long', 'Kepler/9/long']
+    # the rescanned index is written for the next sessions
+    assert KeplerCBVStore(str(tmpdir)).index == store.index
+
+
+def test_cbv_store_short_cadence(tmpdir):
+    """Short cadence requests use the long cadence file, and files which
+    are not CBV files are left out of the index."""
+    make_cbv_file(str(tmpdir.join('kplr2011073133259-q08-d25_lcbv.fits')),
+                  8, 16, 4, nrows=490)
+    shutil.copy(DIP_LC, str(tmpdir.join('dip_llc.fits')))
+    store = KeplerCBVStore(str(tmpdir), offline=True)
+    assert store.index == {'Kepler/8/long': 'kplr2011073133259-q08-d25_lcbv.fits'}
+    assert (store.get_filename('Kepler', 8, 'short')
+            == store.get_filename('Kepler', 8, 'long'))
+    with pytest.raises(ValueError):
+        store.add(str(tmpdir.join('dip_llc.fits')))
+    # a bad file is neither copied into the store nor replaces a CBV file
+    bad = tmpdir.mkdir('bad')
+    shutil.copy(DIP_LC, str(bad.join('dip2_llc.fits')))
+    shutil.copy(DIP_LC, str(bad.join('kplr2011073133259-q08-d25_lcbv.fits')))
+    for name in ['dip2_llc.fits', 'kplr2011073133259-q08-d25_lcbv.fits']:
+        with pytest.raises(ValueError):
+            store.add(str(bad.join(name)))
+    assert not tmpdir.join('dip2_llc.fits').check()
+    assert len(store.get_cbvs('Kepler', 8, 16, 4)['VECTOR_1']) == 490
+
+
+def test_cbv_corrector_offline(tmpdir):
+    make_cbv_file(str(tmpdir.join('kplr2011073133259-q08-d25_lcbv.fits')),
+                  8, 16, 4, nrows=490)
+    store = KeplerCBVStore(str(tmpdir), offline=True)
+    lcf = KeplerLightCurveFile(DIP_LC, quality_bitmask=None)
+    cbv = KeplerCBVCorrector(lcf, cbv_store=store)
+    cbv_lc = cbv.correct(cbvs=[1, 2])
+    assert len(cbv.coeffs) == 2
+    assert_array_equal(cbv_lc.time, lcf.SAP_FLUX.time)
+
+
+@pytest.mark.parametrize("loss_function", [GaussianLikelihood, LaplacianLikelihood])
+def test_cbv_batch_corrector(tmpdir, loss_function):
+    """Does the batch corrector agree with the one-target-at-a-time fit?"""
+    make_cbv_file(str(tmpdir.join('kplr2011073133259-q08-d25_lcbv.fits')),
+                  8, 16, 4, nrows=490)
+    store = KeplerCBVStore(str(tmpdir), offline=True)
+    cbv = KeplerCBVCorrector(DIP_LC, loss_function, cbv_store=store)
+    cbv_lc = cbv.correct(cbvs=[1, 2, 3])
+
+    batch = KeplerCBVBatchCorrector([DIP_LC] * 3, loss_function, cbv_store=store)
+    cbv_lcs = batch.correct(cbvs=[1, 2, 3])
+    assert batch.coeffs.shape == (3, 3)
+    assert len(cbv_lcs) == 3
+    assert_allclose(batch.coeffs[0], batch.coeffs[2])
+    assert_allclose(batch.coeffs[0], cbv.coeffs, atol=1e-4)
+    assert_array_equal(cbv_lcs[1].time, cbv_lc.time)
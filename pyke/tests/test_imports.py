@@ -1,17 +1,9 @@
-import pytest
-
-HAS_MDP = True
-try:
-    import mdp
-except ImportError:
-    HAS_MDP = False
-
-
 def test_import():
     from .. import keparray
     from .. import kepbls
     from .. import kepclip
     from .. import kepconvert
+    from .. import kepconvolve
     from .. import kepcotrend
     from .. import kepdiffim
     from .. import kepdraw
@@ -32,6 +24,7 @@ def test_import():
     from .. import kepmask
     from .. import kepmsg
     from .. import kepoutlier
+    from .. import keppca
     from .. import keppixseries
     from .. import kepplot
     from .. import kepprf
@@ -49,8 +42,3 @@ def test_import():
     from .. import lightcurve
     from .. import targetpixelfile
     from .. import prf
-
-
-@pytest.mark.skipif('not HAS_MDP')
-def test_import_keppca():
-    from .. import keppca
@@ -0,0 +1,38 @@
+import numpy as np
+import pytest
+from numpy.testing import assert_allclose
+from ..kepconvolve import filterkernel, convolve
+
+
+@pytest.mark.parametrize("function", ['boxcar', 'gauss', 'sinc'])
+@pytest.mark.parametrize("method", ['direct', 'fft'])
+def test_convolve(function, method):
+    rng = np.random.RandomState(0)
+    data = 100. + rng.randn(3, 500)
+    kernel = filterkernel(function, 7.3)
+    assert_allclose(np.sum(kernel), 1.)
+    out = convolve(data, kernel, method=method)
+    assert out.shape == data.shape
+    # away from the ends, this is numpy.convolve
+    k = len(kernel)
+    for series, convolved in zip(data, out):
+        expected = np.convolve(series, kernel, 'same')
+        assert_allclose(convolved[k:-k], expected[k:-k])
+    # a constant series is left unchanged, ends included
+    assert_allclose(convolve(np.ones(100), kernel, method=method), 1.)
+
+
+def test_convolve_nans():
+    data = np.linspace(0., 10., 200)
+    data[50:60] = np.nan
+    kernel = filterkernel('boxcar', 5)
+    for method in ['direct', 'fft']:
+        out = convolve(data, kernel, method=method)
+        # a straight line is recovered where the kernel sees no NaN
+        assert_allclose(out[2:48], data[2:48])
+        assert_allclose(out[62:-2], data[62:-2])
+        # no finite sample under the kernel
+        assert np.isnan(out[52:58]).all()
+        assert np.isfinite(out[:52]).all() and np.isfinite(out[58:]).all()
+    assert_allclose(convolve(data, kernel, method='direct'),
+                    convolve(data, kernel, method='fft'), equal_nan=True)
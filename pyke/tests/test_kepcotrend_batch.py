@@ -0,0 +1,98 @@
+import os
+import numpy as np
+from astropy.io import fits as pyfits
+from astropy.utils.data import get_pkg_data_filename
+from ..kepcotrend import kepcotrend, cotrend
+from .cbvutils import make_cbv_file, make_sc_lc_file
+
+
+def test_kepcotrend_batch(tmpdir):
+    """Does cotrending a directory give the same results as cotrending each
+    file on its own?"""
+    dip_lc = get_pkg_data_filename("data/dip_llc.fits")
+    bvfile = str(tmpdir.join("cbv.fits"))
+    make_cbv_file(bvfile,
+                  cadenceno=pyfits.getdata(dip_lc, 1)['CADENCENO'])
+    indir = tmpdir.mkdir("lcs")
+    with pyfits.open(dip_lc) as hdus:
+        hdus.writeto(str(indir.join("a_llc.fits")))
+    make_sc_lc_file(dip_lc, str(indir.join("b_slc.fits")))
+    make_sc_lc_file(dip_lc, str(indir.join("c_slc.fits")))
+
+    outdir = str(tmpdir.join("out"))
+    logfile = str(tmpdir.join("kepcotrend.log"))
+    kepcotrend(str(indir), bvfile, '1 2 3', outfile=outdir, iterate=True,
+               sigma=3., logfile=logfile)
+    for name in ["a_llc", "b_slc", "c_slc"]:
+        single = str(tmpdir.join(name + "-single.fits"))
+        kepcotrend(str(indir.join(name + ".fits")), bvfile, '1 2 3',
+                   outfile=single, iterate=True, sigma=3., logfile=logfile)
+        f = pyfits.open(os.path.join(outdir, name + "-kepcotrend.fits"))
+        g = pyfits.open(single)
+        np.testing.assert_allclose(f[1].data['CBVSAP_FLUX'],
+                                   g[1].data['CBVSAP_FLUX'])
+        f.close()
+        g.close()
+
+    # the interpolated short cadence basis vectors are computed only once
+    cache = {}
+    with pyfits.open(bvfile) as bvdata:
+        for name in ["b_slc", "c_slc"]:
+            cotrend(str(indir.join(name + ".fits")),
+                    str(tmpdir.join(name + "-cache.fits")), bvdata, [1, 2],
+                    fitmethod='llsq', fitpower=1., iterate=False, sigma=None,
+                    maskdata=None, scinterp='linear', plot=False,
+                    noninteractive=True, overwrite=False, verbose=False,
+                    logfile=logfile, cache=cache)
+    assert len(cache) == 1
+
+def test_kepcotrend_cachedir(tmpdir):
+    """Are interpolated short cadence basis vectors cached on disk?"""
+    dip_lc = get_pkg_data_filename("data/dip_llc.fits")
+    bvfile = str(tmpdir.join("cbv.fits"))
+    make_cbv_file(bvfile,
+                  cadenceno=pyfits.getdata(dip_lc, 1)['CADENCENO'])
+    sc_lc = str(tmpdir.join("slc.fits"))
+    make_sc_lc_file(dip_lc, sc_lc)
+
+    cachedir = str(tmpdir.join("cache"))
+    logfile = str(tmpdir.join("kepcotrend.log"))
+    for scinterp in ['linear', 'nearest']:
+        for i in range(2):
+            outfile = str(tmpdir.join("{}{}.fits".format(scinterp, i)))
+            kepcotrend(sc_lc, bvfile, '1 2', outfile=outfile,
+                       scinterp=scinterp, cachedir=cachedir,
+                       logfile=logfile)
+        assert len(os.listdir(cachedir)) == 1 + (scinterp == 'nearest')
+        f = pyfits.open(str(tmpdir.join("{}0.fits".format(scinterp))))
+        g = pyfits.open(str(tmpdir.join("{}1.fits".format(scinterp))))
+        np.testing.assert_array_equal(f[1].data['CBVSAP_FLUX'],
+                                      g[1].data['CBVSAP_FLUX'])
+        f.close()
+        g.close()
+
+def test_kepcotrend_short_single(tmpdir):
+    """Can short cadence data be cotrended against a single basis vector?"""
+    dip_lc = get_pkg_data_filename("data/dip_llc.fits")
+    bvfile = str(tmpdir.join("cbv.fits"))
+    make_cbv_file(bvfile,
+                  cadenceno=pyfits.getdata(dip_lc, 1)['CADENCENO'])
+    sc_lc = str(tmpdir.join("slc.fits"))
+    make_sc_lc_file(dip_lc, sc_lc)
+
+    single = str(tmpdir.join("single.fits"))
+    kepcotrend(sc_lc, bvfile, '1', outfile=single,
+               logfile=str(tmpdir.join("kepcotrend.log")))
+    listed = str(tmpdir.join("listed.fits"))
+    with pyfits.open(bvfile) as bvdata:
+        cotrend(sc_lc, listed, bvdata, [1], fitmethod='llsq', fitpower=1.,
+                iterate=False, sigma=None, maskdata=None, scinterp='linear',
+                plot=False, noninteractive=True, overwrite=False,
+                verbose=False, logfile=str(tmpdir.join("cotrend.log")))
+    f = pyfits.open(single)
+    g = pyfits.open(listed)
+    assert np.isfinite(f[1].data['CBVSAP_MODL']).any()
+    np.testing.assert_allclose(f[1].data['CBVSAP_FLUX'],
+                               g[1].data['CBVSAP_FLUX'])
+    f.close()
+    g.close()
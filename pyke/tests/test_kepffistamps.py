@@ -0,0 +1,81 @@
+import numpy as np
+from astropy.io import fits as pyfits
+from ..kepffistamps import kepffistamps
+
+
+def make_ffi(path, nchannels=3, shape=(50, 60)):
+    """Writes a fake FFI in which each pixel holds its channel, row and
+    column as channel * 1e6 + row * 1e3 + column."""
+    primary = pyfits.PrimaryHDU()
+    primary.header['QUARTER'] = 5
+    rows, cols = np.indices(shape)
+    hdus = [pyfits.ImageHDU((ch * 1e6 + rows * 1e3 + cols).astype('float32'))
+            for ch in range(1, nchannels + 1)]
+    pyfits.HDUList([primary] + hdus).writeto(path)
+
+
+def test_kepffistamps(tmpdir):
+    ffi = str(tmpdir.join('ffi.fits'))
+    make_ffi(ffi)
+    catalog = str(tmpdir.join('kic.csv'))
+    with open(catalog, 'w') as f:
+        # quarter 5 is observed in season 3
+        f.write('kepid,ra,dec,channel_3,column_3,row_3\n')
+        f.write('1,290.0,44.0,2,10,20\n')
+        f.write('2,290.1,44.1,3,30,40\n')
+        f.write('3,290.2,44.2,2,1,48\n')
+    targets = str(tmpdir.join('targets.txt'))
+    with open(targets, 'w') as f:
+        f.write('# targets\n3\n1\n290.1 44.1\n')
+    outfile = str(tmpdir.join('stamps.fits'))
+    kepffistamps(ffi, targets, npix=5, outfile=outfile, catalog=catalog,
+                 logfile=str(tmpdir.join('kepffistamps.log')))
+    with pyfits.open(outfile) as f:
+        assert [hdu.name for hdu in f[1:]] == ['3', '1', '290.10000+44.10000']
+        assert f[0].header['QUARTER'] == 5
+        stamp = f['1'].data
+        assert stamp.shape == (5, 5)
+        assert stamp[2, 2] == 2e6 + 20e3 + 10
+        assert stamp[0, 0] == 2e6 + 18e3 + 8
+        assert f['1'].header['CRVAL1P'] == 8
+        assert f['1'].header['CRVAL2P'] == 18
+        assert f['290.10000+44.10000'].data[2, 2] == 3e6 + 40e3 + 30
+        # stamps which overlap the edge of the channel are padded
+        stamp = f['3'].data
+        assert np.isnan(stamp[:, 0]).all() and np.isnan(stamp[-1]).all()
+        assert stamp[2, 2] == 2e6 + 48e3 + 1
+    kepffistamps(ffi, [1, 2], npix=3, outfile=outfile, split=True,
+                 catalog=catalog, overwrite=True,
+                 logfile=str(tmpdir.join('kepffistamps.log')))
+    for kepid, value in [(1, 2e6 + 20e3 + 10), (2, 3e6 + 40e3 + 30)]:
+        stamp = pyfits.getdata(str(tmpdir.join('stamps-{}.fits'.format(kepid))),
+                               1)
+        assert stamp[1, 1] == value
+
+
+def test_kepffistamps_missing_and_duplicates(tmpdir):
+    """Unknown targets are skipped and duplicates extracted once."""
+    ffi = str(tmpdir.join('ffi.fits'))
+    make_ffi(ffi)
+    catalog = str(tmpdir.join('kic.csv'))
+    with open(catalog, 'w') as f:
+        f.write('kepid,ra,dec,channel_3,column_3,row_3\n')
+        f.write('1,290.0,44.0,2,10,20\n')
+        f.write('2,290.1,44.1,3,30,40\n')
+    logfile = str(tmpdir.join('kepffistamps.log'))
+    outfile = str(tmpdir.join('stamps.fits'))
+    kepffistamps(ffi, [2, 99, 1, 2, (290.1, 44.1), (290.1, 44.1)], npix=3,
+                 outfile=outfile, catalog=catalog, logfile=logfile)
+    with pyfits.open(outfile) as f:
+        assert [hdu.name for hdu in f[1:]] == ['2', '1', '290.10000+44.10000']
+    with open(logfile) as log:
+        log = log.read()
+    assert 'target 99 is not in the target catalog' in log
+    assert 'target 2 is listed more than once' in log
+    assert 'target 290.10000+44.10000 is listed more than once' in log
+    # in split mode, each target is written to its own file
+    kepffistamps(ffi, [1, 1, 2], npix=3, outfile=outfile, split=True,
+                 catalog=catalog, logfile=logfile)
+    assert sorted(tmpdir.listdir(lambda p: p.basename.startswith('stamps-')),
+                  key=str) == [tmpdir.join('stamps-1.fits'),
+                               tmpdir.join('stamps-2.fits')]
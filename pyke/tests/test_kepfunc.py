@@ -0,0 +1,41 @@
+import numpy as np
+from numpy.testing import assert_allclose
+from scipy.interpolate import RectBivariateSpline
+from scipy.ndimage import shift
+from ..kepfunc import PRF2DET, _shift_prf
+
+
+def gaussian_prf(size=110, delta=0.1):
+    grid = (np.arange(size) + 0.5 - size / 2) * delta
+    yy, xx = np.meshgrid(grid, grid, indexing='ij')
+    return grid, np.exp(-(yy ** 2 / 1.2 + xx ** 2 / 0.7) / 2)
+
+
+def test_prf2det():
+    """Is the vectorized PRF2DET consistent with a pixel-by-pixel sum?"""
+    grid, prf = gaussian_prf()
+    spline = RectBivariateSpline(grid, grid, prf)
+    DATx, DATy = np.arange(1000, 1011), np.arange(500, 508)
+    flux, x, y = [10., 5.], [1004.3, 1007.7], [503.4, 505.5]
+    wx, wy, a = 1.1, 0.9, 12.
+    cosa, sina = np.cos(np.radians(a)), np.sin(np.radians(a))
+    expected = np.zeros((DATy.size, DATx.size))
+    for i in range(len(flux)):
+        for j, row in enumerate(DATy):
+            for k, col in enumerate(DATx):
+                dx = (col - x[i]) * cosa - (row - y[i]) * sina
+                dy = (col - x[i]) * sina + (row - y[i]) * cosa
+                expected[j, k] += flux[i] * spline(dy * wy, dx * wx)[0, 0]
+    assert_allclose(PRF2DET(flux, x, y, DATx, DATy, wx, wy, a, spline),
+                    expected, rtol=1e-10)
+
+
+def test_shift_prf():
+    """Is _shift_prf equivalent to shifting and cropping each source?"""
+    _, prf = gaussian_prf()
+    y, x = [2.3, -7.1], [-4.1, 5.5]
+    models = _shift_prf(prf, y, x, 40, 50, 35, 30)
+    assert models.shape == (2, 40, 50)
+    for i in range(2):
+        expected = shift(prf, [y[i], x[i]], order=1, mode='constant')
+        assert_allclose(models[i], expected[35:75, 30:80], atol=1e-12)
@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+from astropy.io import fits as pyfits
+from numpy.testing import assert_array_equal
+from ..kepio import mergeranges, inranges
+from ..kepio import finiterows, filterrows, expandcol, writefitscol
+
+
+def test_mergeranges():
+    start, stop = mergeranges([5., 1., 2., 8.], [6., 3., 4., 9.])
+    assert_array_equal(start, [1., 5., 8.])
+    assert_array_equal(stop, [4., 6., 9.])
+    # ranges which only share an excluded end are not merged
+    start, stop = mergeranges([1., 2.], [2., 3.], closed='neither')
+    assert_array_equal(start, [1., 2.])
+    start, stop = mergeranges([1., 2.], [2., 3.], closed='left')
+    assert_array_equal(start, [1.])
+    assert_array_equal(stop, [3.])
+
+
+@pytest.mark.parametrize("closed", ['both', 'left', 'right', 'neither'])
+def test_inranges(closed):
+    rng = np.random.RandomState(42)
+    time = np.round(rng.uniform(0., 100., 2000), 1)
+    time[::50] = np.nan
+    tstart = np.round(rng.uniform(0., 95., 20), 1)
+    tstop = tstart + np.round(rng.uniform(0., 5., 20), 1)
+    tstop[:3] = tstart[3:6]
+    with np.errstate(invalid='ignore'):
+        lower = {'both': np.greater_equal, 'left': np.greater_equal,
+                 'right': np.greater, 'neither': np.greater}[closed]
+        upper = {'both': np.less_equal, 'left': np.less,
+                 'right': np.less_equal, 'neither': np.less}[closed]
+        expected = np.zeros(len(time), dtype=bool)
+        for t1, t2 in zip(tstart, tstop):
+            expected |= lower(time, t1) & upper(time, t2)
+    assert_array_equal(inranges(time, tstart, tstop, closed), expected)
+    assert not inranges(time, [], [], closed).any()
+
+
+def test_filterrows_and_writefitscol():
+    time = np.array([1., 2., np.nan, 4., 5.])
+    flux = np.array([10., np.inf, 30., 40., np.nan], dtype='float32')
+    hdu = pyfits.BinTableHDU.from_columns(
+            [pyfits.Column(name='TIME', format='D', array=time),
+             pyfits.Column(name='FLUX', format='E', array=flux)])
+    keep = finiterows(hdu.data['TIME'], hdu.data['FLUX'])
+    assert_array_equal(keep, [True, False, False, True, False])
+    table = filterrows(hdu, keep, 'test.fits', None, False, nanclean=True)
+    assert_array_equal(table['TIME'], [1., 4.])
+    assert hdu.header['NANCLEAN']
+    writefitscol('test.fits', table, 'FLUX', [1., 2.], None, False)
+    writefitscol('test.fits', table, 'FLUX', 3., None, False,
+                 rows=np.array([False, True]))
+    assert_array_equal(hdu.data['FLUX'], [1., 3.])
+    out = expandcol(hdu.data['FLUX'], keep)
+    assert_array_equal(out, [1., np.nan, np.nan, 3., np.nan])
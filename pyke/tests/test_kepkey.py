@@ -0,0 +1,27 @@
+import numpy as np
+from astropy.utils.data import get_pkg_data_filename
+from numpy.testing import assert_array_equal
+from ..kepkey import wcs, wcsgrid
+from ..kepio import readMaskDefinition
+
+fake_tpf = get_pkg_data_filename("data/testtpf.fits")
+
+
+def test_wcsgrid():
+    keys = (2., 3., 100., 200., 1., -1.)
+    coord1, coord2 = wcsgrid((4, 5), *keys)
+    assert coord1.shape == (4, 5)
+    for i in range(4):
+        for j in range(5):
+            assert coord1[i, j] == wcs(j, keys[0], keys[2], keys[4])
+            assert coord2[i, j] == wcs(i, keys[1], keys[3], keys[5])
+    # the grids are cached and shared, so they must not be writeable
+    assert wcsgrid((4, 5), *keys)[0] is coord1
+    assert not coord1.flags.writeable
+
+
+def test_readMaskDefinition():
+    img, pixelcoord1, pixelcoord2 = readMaskDefinition(fake_tpf, None, False)
+    assert pixelcoord1.shape == img.shape[::-1]
+    assert_array_equal(pixelcoord1[:, 0], 227 + np.arange(img.shape[1]))
+    assert_array_equal(pixelcoord2[0], 127 + np.arange(img.shape[0]))
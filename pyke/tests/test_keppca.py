@@ -0,0 +1,82 @@
+import numpy as np
+from numpy.testing import assert_allclose
+from astropy.io import fits
+from astropy.utils.data import get_pkg_data_filename
+from ..keppca import keppca, _pca, _incremental_pca, _robust_fit, mad
+
+
+TPF_filename = get_pkg_data_filename("data/testtpf.fits")
+
+
+def test_pca_methods():
+    np.random.seed(42)
+    signals = np.random.normal(size=(500, 3)) * [10., 5., 2.]
+    data = (np.dot(signals, np.random.normal(size=(3, 40)))
+            + 0.01 * np.random.normal(size=(500, 40)))
+    pcs, recmatrix = _pca(data, 3, method='svd')
+    rpcs, rrecmatrix = _pca(data, 3, method='randomized')
+    assert pcs.shape == (500, 3)
+    assert recmatrix.shape == (3, 40)
+    assert_allclose(np.std(pcs, axis=0, ddof=1), 1.)
+    assert_allclose(rpcs, pcs, atol=1e-6)
+    assert_allclose(np.dot(pcs, recmatrix), data - data.mean(axis=0),
+                    atol=0.1)
+
+
+def test_incremental_pca():
+    np.random.seed(42)
+    signals = np.random.normal(size=(500, 3)) * [10., 5., 2.]
+    data = (np.dot(signals, np.random.normal(size=(3, 40))) + 100.
+            + 0.01 * np.random.normal(size=(500, 40)))
+    errors = np.ones_like(data)
+    norm = (data - data.mean(axis=0)) / data.std(axis=0)
+    pcs, recmatrix = _pca(norm, 3, method='svd')
+
+    def blocks():
+        for start in range(0, len(data), 64):
+            yield data[start:start + 64], errors[start:start + 64]
+
+    ipcs, irecmatrix, mean, total = _incremental_pca(blocks, 3)
+    assert_allclose(ipcs, pcs, atol=1e-3)
+    assert_allclose(irecmatrix, recmatrix, atol=1e-3)
+    assert_allclose(mean, np.average(data, axis=0, weights=data ** 2))
+    assert_allclose(total, data.sum(axis=1))
+
+
+def test_robust_fit():
+    np.random.seed(42)
+    model = np.random.normal(size=(300, 2))
+    data = np.dot(model, [3., -2.]) + 5. + 0.01 * np.random.normal(size=300)
+    data[::20] += 100.
+    coeffs = _robust_fit(model, data)
+    assert_allclose(coeffs, [3., -2.], atol=0.01)
+    assert mad(data - np.dot(model, coeffs)) < mad(data - np.dot(model, [3.1, -2.]))
+
+
+def test_keppca(tmpdir):
+    outfile = str(tmpdir.join("keppca.fits"))
+    keppca(TPF_filename, outfile=outfile, components='1-2', overwrite=True,
+           logfile=str(tmpdir.join("keppca.log")))
+    with fits.open(outfile) as f:
+        assert 'PCA_FLUX' in f['LIGHTCURVE'].columns.names
+        assert f['PRINCIPAL_COMPONENTS'].columns.names == ['TIME', 'PC1', 'PC2']
+        assert f['PRINCIPAL_COMPONENTS'].header['NCOMP'] == 2
+        flux = f['LIGHTCURVE'].data['SAP_FLUX']
+        pcaflux = f['LIGHTCURVE'].data['PCA_FLUX']
+        assert mad(pcaflux) <= mad(flux)
+
+
+def test_keppca_blocksize(tmpdir):
+    outfile = str(tmpdir.join("keppca.fits"))
+    blockfile = str(tmpdir.join("keppca-blocks.fits"))
+    logfile = str(tmpdir.join("keppca.log"))
+    keppca(TPF_filename, outfile=outfile, components='1-2', ncomponents=18,
+           method='svd', overwrite=True, logfile=logfile)
+    keppca(TPF_filename, outfile=blockfile, components='1-2', ncomponents=18,
+           blocksize=5, overwrite=True, logfile=logfile)
+    with fits.open(outfile) as f, fits.open(blockfile) as g:
+        for pc in ['PC1', 'PC2']:
+            assert_allclose(g['PRINCIPAL_COMPONENTS'].data[pc],
+                            f['PRINCIPAL_COMPONENTS'].data[pc], atol=1e-3)
+        assert_allclose(g['LIGHTCURVE'].data['PCA_FLUX'],
+                        f['LIGHTCURVE'].data['PCA_FLUX'], rtol=1e-4)
@@ -0,0 +1,53 @@
+import numpy as np
+from numpy.testing import assert_array_almost_equal
+from scipy.interpolate import RectBivariateSpline
+from ..kepfunc import PRF2DET
+from ..kepprfphot import _fit_time_series
+
+
+def make_synthetic_tpf(ncad=12, xdim=7, ydim=7):
+    """Returns the pixel time series of a single star drifting across a
+    small aperture, with a Gaussian PRF, and the matching fit
+    configuration."""
+    PRFx = np.linspace(-5., 5., 41)
+    PRFy = np.linspace(-5., 5., 41)
+    prf = np.exp(-0.5 * (PRFy[:, np.newaxis] ** 2
+                         + PRFx[np.newaxis, :] ** 2) / 0.8 ** 2)
+    prf /= prf.sum() * (PRFx[1] - PRFx[0]) * (PRFy[1] - PRFy[0])
+    spline = RectBivariateSpline(PRFx, PRFy, prf)
+    DATx = 100. + np.arange(xdim)
+    DATy = 200. + np.arange(ydim)
+    xx, yy = np.meshgrid(np.arange(1., xdim + 1.), np.arange(1., ydim + 1.))
+
+    rng = np.random.RandomState(42)
+    barytime = 2455000. + np.arange(ncad) * 0.02
+    col = 103. + 0.05 * np.sin(np.arange(ncad))
+    row = 203. + 0.05 * np.cos(np.arange(ncad))
+    flux = 1e4 * (1. + 0.01 * rng.randn(ncad))
+    fluxpixels = np.empty((ncad, ydim * xdim), dtype='float32')
+    for i in range(ncad):
+        img = PRF2DET([flux[i]], [col[i]], [row[i]], DATx, DATy, 1., 1., 0.,
+                      spline)
+        fluxpixels[i] = (img + rng.randn(ydim, xdim)).ravel()
+    errpixels = np.ones_like(fluxpixels)
+    config = {'DATx': DATx, 'DATy': DATy, 'nsrc': 1, 'border': 0,
+              'xx': xx, 'yy': yy, 'PRFx': PRFx, 'PRFy': PRFy, 'prf': prf,
+              'focus': False, 'background': False, 'col': 103.,
+              'row': 203., 'barytime': barytime}
+    return fluxpixels, errpixels, config, flux, col, row
+
+
+def test_fit_time_series_parallel():
+    """The serial and the multiprocess fits must agree."""
+    fluxpixels, errpixels, config, flux, col, row = make_synthetic_tpf()
+    guess = [9e3, 103.2, 202.8]
+    serial = np.array(_fit_time_series(fluxpixels, errpixels, guess, 1e-6,
+                                       1e-6, config, nprocs=1, chunksize=5))
+    parallel = np.array(_fit_time_series(fluxpixels, errpixels, guess, 1e-6,
+                                         1e-6, config, nprocs=2, chunksize=5))
+    assert serial.shape == (len(flux), 3)
+    assert_array_almost_equal(serial, parallel)
+    # the fits recover the star
+    assert_array_almost_equal(serial[:, 0] / flux, 1., decimal=2)
+    assert_array_almost_equal(serial[:, 1], col, decimal=2)
+    assert_array_almost_equal(serial[:, 2], row, decimal=2)
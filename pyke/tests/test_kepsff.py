@@ -0,0 +1,49 @@
+import numpy as np
+from astropy.io import fits as pyfits
+from astropy.utils.data import get_pkg_data_filename
+from numpy.testing import assert_array_almost_equal, assert_array_equal
+from ..kepsff import kepsff
+
+fake_lc = get_pkg_data_filename("data/golden-lc.fits")
+
+
+def make_roll_lc(filename):
+    """Writes a copy of golden-lc.fits in which the centroids follow a
+    K2-like roll pattern and the flux depends on the roll."""
+    with pyfits.open(fake_lc) as instr:
+        data = instr[1].data
+        time = data['TIME']
+        rng = np.random.RandomState(1)
+        phase = ((time - time[0]) / 0.245) % 1.0
+        centr1 = 1013. + 0.5 * phase + 0.01 * rng.randn(len(time))
+        centr2 = (900. + 0.3 * phase + 0.2 * phase ** 2
+                  + 0.01 * rng.randn(len(time)))
+        flux = 1e4 * (1. - 0.01 * (phase - 0.5) ** 2) + rng.randn(len(time))
+        for col in ['MOM_CENTR1', 'PSF_CENTR1']:
+            data[col] = centr1
+        for col in ['MOM_CENTR2', 'PSF_CENTR2']:
+            data[col] = centr2
+        data['SAP_FLUX'] = flux
+        data['PDCSAP_FLUX'] = flux
+        instr.writeto(filename, overwrite=True)
+
+
+def test_kepsff(tmpdir):
+    roll = str(tmpdir.join("roll.fits"))
+    serial = str(tmpdir.join("kepsff.fits"))
+    parallel = str(tmpdir.join("kepsff-parallel.fits"))
+    logfile = str(tmpdir.join("kepsff.log"))
+    make_roll_lc(roll)
+    kepsff(roll, outfile=serial, datacol="SAP_FLUX", stepsize=4.,
+           overwrite=True, logfile=logfile)
+    kepsff(roll, outfile=parallel, datacol="SAP_FLUX", stepsize=4.,
+           nprocs=2, overwrite=True, logfile=logfile)
+    f = pyfits.getdata(serial, 1)
+    g = pyfits.getdata(parallel, 1)
+    h = pyfits.getdata(roll, 1)
+    assert_array_almost_equal(f['SAP_FLUX'], g['SAP_FLUX'])
+    assert_array_equal(f['SAP_QUALITY'], g['SAP_QUALITY'])
+    # the roll-induced variability is removed
+    rms_in = np.nanstd(h['SAP_FLUX']) / np.nanmedian(h['SAP_FLUX'])
+    rms_out = np.nanstd(f['SAP_FLUX']) / np.nanmedian(f['SAP_FLUX'])
+    assert rms_out < 0.25 * rms_in
@@ -1,4 +1,4 @@
-import pytest
+import numpy as np
 from astropy.io import fits as pyfits
 from astropy.utils.data import get_pkg_data_filename
 from ..kepstitch import kepstitch
@@ -19,3 +19,47 @@ def test_kepbls():
     f.close()
     g.close()
     delete("kepstitch.fits", "log_kepstitch.txt", False)
+
+def test_kepstitch_nthreads(tmpdir):
+    """Reading the headers with several threads gives the same table."""
+    serial = str(tmpdir.join("serial.fits"))
+    threaded = str(tmpdir.join("threaded.fits"))
+    lcs = [fake_lc, fake_lc, fake_lc]
+    kepstitch(lcs, outfile=serial, logfile=str(tmpdir.join("log")))
+    kepstitch(lcs, outfile=threaded, logfile=str(tmpdir.join("log")),
+              nthreads=2)
+    f = pyfits.open(serial)
+    g = pyfits.open(threaded)
+    assert len(g[1].data) == 3 * len(pyfits.getdata(fake_lc, 1))
+    for name in f[1].columns.names:
+        np.testing.assert_array_equal(f[1].data[name], g[1].data[name])
+    f.close()
+    g.close()
+
+def test_kepstitch_mismatched_columns(tmpdir):
+    """Columns which are missing from a file or do not fit in the table
+    are left empty, with a warning."""
+    odd_lc = str(tmpdir.join("odd.fits"))
+    with pyfits.open(fake_lc) as hdus:
+        cols = [col for col in hdus[1].columns
+                if col.name not in ['SAP_BKG', 'SAP_FLUX']]
+        nrows = len(hdus[1].data)
+        cols.append(pyfits.Column(name='SAP_FLUX', format='2E',
+                                  array=np.ones((nrows, 2))))
+        table = pyfits.BinTableHDU.from_columns(cols, header=hdus[1].header)
+        pyfits.HDUList([hdus[0], table]).writeto(odd_lc)
+    outfile = str(tmpdir.join("kepstitch.fits"))
+    logfile = str(tmpdir.join("log"))
+    kepstitch([fake_lc, odd_lc], outfile=outfile, logfile=logfile)
+    with open(logfile) as log:
+        log = log.read()
+    assert 'column SAP_BKG missing' in log
+    assert 'column SAP_FLUX missing' in log
+    f = pyfits.open(outfile)
+    g = pyfits.open(fake_lc)
+    nrows = len(g[1].data)
+    assert len(f[1].data) == 2 * nrows
+    np.testing.assert_array_equal(f[1].data['PDCSAP_FLUX'][nrows:],
+                                  g[1].data['PDCSAP_FLUX'])
+    f.close()
+    g.close()
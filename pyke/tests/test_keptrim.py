@@ -14,3 +14,18 @@ def test_keptrim():
     assert f[1].data['FLUX'].shape == (len(f[1].data['FLUX']), 1, 1)
     f.close()
     delete("tpf.fits", "log_keptrim.txt", False)
+
+
+def test_keptrim_kepid(tmpdir):
+    catalog = str(tmpdir.join('kic.csv'))
+    with open(catalog, 'w') as f:
+        f.write('kepid,channel,column,row\n200071160,1,1013,918\n')
+    outfile = str(tmpdir.join('tpf.fits'))
+    keptrim(tpf_one_center, 0, 0, 3, outfile=outfile, kepid=200071160,
+            catalog=catalog, overwrite=True,
+            logfile=str(tmpdir.join('keptrim.log')))
+    f = pyfits.open(outfile, checksum=True)
+    assert f[1].data['FLUX'].shape == (len(f[1].data['FLUX']), 3, 3)
+    assert (f[1].data['FLUX'][:, 1, 1] == 1).all()
+    assert f[1].data['FLUX'].sum() == len(f[1].data['FLUX'])
+    f.close()
@@ -1,7 +1,11 @@
 import pytest
 import numpy as np
 from numpy.testing import assert_almost_equal
-from ..lightcurve import LightCurve, KeplerCBVCorrector, KeplerLightCurveFile
+from ..lightcurve import (LightCurve, LightCurveCollection,
+                          KeplerCBVCorrector, KeplerLightCurveFile,
+                          KeplerLightCurve, ArcLengthDetrender,
+                          SimplePixelLevelDecorrelationDetrender,
+                          _segmented_median, _segmented_sigma_clip)
 
 # 8th Quarter of Tabby's star
 TABBY_Q8 = ("https://archive.stsci.edu/missions/kepler/lightcurves"
@@ -67,3 +71,159 @@ def test_lightcurve_plot():
     lcf = KeplerLightCurveFile(TABBY_Q8)
     lcf.plot()
     lcf.SAP_FLUX.plot()
+
+
+def test_arclength_detrender():
+    """Checks that SFF removes a flux modulation which follows a K2-like
+    roll pattern of the centroids"""
+    np.random.seed(42)
+    time = np.arange(0, 40, 0.0204)
+    phase = (time / 0.245) % 1.
+    col = 0.5 * phase + 0.003 * np.random.randn(len(time))
+    row = 0.3 * phase + 0.2 * phase ** 2 + 0.003 * np.random.randn(len(time))
+    trend = 1. + 0.01 * np.sin(time / 10.)
+    flux = trend * (1. - 0.01 * (phase - 0.5) ** 2)
+    flux *= 1. + 1e-4 * np.random.randn(len(time))
+    flux[10] = np.nan
+    lc = KeplerLightCurve(time, flux, flux_err=1e-4 * np.ones(len(time)),
+                          centroid_col=col, centroid_row=row, campaign=5)
+    corrected_lc = ArcLengthDetrender(lc).detrend(windows=5)
+    assert corrected_lc.campaign == 5
+    assert np.isnan(corrected_lc.flux[10])
+    assert np.nanstd(corrected_lc.flux) < 2e-4
+    restored_lc = ArcLengthDetrender(lc).detrend(windows=5, restore_trend=True)
+    assert np.nanstd(restored_lc.flux / trend) < 2e-4 * np.nanmedian(restored_lc.flux)
+    with pytest.raises(ValueError):
+        ArcLengthDetrender(KeplerLightCurve(time, flux))
+
+
+def test_pld_detrender():
+    """Checks that PLD removes the flux variations due to the motion of a
+    star across a synthetic aperture"""
+    np.random.seed(42)
+    time = np.arange(2000) * 0.02
+    shift = 0.3 * np.sin(25 * time)
+    y, x = np.mgrid[:7, :7]
+    tpf_flux = 1e4 * np.exp(-((x[None] - 3 - shift[:, None, None]) ** 2
+                              + (y[None] - 3) ** 2) / 3.)
+    tpf_flux += np.random.randn(*tpf_flux.shape)
+    raw_std = np.std(np.sum(tpf_flux, axis=(1, 2)))
+    pld = SimplePixelLevelDecorrelationDetrender(time, tpf_flux)
+    lc = pld.detrend(window_length=500)
+    assert len(lc.flux) == len(time)
+    assert np.std(lc.flux) < 0.25 * raw_std
+    lc2 = pld.detrend(window_length=500, pld_order=2, n_pca_terms=5)
+    assert np.std(lc2.flux) < np.std(lc.flux)
+    lc2_parallel = pld.detrend(window_length=500, pld_order=2, n_pca_terms=5,
+                               nprocs=2)
+    assert_almost_equal(lc2.flux, lc2_parallel.flux)
+
+
+def test_lightcurve_collection():
+    """Checks that the batched operations of a LightCurveCollection agree
+    with the operations on the individual light curves"""
+    np.random.seed(42)
+    lcs = []
+    for n in [300, 500, 400]:
+        time = np.arange(n) * 0.02
+        flux = 1. + 0.01 * np.sin(time) + 1e-3 * np.random.randn(n)
+        flux[np.random.rand(n) < 0.05] = np.nan
+        flux[np.random.rand(n) < 0.02] += 0.05
+        lcs.append(LightCurve(time, flux, flux_err=1e-3 * np.ones(n)))
+    lcc = LightCurveCollection.from_lightcurves(lcs)
+    assert len(lcc) == 3
+    assert_almost_equal(lcc.lengths, [300, 500, 400])
+    for batch, single in [(lcc.remove_nans(), [lc.remove_nans() for lc in lcs]),
+                          (lcc.remove_outliers(sigma=3.),
+                           [lc.remove_outliers(sigma=3.) for lc in lcs]),
+                          (lcc.flatten(window_length=51)[0],
+                           [lc.flatten(window_length=51)[0] for lc in lcs]),
+                          (lcc.fold(period=1.337, phase=0.2),
+                           [lc.fold(period=1.337, phase=0.2) for lc in lcs])]:
+        for lc_batch, lc in zip(batch, single):
+            assert_almost_equal(lc_batch.time, lc.time)
+            assert_almost_equal(lc_batch.flux, lc.flux)
+            assert_almost_equal(lc_batch.flux_err, lc.flux_err)
+    cdpp = lcc.cdpp(savgol_window=51)
+    assert_almost_equal(cdpp, [lc.cdpp(savgol_window=51) for lc in lcs])
+    # members shorter than the window are filtered with a shorter one
+    for lc_batch, lc in zip(lcc.flatten(window_length=451)[0], lcs):
+        assert_almost_equal(lc_batch.flux, lc.flatten(window_length=451)[0].flux)
+
+
+def test_segmented_statistics():
+    """Segment medians and sigma-clipping agree with numpy and astropy,
+    including for empty and all-NaN segments."""
+    from astropy.stats import sigma_clip
+    rng = np.random.RandomState(3)
+    offsets = np.array([0, 5000, 5000, 5003, 5010, 5017])
+    values = rng.randn(offsets[-1]) * 1e3 + 1e6
+    values[rng.rand(len(values)) < 0.05] += 1e4
+    values[rng.rand(len(values)) < 0.05] = np.nan
+    values[5003:5010] = np.nan
+    median = _segmented_median(values, offsets)
+    mask = _segmented_sigma_clip(values, offsets, sigma=3.)
+    for i, (start, stop) in enumerate(zip(offsets[:-1], offsets[1:])):
+        segment = values[start:stop]
+        if np.isnan(segment).all():
+            assert np.isnan(median[i])
+            assert not mask[start:stop].any()
+            continue
+        assert_almost_equal(median[i], np.nanmedian(segment))
+        with np.errstate(invalid='ignore'):
+            expected = ~sigma_clip(segment, sigma=3.).mask
+        assert (mask[start:stop] == expected).all()
+
+
+def test_stitch():
+    lc1 = KeplerLightCurve(time=np.arange(3), flux=2. * np.ones(3),
+                           flux_err=np.ones(3), cadenceno=np.arange(3),
+                           quality=np.zeros(3, dtype=int), quarter=1,
+                           channel=4, keplerid=10)
+    lc2 = KeplerLightCurve(time=np.arange(3, 7), flux=4. * np.ones(4),
+                           flux_err=np.ones(4), cadenceno=np.arange(3, 7),
+                           quality=np.ones(4, dtype=int), quarter=2,
+                           channel=4, keplerid=10)
+    lc = lc1.stitch(lc2)
+    assert isinstance(lc, KeplerLightCurve)
+    assert_almost_equal(lc.time, np.arange(7))
+    assert_almost_equal(lc.cadenceno, np.arange(7))
+    assert_almost_equal(lc.quality, [0, 0, 0, 1, 1, 1, 1])
+    assert_almost_equal(lc.segments, [0, 3, 7])
+    assert lc.centroid_col is None
+    assert lc.channel == 4 and lc.keplerid == 10
+    assert lc.quarter is None
+    lc = lc1.stitch(lc2, lc1, normalize=True)
+    assert_almost_equal(lc.flux, np.ones(10))
+    assert_almost_equal(lc.flux_err, [.5] * 3 + [.25] * 4 + [.5] * 3)
+    assert_almost_equal(lc.segments, [0, 3, 7, 10])
+    # flux_err is missing from one light curve
+    lc = LightCurve(time=np.arange(3), flux=np.ones(3)).stitch(lc1)
+    assert lc.flux_err is None
+    assert lc.flux.dtype == float
+
+
+def test_flatten_gaps():
+    """Checks that the trend is not smeared across gaps and stitched
+    boundaries, and that the trend matches the cleaned time"""
+    np.random.seed(42)
+    time1, time2 = np.arange(0, 30, 0.02), np.arange(40, 70, 0.02)
+    q1 = KeplerLightCurve(time1, 1000 + 0.1 * np.random.randn(len(time1)),
+                          quality=np.zeros(len(time1)), quarter=1)
+    q2 = KeplerLightCurve(time2, 1200 + 0.1 * np.random.randn(len(time2)),
+                          quality=np.zeros(len(time2)), quarter=2)
+    lc = q1.stitch(q2)
+    lc.flux[100] = np.nan
+    flat_lc, trend_lc = lc.flatten()
+    assert len(trend_lc.time) == len(trend_lc.flux) == len(lc.time) - 1
+    assert len(flat_lc.quality) == len(flat_lc.time)
+    assert_almost_equal(flat_lc.segments, [0, 1499, 2999])
+    assert np.max(np.abs(flat_lc.flux - 1)) < 2e-3
+    # without splitting, the jump between the quarters leaks into the trend
+    lc.segments = None
+    assert np.max(np.abs(lc.flatten(break_tolerance=None)[0].flux - 1)) > 0.05
+    # iterating reduces the bias of the trend due to an outlier
+    lc.flux[500] += 50
+    trend = lc.flatten()[1].flux[499]
+    trend_iter = lc.flatten(niters=3)[1].flux[499]
+    assert np.abs(trend_iter - 1000) < np.abs(trend - 1000)
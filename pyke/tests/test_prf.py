@@ -6,7 +6,8 @@ from scipy.stats import mode
 from astropy.io import fits
 from astropy.utils.data import get_pkg_data_filename
 from oktopus import PoissonPosterior, UniformPrior, GaussianPrior, JointPrior
-from ..prf import SimpleKeplerPRF, KeplerPRF, SceneModel, PRFPhotometry, get_initial_guesses
+from ..prf import (SimpleKeplerPRF, KeplerPRF, SceneModel, SparseSceneModel,
+                   PRFPhotometry, get_initial_guesses)
 
 
 def test_prf_normalization():
@@ -97,3 +98,31 @@ def test_scene_model():
     assert scene.n_models == 1
     assert scene.bkg_order == 1
     assert (scene.n_params == [0, 3]).all()
+
+
+def test_sparse_scene_model():
+    """Is the sparse scene model consistent with the dense one?"""
+    prfs = [SimpleKeplerPRF(channel=16, shape=[30, 40], column=15, row=15)
+            for i in range(3)]
+    params = [1e3, 25, 22, 5e2, 40, 35, 2e3, 17, 43, 10]
+    scene = SceneModel(prfs=prfs)
+    sparse_scene = SparseSceneModel(prfs=prfs)
+    assert (sparse_scene.n_params == [0, 3, 6, 9]).all()
+    assert_allclose(sparse_scene(*params), scene(*params), atol=1e-6)
+
+    jac = sparse_scene.jacobian(*params)
+    assert jac.shape == (30 * 40, 10)
+    assert jac.nnz < 30 * 40 * 10
+    assert_allclose(jac[:, -1].toarray().ravel(), 1)
+    assert_allclose(jac[:, 0].toarray().reshape(30, 40),
+                    prfs[0].gradient(*params[:3])[0], atol=1e-6)
+
+
+def test_sparse_scene_model_scaled_prf():
+    """Does the default footprint cover PRFs stretched by scale < 1?"""
+    prfs = [KeplerPRF(channel=16, shape=[40, 40], column=15, row=15)
+            for i in range(2)]
+    params = [1e3, 30, 32, .5, .6, 0., 2e3, 40, 38, .7, .5, .3, 10]
+    scene = SceneModel(prfs=prfs)
+    sparse_scene = SparseSceneModel(prfs=prfs)
+    assert_allclose(sparse_scene(*params), scene(*params), atol=1e-6)
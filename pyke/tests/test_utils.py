@@ -3,7 +3,7 @@ from numpy.testing import assert_almost_equal
 
 from ..utils import PyKEArgumentHelpFormatter
 from ..utils import module_output_to_channel, channel_to_module_output
-from ..utils import running_mean
+from ..utils import running_mean, pool_imap
 
 
 def test_PyKEArgumentHelpFormatter():
@@ -43,3 +43,15 @@ def test_running_mean():
     assert_almost_equal(running_mean([1, 2, 3], window_size=1), [1, 2, 3])
     assert_almost_equal(running_mean([1, 2, 3], window_size=2), [1.5, 2.5])
     assert_almost_equal(running_mean([2, 2, 2], window_size=3), [2])
+
+
+def test_pool_imap():
+    tasks = range(-10, 10)
+    expected = [abs(t) for t in tasks]
+    assert list(pool_imap(abs, tasks)) == expected
+    assert list(pool_imap(abs, tasks, nprocs=2)) == expected
+    # the initializer is also called when running serially
+    calls = []
+    assert list(pool_imap(abs, [-1], initializer=calls.append,
+                          initargs=('init',))) == [1]
+    assert calls == ['init']
@@ -1,3 +1,4 @@
+import multiprocessing
 import numpy as np
 import matplotlib.pyplot as plt
 from argparse import HelpFormatter, SUPPRESS, OPTIONAL, ZERO_OR_MORE
@@ -198,3 +199,39 @@ def running_mean(data, window_size):
     """
     cumsum = np.cumsum(np.insert(data, 0, 0))
     return (cumsum[window_size:] - cumsum[:-window_size]) / float(window_size)
+
+
+def pool_imap(func, tasks, nprocs=1, initializer=None, initargs=()):
+    """Yields ``func(task)`` for each task, in order.
+
+    Parameters
+    ----------
+    func : callable
+        Module-level function applied to each task.
+    tasks : iterable
+        Arguments of the successive calls to ``func``.
+    nprocs : int or None
+        Number of worker processes. If ``1``, the tasks are run serially in
+        the current process. If ``None``, one worker per available CPU is
+        used.
+    initializer : callable or None
+        If given, ``initializer(*initargs)`` is called once by every process
+        which runs tasks, before its first task.
+    initargs : tuple
+        Arguments of ``initializer``.
+    """
+    if nprocs == 1:
+        if initializer is not None:
+            initializer(*initargs)
+        for task in tasks:
+            yield func(task)
+        return
+    pool = multiprocessing.Pool(processes=nprocs, initializer=initializer,
+                                initargs=initargs)
+    try:
+        for result in pool.imap(func, tasks):
+            yield result
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
@@ -26,6 +26,7 @@ entry_points = {'console_scripts': [
         'kepdynamic = pyke.kepdynamic:kepdynamic_main',
         'kepextract = pyke.kepextract:kepextract_main',
         'kepffi = pyke.kepffi:kepffi_main',
+        'kepffistamps = pyke.kepffistamps:kepffistamps_main',
         'kepfilter = pyke.kepfilter:kepfilter_main',
         'kepflatten = pyke.kepflatten:kepflatten_main',
         'kepfold = pyke.kepfold:kepfold_main',